@@ -0,0 +1,183 @@
+"""
+Drives single_question, chat_context_function_bank, chat_context_function_bank_stream and
+single_turn_pseudofunction against the local mock server at increasing concurrency, and reports
+p50/p99 latency, requests per second, errors and the memory held per conversation.
+
+Save a run with --json and compare a later run against it with --baseline to catch regressions.
+
+With --keys, requests are spread over several API keys through an endpoint pool; the mock server enforces
+--rpm and --tpm per key, so throughput under a rate limit should scale with the number of keys.
+
+Run with: python benchmarks/bench_concurrency.py [--latency 0.05] [--concurrency 1 2 4 8 16 32] [--rpm 3500] [--keys 4]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import openaiunlimitedfun as wrapper
+from mock_server import MockOpenAIServer
+
+PSEUDOFUNCTION = {
+    "name": "extract_city",
+    "description": "Extracts the city mentioned in the text.",
+    "parameters": {
+        "type": "object",
+        "properties": {"city": {"type": "string"}, "confidence": {"type": "number"}},
+        "required": ["city", "confidence"],
+    },
+}
+
+
+def get_weather(city: str, unit: str = "celsius"):
+    """
+    Returns the current weather of a city.
+
+    Args:
+        city (str): The city name.
+        unit (str, optional): celsius or fahrenheit.
+    """
+    return {"city": city, "temperature": 21, "unit": unit}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def build_scenarios(registry):
+    """
+    Returns the benchmarked calls by name. Each takes a prompt and returns True if the call succeeded.
+    """
+    def stream(prompt):
+        events = list(wrapper.chat_context_function_bank_stream(prompt, [], registry=registry))
+        return events[-1]["content"] is not None
+
+    return {
+        "single_question": lambda prompt: isinstance(wrapper.single_question(prompt), str),
+        "chat_context_function_bank": lambda prompt: wrapper.chat_context_function_bank(prompt, [], registry=registry)[0] is not None,
+        "chat_context_function_bank_stream": stream,
+        "single_turn_pseudofunction": lambda prompt: wrapper.single_turn_pseudofunction(prompt, PSEUDOFUNCTION) is not None,
+    }
+
+
+def timed(call, prompt):
+    start = time.perf_counter()
+    ok = call(prompt)
+    return time.perf_counter() - start, ok
+
+
+def run_level(call, concurrency, requests):
+    """
+    Runs `requests` calls with `concurrency` in flight. Returns the latency percentiles, throughput and errors.
+    """
+    prompts = [f"What is the weather in city number {index}?" for index in range(requests)]
+    start = time.perf_counter()
+    # The public functions print and swallow their errors, keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda prompt: timed(call, prompt), prompts))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for latency, ok in results]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "requests_per_second": requests / elapsed,
+        "errors": sum(1 for latency, ok in results if not ok),
+    }
+
+
+def memory_per_conversation(registry, conversations):
+    """
+    Returns the bytes retained per chat_context_function_bank conversation whose context is kept alive.
+    """
+    wrapper.chat_context_function_bank("warm up", [], registry=registry)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    contexts = [wrapper.chat_context_function_bank(f"What is the weather in city number {index}?", [], registry=registry)[1] for index in range(conversations)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del contexts
+    return retained / conversations
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints every scenario and concurrency that got slower than the baseline by more than `tolerance`. Returns True if any did.
+    """
+    previous = {(row["scenario"], row["concurrency"]): row for row in baseline["levels"]}
+    regressed = False
+    for row in results["levels"]:
+        old = previous.get((row["scenario"], row["concurrency"]))
+        if old is None:
+            continue
+        if row["requests_per_second"] < old["requests_per_second"] * (1 - tolerance) or row["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+            regressed = True
+            print(f"REGRESSION {row['scenario']} c={row['concurrency']}: "
+                  f"{old['requests_per_second']:.1f} -> {row['requests_per_second']:.1f} req/s, p99 {old['p99_ms']:.1f} -> {row['p99_ms']:.1f}ms")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.05, help="mock server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--rpm", type=int, default=None, help="mock requests per minute before 429 responses")
+    parser.add_argument("--tpm", type=int, default=None, help="mock tokens per minute before 429 responses")
+    parser.add_argument("--keys", type=int, default=1, help="API keys spread over with an endpoint pool")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=20, help="requests per concurrency slot at each level")
+    parser.add_argument("--scenarios", nargs="+", default=None)
+    parser.add_argument("--conversations", type=int, default=200, help="conversations kept alive for the memory measurement")
+    parser.add_argument("--json", dest="json_path", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results written earlier with --json")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.latency, args.jitter, requests_per_minute=args.rpm, tokens_per_minute=args.tpm).start()
+    wrapper.configure_client(base_url=server.base_url, api_key="sk-mock", pool_maxsize=max(args.concurrency))
+    if args.keys > 1:
+        wrapper.set_endpoint_pool(wrapper.EndpointPool([f"sk-mock-{index}" for index in range(args.keys)]))
+    directory = tempfile.mkdtemp()
+    registry = wrapper.FunctionRegistry(os.path.join(directory, "functions.sqlite3"), autoload=False)
+    registry.register(get_weather, wrapper.build_function_schema(get_weather))
+    scenarios = build_scenarios(registry)
+
+    results = {"latency": args.latency, "keys": args.keys, "levels": []}
+    print(f"{'scenario':<36}{'conc':>6}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}")
+    for name, call in scenarios.items():
+        if args.scenarios and name not in args.scenarios:
+            continue
+        for concurrency in args.concurrency:
+            row = dict(run_level(call, concurrency, max(args.requests * concurrency, 20)), scenario=name)
+            results["levels"].append(row)
+            print(f"{name:<36}{concurrency:>6}{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['requests_per_second']:>10.1f}{row['errors']:>8}")
+
+    results["bytes_per_conversation"] = memory_per_conversation(registry, args.conversations)
+    print(f"memory per conversation: {results['bytes_per_conversation'] / 1024:.1f} KiB ({args.conversations} contexts kept alive)")
+    print(f"mock server: {server.state.requests} requests, {server.state.rate_limited} rate limited, {len(server.state.requests_per_key)} keys")
+
+    wrapper.close_client()
+    server.stop()
+    if args.json_path:
+        with open(args.json_path, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            if compare(results, json.load(file), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares bare requests.post calls against the pooled client against a local stub server.
+
+The stub speaks HTTP/1.1 keep-alive and counts how many TCP connections it accepted,
+so the output shows both connection reuse and the per-call latency saved.
+
+Run with: python benchmarks/bench_connection_pool.py [number_of_calls]
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from openaiunlimitedfun import client
+
+RESPONSE = json.dumps({"choices": [{"message": {"role": "assistant", "content": "ok"}}]}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = 0
+    counter_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubHandler.counter_lock:
+            StubHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(label, post, calls):
+    StubHandler.connections = 0
+    start = time.perf_counter()
+    for _ in range(calls):
+        post().json()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} calls={calls} connections={StubHandler.connections} per_call={elapsed / calls * 1000:.3f}ms")
+    return elapsed / calls
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    body = {"model": "gpt-3.5-turbo-0613", "messages": [{"role": "user", "content": "hi"}]}
+
+    client.configure_client(base_url=base_url, api_key="sk-bench")
+    bare = run("bare requests", lambda: requests.post(base_url + "/chat/completions", headers=client.get_headers(), json=body), calls)
+    pooled = run("pooled client", lambda: client.post_chat_completion(body), calls)
+    print(f"saved per call: {(bare - pooled) * 1000:.3f}ms")
+
+    client.close_client()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures the cold import time of the package with `python -X importtime` and fails if it exceeds a budget.
+
+It also checks that importing the package loads none of the heavy dependencies, which keeps the import
+free of network and filesystem side effects.
+
+Run with: python benchmarks/bench_import_time.py [budget_ms]
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["requests", "openai", "httpx", "tenacity", "dotenv", "tiktoken"]
+RUNS = 5
+
+
+def cumulative_import_ms(statement, module):
+    """
+    Returns the fastest cumulative import time of `module` over several fresh interpreters, in milliseconds.
+    """
+    timings = []
+    for _ in range(RUNS):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT, capture_output=True, text=True, check=True)
+        for line in result.stderr.splitlines():
+            fields = [field.strip() for field in line.split("|")]
+            if len(fields) == 3 and fields[2] == module:
+                timings.append(int(fields[1]) / 1000)
+    return min(timings)
+
+
+def first_access_ms(statement):
+    """
+    Returns the fastest wall-clock time of `statement` in a fresh interpreter, in milliseconds.
+    Lazily imported submodules go through importlib, which -X importtime does not report.
+    """
+    timer = f"import time; start = time.perf_counter(); {statement}; print((time.perf_counter() - start) * 1000)"
+    timings = []
+    for _ in range(RUNS):
+        result = subprocess.run([sys.executable, "-c", timer], cwd=ROOT, capture_output=True, text=True, check=True)
+        timings.append(float(result.stdout))
+    return min(timings)
+
+
+def loaded_heavy_modules():
+    statement = f"import sys, openaiunlimitedfun; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", statement], cwd=ROOT, capture_output=True, text=True, check=True)
+    return [module for module in result.stdout.strip().split(",") if module]
+
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 20.0
+    package_ms = cumulative_import_ms("import openaiunlimitedfun", "openaiunlimitedfun")
+    utils_ms = first_access_ms("from openaiunlimitedfun import single_question")
+    heavy = loaded_heavy_modules()
+
+    print(f"import openaiunlimitedfun:                       {package_ms:.2f}ms (budget {budget_ms:.0f}ms)")
+    print(f"from openaiunlimitedfun import single_question: {utils_ms:.2f}ms")
+    print(f"heavy modules loaded by the import:             {', '.join(heavy) or 'none'}")
+
+    if package_ms > budget_ms or heavy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+"""
+A local mock of the chat completions endpoint for offline benchmarks.
+
+It simulates response latency, per-minute request and token limits per API key (429 responses with retry-after
+and x-ratelimit-* headers), server-sent event streaming, function and tool calls whose arguments are built from the request's schemas, and the
+file and batch endpoints of the Batch API, so every code path of the wrapper can be exercised without the live API.
+Requests for the model "invalid" are answered with a 400 error.
+
+Run standalone with: python benchmarks/mock_server.py [--port 8000] [--latency 0.2] [--rpm 3500]
+and point the wrapper at it with configure_client(base_url="http://127.0.0.1:8000/v1", api_key="sk-mock").
+"""
+import argparse
+import email
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MinuteBucket:
+    """
+    A bucket refilling continuously to `capacity` over one minute, the way the API enforces its limits.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        # now may predate the creation of the bucket, which must not drain it
+        if now <= self.updated:
+            return
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def take(self, amount, now):
+        """
+        Takes `amount` from the bucket. Returns 0 on success, or the seconds until it would succeed.
+        """
+        self._refill(now)
+        if self.level >= amount:
+            self.level -= amount
+            return 0.0
+        return (amount - self.level) * 60 / self.capacity
+
+    def headers(self, kind):
+        return {
+            f"x-ratelimit-limit-{kind}": str(int(self.capacity)),
+            f"x-ratelimit-remaining-{kind}": str(max(0, int(self.level))),
+            f"x-ratelimit-reset-{kind}": f"{(self.capacity - self.level) * 60 / self.capacity:.3f}s",
+        }
+
+
+def _example_value(schema):
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "default" in schema:
+        return schema["default"]
+    return {
+        "string": "mock",
+        "integer": 1,
+        "number": 1.0,
+        "boolean": True,
+        "array": [],
+        "object": {},
+    }.get(schema.get("type"), "mock")
+
+
+def example_arguments(function_schema):
+    """
+    Returns arguments satisfying the required parameters of a function schema.
+    """
+    parameters = function_schema.get("parameters") or {}
+    properties = parameters.get("properties") or {}
+    return {name: _example_value(properties.get(name, {})) for name in parameters.get("required", list(properties))}
+
+
+class MockServerState:
+    """
+    The configuration and counters shared by every request handler of one server.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, chunk_delay=0.0, requests_per_minute=None, tokens_per_minute=None, batch_delay=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_delay = chunk_delay
+        self.lock = threading.Lock()
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.buckets = {}
+        self.requests = 0
+        self.connections = 0
+        self.rate_limited = 0
+        self.requests_per_key = {}
+        self.batch_delay = batch_delay
+        self.files = {}
+        self.file_times = {}
+        self.batches = {}
+        self.ids = itertools.count(1)
+
+    def admit(self, api_key, tokens):
+        """
+        Applies the rate limits of an API key to one request. Returns the rate limit headers and the retry-after, 0 if admitted.
+        """
+        now = time.monotonic()
+        headers = {}
+        retry_after = 0.0
+        with self.lock:
+            self.requests += 1
+            self.requests_per_key[api_key] = self.requests_per_key.get(api_key, 0) + 1
+            if api_key not in self.buckets:
+                self.buckets[api_key] = (
+                    MinuteBucket(self.requests_per_minute) if self.requests_per_minute else None,
+                    MinuteBucket(self.tokens_per_minute) if self.tokens_per_minute else None,
+                )
+            request_bucket, token_bucket = self.buckets[api_key]
+            for bucket, kind, amount in ((request_bucket, "requests", 1), (token_bucket, "tokens", tokens)):
+                if bucket is None:
+                    continue
+                retry_after = max(retry_after, bucket.take(amount, now))
+                headers.update(bucket.headers(kind))
+            if retry_after:
+                self.rate_limited += 1
+        return headers, retry_after
+
+    def delay(self):
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def add_file(self, content):
+        with self.lock:
+            file_id = f"file-mock{next(self.ids)}"
+            self.files[file_id] = content
+            self.file_times[file_id] = time.time()
+        return file_id
+
+    def create_batch(self, body):
+        with self.lock:
+            batch = {
+                "id": f"batch_mock{next(self.ids)}",
+                "object": "batch",
+                "endpoint": body.get("endpoint"),
+                "input_file_id": body.get("input_file_id"),
+                "completion_window": body.get("completion_window"),
+                "status": "validating" if body.get("input_file_id") in self.files else "failed",
+                "created_at": time.time(),
+                "output_file_id": None,
+                "error_file_id": None,
+                "errors": None if body.get("input_file_id") in self.files else {"data": [{"message": "input file not found"}]},
+            }
+            self.batches[batch["id"]] = batch
+        return batch
+
+    def get_batch(self, batch_id):
+        """
+        Returns a batch, running its requests once batch_delay seconds have passed since it was created.
+        Requests for the model "invalid" end up in the error file.
+        """
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is None or batch["status"] not in ("validating", "in_progress"):
+                return batch
+            if time.time() - batch["created_at"] < self.batch_delay:
+                batch["status"] = "in_progress"
+                return batch
+            output, errors = [], []
+            for line in self.files[batch["input_file_id"]].decode().splitlines():
+                request = json.loads(line)
+                body = request["body"]
+                if body.get("model") == "invalid":
+                    errors.append({"id": f"batch_req_{request['custom_id']}", "custom_id": request["custom_id"], "response": {"status_code": 400, "body": {"error": {"message": "invalid model"}}}, "error": None})
+                    continue
+                message = build_message(body)
+                response = {"id": "chatcmpl-mock", "object": "chat.completion", "model": body.get("model"), "choices": [{"index": 0, "message": message, "finish_reason": "stop"}]}
+                output.append({"id": f"batch_req_{request['custom_id']}", "custom_id": request["custom_id"], "response": {"status_code": 200, "body": response}, "error": None})
+            for kind, records in (("output_file_id", output), ("error_file_id", errors)):
+                if records:
+                    file_id = f"file-mock{next(self.ids)}"
+                    self.files[file_id] = "".join(json.dumps(record) + "\n" for record in records).encode()
+                    batch[kind] = file_id
+            batch["status"] = "completed"
+            return batch
+
+
+def build_message(body):
+    """
+    Returns the assistant message the mock answers a request body with.
+    Forced or automatic function calls and tool calls are always taken, so every request with functions
+    produces a call and the follow-up request (sent without functions) produces the final answer.
+    """
+    messages = body.get("messages") or [{}]
+    last = messages[-1]
+    functions = body.get("functions")
+    if functions and body.get("function_call") != "none":
+        forced = body.get("function_call")
+        name = forced["name"] if isinstance(forced, dict) else functions[0]["name"]
+        schema = next((function for function in functions if function["name"] == name), functions[0])
+        return {"role": "assistant", "content": None, "function_call": {"name": name, "arguments": json.dumps(example_arguments(schema))}}
+    tools = body.get("tools")
+    if tools and last.get("role") != "tool" and body.get("tool_choice") != "none":
+        tool_calls = [{"id": f"call_{index}", "type": "function", "function": {"name": tool["function"]["name"], "arguments": json.dumps(example_arguments(tool["function"]))}}
+                      for index, tool in enumerate(tools[:2])]
+        return {"role": "assistant", "content": None, "tool_calls": tool_calls}
+    return {"role": "assistant", "content": "This is a mock reply to: " + str(last.get("content"))[:60]}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state = None
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    def _send_json(self, status, payload, headers):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, payload):
+        data = ("data: " + (payload if isinstance(payload, str) else json.dumps(payload)) + "\n\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+        if self.state.chunk_delay:
+            time.sleep(self.state.chunk_delay)
+
+    def _send_not_found(self):
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}}, {})
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path == "/v1/batches":
+            # Newest first, one page of `limit` batches after the `after` id, like the live API
+            params = urllib.parse.parse_qs(query)
+            limit = int(params.get("limit", ["20"])[0])
+            with self.state.lock:
+                batches = sorted(self.state.batches.values(), key=lambda batch: batch["created_at"], reverse=True)
+            ids = [batch["id"] for batch in batches]
+            after = params.get("after", [None])[0]
+            start = ids.index(after) + 1 if after in ids else 0
+            page = batches[start:start + limit]
+            self._send_json(200, {
+                "object": "list",
+                "data": page,
+                "first_id": page[0]["id"] if page else None,
+                "last_id": page[-1]["id"] if page else None,
+                "has_more": start + limit < len(batches),
+            }, {})
+        elif path.startswith("/v1/batches/"):
+            batch = self.state.get_batch(path.rsplit("/", 1)[1])
+            if batch is None:
+                self._send_not_found()
+            else:
+                self._send_json(200, batch, {})
+        elif path.startswith("/v1/files/") and path.endswith("/content"):
+            content = self.state.files.get(path.split("/")[3])
+            if content is None:
+                self._send_not_found()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self._send_not_found()
+
+    def _handle_batch_api(self, raw_body):
+        if self.path == "/v1/files":
+            message = email.message_from_bytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + raw_body)
+            parts = {part.get_param("name", header="content-disposition"): part for part in message.get_payload()}
+            content = parts["file"].get_payload(decode=True)
+            file_id = self.state.add_file(content)
+            self._send_json(200, {"id": file_id, "object": "file", "bytes": len(content), "created_at": self.state.file_times[file_id], "purpose": "batch"}, {})
+        elif self.path == "/v1/batches":
+            self._send_json(200, self.state.create_batch(json.loads(raw_body)), {})
+        elif self.path.startswith("/v1/batches/") and self.path.endswith("/cancel"):
+            batch = self.state.get_batch(self.path.split("/")[3])
+            if batch is None:
+                self._send_not_found()
+                return
+            with self.state.lock:
+                if batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+                    batch["status"] = "cancelled"
+            self._send_json(200, batch, {})
+        else:
+            self._send_not_found()
+
+    def do_POST(self):
+        raw_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.endswith("/chat/completions"):
+            self._handle_batch_api(raw_body)
+            return
+        body = json.loads(raw_body or b"{}")
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        headers, retry_after = self.state.admit(self.headers.get("Authorization", ""), prompt_tokens)
+        if retry_after:
+            headers["retry-after"] = f"{retry_after:.3f}"
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, headers)
+            return
+        if body.get("model") == "invalid":
+            self._send_json(400, {"error": {"message": "invalid model", "type": "invalid_request_error"}}, headers)
+            return
+
+        self.state.delay()
+        model = body.get("model", "mock")
+        message = build_message(body)
+        completion_tokens = len(json.dumps(message)) // 4
+        finish_reason = "function_call" if "function_call" in message else "tool_calls" if "tool_calls" in message else "stop"
+        if not body.get("stream"):
+            self._send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+            }, headers)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "model": model}
+        if "function_call" in message:
+            arguments = message["function_call"]["arguments"]
+            self._send_event(dict(chunk, choices=[{"index": 0, "delta": {"role": "assistant", "function_call": {"name": message["function_call"]["name"], "arguments": ""}}}]))
+            for start in range(0, len(arguments), 8):
+                self._send_event(dict(chunk, choices=[{"index": 0, "delta": {"function_call": {"arguments": arguments[start:start + 8]}}}]))
+        else:
+            self._send_event(dict(chunk, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}}]))
+            for word in (message.get("content") or "").split(" "):
+                self._send_event(dict(chunk, choices=[{"index": 0, "delta": {"content": word + " "}}]))
+        self._send_event(dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": finish_reason}]))
+        self._send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class MockOpenAIServer:
+    """
+    Runs the mock endpoint on a background thread.
+
+    Args:
+        latency (float, optional): Seconds every response is delayed by. Defaults to 0.
+        jitter (float, optional): Maximum random deviation from the latency, in seconds. Defaults to 0.
+        chunk_delay (float, optional): Seconds between streamed chunks. Defaults to 0.
+        requests_per_minute (int, optional): Requests per minute and API key before 429 responses. Defaults to None, unlimited.
+        tokens_per_minute (int, optional): Prompt tokens per minute and API key before 429 responses. Defaults to None, unlimited.
+        port (int, optional): The port to listen on. Defaults to 0, any free port.
+        batch_delay (float, optional): Seconds a batch stays in progress before it completes. Defaults to 0.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, chunk_delay=0.0, requests_per_minute=None, tokens_per_minute=None, port=0, batch_delay=0.0):
+        self.state = MockServerState(latency, jitter, chunk_delay, requests_per_minute, tokens_per_minute, batch_delay)
+        handler = type("BoundMockHandler", (MockHandler,), {"state": self.state})
+        self.server = _Server(("127.0.0.1", port), handler)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    parser.add_argument("--rpm", type=int, default=None, help="requests per minute before 429 responses")
+    parser.add_argument("--tpm", type=int, default=None, help="tokens per minute before 429 responses")
+    parser.add_argument("--batch-delay", type=float, default=5.0, help="seconds before a batch completes")
+    args = parser.parse_args()
+    server = MockOpenAIServer(args.latency, args.jitter, args.chunk_delay, args.rpm, args.tpm, args.port, args.batch_delay)
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
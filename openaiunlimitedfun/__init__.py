@@ -1 +1,41 @@
-from .utils import manage_available_functions, manage_function_list, chat_context_function_bank, single_question, extract_json_from_string, create_json_autoagent, create_function_json_manual, single_turn_pseudofunction, set_openai_api_key
+import importlib
+
+# Public names and the submodule defining them. Submodules are imported on first access,
+# so importing the package does not load requests, openai or tenacity and has no side effects.
+_exports = {
+    'utils': ['manage_available_functions', 'manage_function_list', 'chat_context_function_bank', 'chat_context_function_bank_stream', 'chat_context_tool_bank', 'single_question', 'extract_json_from_string', 'create_json_autoagent', 'create_function_json_manual', 'single_turn_pseudofunction', 'set_openai_api_key'],
+    'client': ['configure_client', 'close_client', 'aclose_client'],
+    'registry': ['FunctionRegistry', 'get_default_registry'],
+    'store': ['FunctionStore'],
+    'async_utils': ['async_chat_context_function_bank', 'async_chat_context_function_bank_stream', 'async_chat_context_tool_bank', 'async_single_question', 'async_single_turn_pseudofunction'],
+    'batch': ['batch_single_question', 'batch_single_turn_pseudofunction', 'BatchResult'],
+    'batch_jobs': ['BatchJob', 'BatchJobResult', 'BatchJobError', 'batch_job_pseudofunction'],
+    'ratelimit': ['RateLimiter', 'get_rate_limiter', 'set_rate_limiter'],
+    'cache': ['ResponseCache', 'get_response_cache', 'set_response_cache'],
+    'balancer': ['Endpoint', 'EndpointPool', 'get_endpoint_pool', 'set_endpoint_pool'],
+    'coalesce': ['RequestCoalescer', 'get_request_coalescer', 'set_request_coalescer'],
+    'dispatch': ['set_tool_executor_workers'],
+    'executors': ['FunctionExecutor', 'InlineExecutor', 'ThreadExecutor', 'ProcessExecutor'],
+    'memo': ['FunctionMemo', 'memoize'],
+    'conversation': ['Conversation'],
+    'tokens': ['count_schema_tokens'],
+    'selection': ['FunctionSelector', 'BM25Selector', 'EmbeddingSelector'],
+    'schema': ['build_function_schema', 'register_module_functions'],
+    'instrumentation': ['Instrumentation', 'MetricsInstrumentation', 'OpenTelemetryInstrumentation', 'get_instrumentation', 'set_instrumentation'],
+}
+_export_modules = {name: module_name for module_name, names in _exports.items() for name in names}
+
+__all__ = list(_export_modules)
+
+
+def __getattr__(name):
+    module_name = _export_modules.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,207 @@
+
+import json
+import asyncio
+from .client import async_post_chat_completion, async_chat_completion, async_stream_chat_completion, decode_response
+from .streaming import StreamAccumulator
+from .dispatch import async_run_tool_calls
+from .utils import _function_response_message, _question_messages, _function_bank_request, _tool_bank_request, _select_schemas, _retrying
+from .utils import _question_request, _reply_content, _pseudofunction_request, _pseudofunction_arguments
+from .instrumentation import get_instrumentation
+from .executors import async_execute_function
+
+# tenacity detects coroutine functions and retries them with asyncio.sleep, so the backoff never blocks the event loop
+
+
+async def _async_select_schemas(registry, question, function_selector, top_k):
+    """
+    Async version of _select_schemas. The store revision check and the selector run on a worker thread,
+    so a slow SQLite read or embedding call does not block the event loop.
+    """
+    return await asyncio.to_thread(_select_schemas, registry, question, function_selector, top_k)
+
+
+@_retrying
+async def _async_completion_message(json_data):
+    """
+    Async version of _completion_message.
+    """
+    response = await async_post_chat_completion(json_data)
+    response.raise_for_status()
+    return decode_response(response, json_data.get("model", ""))["choices"][0]["message"]
+
+
+async def async_chat_context_function_bank(question, context, model="gpt-3.5-turbo-0613", function_call='auto', registry=None, function_selector=None, top_k=10):
+    """
+    Async version of chat_context_function_bank. Registered functions that are coroutines are awaited natively.
+
+    Parameters:
+    - question (str): The user's question or input to be sent to the GPT model.
+    - context (list, optional): A list of previous messages for context. Defaults to None.
+    - model (str, optional): The GPT model to be used. Defaults to "gpt-3.5-turbo-0613".
+    - function_call (str, optional): The type of function call to execute. Defaults to 'auto'.
+    - registry (FunctionRegistry, optional): The registry holding the function schemas and callables. Defaults to the shared registry backed by the function store.
+    - function_selector (FunctionSelector, optional): Ranks the registered schemas against the question so only the top_k most relevant are sent. Defaults to None, sending all of them.
+    - top_k (int, optional): The number of schemas the function_selector keeps. Defaults to 10.
+
+    Returns:
+    - tuple: The response from the GPT model (or None in case of an error) and the updated context.
+    """
+    messages = _question_messages(question, context)
+
+    registry, functions = await _async_select_schemas(registry, question, function_selector, top_k)
+    json_data = _function_bank_request(messages, model, functions, function_call)
+    try:
+        assistant_message = await _async_completion_message(json_data)
+        if assistant_message['content']:
+            messages.append({"role": "assistant", "content": assistant_message['content']})
+
+        if 'function_call' in assistant_message:
+            tool_call = assistant_message['function_call']
+            function_name = tool_call['name']
+            function_args = json.loads(tool_call['arguments'])
+            messages.append({
+                "role": "assistant",
+                "content": assistant_message.get('content'),
+                "function_call": assistant_message['function_call']
+            })
+
+            function_response = await async_execute_function(registry, function_name, function_args)
+            messages.append(_function_response_message(function_response))
+
+            with get_instrumentation().span("follow_up"):
+                follow_up_message = await _async_completion_message({"model": model, "messages": messages})
+            messages.append({"role": "assistant", "content": follow_up_message['content']})
+            return follow_up_message['content'], messages
+        else:
+            return assistant_message['content'], messages
+
+    except Exception as e:
+        print(f"Error during conversation: {e}")
+        get_instrumentation().record_error("conversation", e)
+        return None, messages
+
+
+async def async_chat_context_tool_bank(question, context, model="gpt-3.5-turbo-1106", tool_choice='auto', registry=None, max_depth=5, tool_timeout=None, function_selector=None, top_k=10):
+    """
+    Async version of chat_context_tool_bank. Tool calls of one response run concurrently on the event loop.
+    """
+    messages = _question_messages(question, context)
+
+    registry, functions = await _async_select_schemas(registry, question, function_selector, top_k)
+    tools = [{"type": "function", "function": schema} for schema in functions]
+    try:
+        for depth in range(max_depth + 1):
+            json_data = _tool_bank_request(messages, model, tools, tool_choice if depth < max_depth else 'none')
+            assistant_message = await _async_completion_message(json_data)
+            tool_calls = assistant_message.get('tool_calls')
+            # Some OpenAI-compatible servers ignore tool_choice='none', the calls of the last round are not run
+            if not tool_calls or depth == max_depth:
+                messages.append({"role": "assistant", "content": assistant_message.get('content')})
+                return assistant_message.get('content'), messages
+
+            messages.append({"role": "assistant", "content": assistant_message.get('content'), "tool_calls": tool_calls})
+            messages.extend(await async_run_tool_calls(tool_calls, registry, timeout=tool_timeout))
+
+    except Exception as e:
+        print(f"Error during conversation: {e}")
+        get_instrumentation().record_error("conversation", e)
+        return None, messages
+
+
+async def async_chat_context_function_bank_stream(question, context, model="gpt-3.5-turbo-0613", function_call='auto', registry=None, function_selector=None, top_k=10):
+    """
+    Async version of chat_context_function_bank_stream, yielding the same events from an async generator.
+    """
+    messages = _question_messages(question, context)
+
+    registry, functions = await _async_select_schemas(registry, question, function_selector, top_k)
+    json_data = _function_bank_request(messages, model, functions, function_call)
+    function_task = None
+    try:
+        accumulator = StreamAccumulator()
+        async for chunk in async_stream_chat_completion(json_data):
+            delta = accumulator.feed(chunk)
+            if delta:
+                yield {"type": "content", "delta": delta}
+            if function_task is None and accumulator.function_call_ready():
+                function_args = json.loads(accumulator.arguments)
+                if accumulator.function_name not in registry:
+                    raise ValueError(f"Function {accumulator.function_name} not defined.")
+                # Start the function right away and let it run while the rest of the stream is drained
+                function_task = asyncio.ensure_future(async_execute_function(registry, accumulator.function_name, function_args))
+
+        if accumulator.content:
+            messages.append({"role": "assistant", "content": accumulator.content})
+        if function_task is None:
+            yield {"type": "done", "content": accumulator.content, "context": messages}
+            return
+
+        function_response = await function_task
+        messages.append({"role": "assistant", "content": accumulator.content, "function_call": accumulator.function_call()})
+        yield {"type": "function_call", "name": accumulator.function_name, "arguments": function_args, "response": function_response}
+        messages.append(_function_response_message(function_response))
+
+        follow_up = StreamAccumulator()
+        async for chunk in async_stream_chat_completion({"model": model, "messages": messages}):
+            delta = follow_up.feed(chunk)
+            if delta:
+                yield {"type": "content", "delta": delta}
+        messages.append({"role": "assistant", "content": follow_up.content})
+        yield {"type": "done", "content": follow_up.content, "context": messages}
+
+    except Exception as e:
+        if function_task is not None:
+            function_task.cancel()
+        print(f"Error during conversation: {e}")
+        get_instrumentation().record_error("conversation", e)
+        yield {"type": "done", "content": None, "context": messages}
+
+
+@_retrying
+async def _async_single_question(question, model="gpt-3.5-turbo-0613"):
+    """
+    Async version of _single_question. Raises on any error.
+    """
+    return _reply_content(await async_chat_completion(_question_request(question, model)))
+
+
+async def async_single_question(question, model="gpt-3.5-turbo-0613"):
+    """
+    Async version of single_question. Sends a question to the GPT model
+    """
+    try:
+        return await _async_single_question(question, model=model)
+
+    except Exception as e:
+        print(f"Error during conversation: {e}")
+        get_instrumentation().record_error("conversation", e)
+        return [{"role": "user", "content": question}]
+
+
+@_retrying
+async def _async_single_turn_pseudofunction(testing_prompt, function, model="gpt-4-1106-preview"):
+    """
+    Async version of _single_turn_pseudofunction. Raises on any error.
+    """
+    return _pseudofunction_arguments(await async_chat_completion(_pseudofunction_request(testing_prompt, function, model)))
+
+
+async def async_single_turn_pseudofunction(testing_prompt:str, function:str, model="gpt-4-1106-preview"):
+    """
+    Async version of single_turn_pseudofunction.
+
+    Args:
+        testing_prompt (str): The user's input or prompt for the conversation.
+        function (str): The function to be called as a pseudofunction, doesnt need to exist, its pourpose is to force gpt to respond given the parameters of the function.
+        model (str, optional): The model to use for the conversation. Defaults to "gpt-4-1106-preview".
+
+    Returns:
+        dict or None: The arguments of the function call if successful {arg: value,...}, None otherwise.
+    """
+    try:
+        return await _async_single_turn_pseudofunction(testing_prompt, function, model=model)
+
+    except Exception as e:
+        print(f"Error during conversation: {e}")
+        get_instrumentation().record_error("conversation", e)
+        return None
@@ -0,0 +1,219 @@
+
+import os
+import time
+import threading
+from .ratelimit import RateLimiter, parse_reset_duration
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class Endpoint:
+    """
+    One API key on one OpenAI-compatible server, with its own rate limit budget and health.
+
+    Attributes:
+        in_flight (int): Requests sent to the endpoint that have not been answered yet.
+        state (str): The circuit breaker state, "closed" (healthy), "open" (skipped) or "half_open" (probing).
+        latency (float or None): Moving average of the seconds until the response headers arrive.
+    """
+
+    def __init__(self, base_url=None, api_key=None, weight=1, name=None, rate_limiter=None):
+        """
+        Args:
+            base_url (str, optional): The base URL, e.g. "http://localhost:8000/v1" for a local server. Defaults to the configured base URL.
+            api_key (str, optional): The API key sent to the endpoint. Defaults to the configured API key.
+            weight (float, optional): The share of the traffic the endpoint receives relative to the others. Defaults to 1.
+            name (str, optional): The name used in stats and spans. Defaults to the base URL and the end of the key.
+            rate_limiter (RateLimiter, optional): The budget of the key. Defaults to one learned from the response headers.
+        """
+        if weight <= 0:
+            raise ValueError("The weight of an endpoint must be positive")
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.api_key = api_key
+        self.weight = float(weight)
+        self.name = name or f"{base_url or 'default'}#{(api_key or '')[-4:]}"
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.in_flight = 0
+        self.sent = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.blocked_until = 0.0
+        self.current_weight = 0.0
+
+    def __repr__(self):
+        return f"Endpoint({self.name!r}, state={self.state!r}, in_flight={self.in_flight})"
+
+
+class EndpointPool:
+    """
+    Spreads requests over several API keys and base URLs, so throughput adds up across their rate limits.
+
+    Requests go to the least loaded endpoint relative to its weight, or are split by weight in a smooth round robin.
+    An endpoint that fails `failure_threshold` times in a row (connection errors, 5xx, 401 and 403 responses) is
+    taken out of rotation for `recovery_time` seconds, then probed with a single request before it gets traffic again.
+    An endpoint answering 429 is skipped until its retry-after. A request whose endpoint fails is sent to the next one.
+    When every endpoint is out of rotation, the one recovering first is tried anyway rather than failing outright.
+    """
+
+    def __init__(self, endpoints, strategy="least_loaded", failure_threshold=5, recovery_time=30, max_attempts=None):
+        """
+        Args:
+            endpoints (list): Endpoint instances, or (base_url, api_key) tuples or API keys for the configured base URL.
+            strategy (str, optional): "least_loaded" or "weighted". Defaults to "least_loaded".
+            failure_threshold (int, optional): Consecutive failures that open the circuit of an endpoint. Defaults to 5.
+            recovery_time (float, optional): Seconds an open circuit waits before probing the endpoint. Defaults to 30.
+            max_attempts (int, optional): Endpoints tried per request. Defaults to the number of endpoints.
+        """
+        if strategy not in ("least_loaded", "weighted"):
+            raise ValueError(f"Unknown routing strategy {strategy!r}, use 'least_loaded' or 'weighted'")
+        self.endpoints = [self._as_endpoint(endpoint) for endpoint in endpoints]
+        if not self.endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.max_attempts = max_attempts or len(self.endpoints)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _as_endpoint(endpoint):
+        if isinstance(endpoint, Endpoint):
+            return endpoint
+        if isinstance(endpoint, str):
+            return Endpoint(api_key=endpoint)
+        return Endpoint(*endpoint)
+
+    def _available(self, endpoint, now):
+        if endpoint.state == OPEN and now - endpoint.opened_at >= self.recovery_time:
+            endpoint.state = HALF_OPEN
+            endpoint.probing = False
+        if endpoint.state == OPEN or (endpoint.state == HALF_OPEN and endpoint.probing):
+            return False
+        return endpoint.blocked_until <= now
+
+    def _pick(self, candidates):
+        if self.strategy == "weighted":
+            # Smooth weighted round robin, spreads the requests of each endpoint evenly over the cycle
+            total = sum(endpoint.weight for endpoint in candidates)
+            for endpoint in candidates:
+                endpoint.current_weight += endpoint.weight
+            chosen = max(candidates, key=lambda endpoint: endpoint.current_weight)
+            chosen.current_weight -= total
+            return chosen
+        return min(candidates, key=lambda endpoint: (endpoint.in_flight / endpoint.weight, endpoint.sent / endpoint.weight))
+
+    def acquire(self, exclude=()):
+        """
+        Picks the endpoint for the next attempt of a request and counts it as in flight. Pair with release().
+
+        Args:
+            exclude (iterable, optional): Endpoints this request already tried.
+
+        Returns:
+            Endpoint: The chosen endpoint.
+        """
+        now = time.monotonic()
+        with self._lock:
+            remaining = [endpoint for endpoint in self.endpoints if endpoint not in exclude] or self.endpoints
+            candidates = [endpoint for endpoint in remaining if self._available(endpoint, now)]
+            if candidates:
+                endpoint = self._pick(candidates)
+            else:
+                endpoint = min(remaining, key=lambda endpoint: max(endpoint.blocked_until, endpoint.opened_at + self.recovery_time if endpoint.state == OPEN else 0.0))
+            if endpoint.state == HALF_OPEN:
+                endpoint.probing = True
+            endpoint.in_flight += 1
+            endpoint.sent += 1
+        return endpoint
+
+    def release(self, endpoint, status_code=None, headers=None, latency=None, error=None):
+        """
+        Records the outcome of one attempt and returns whether it should be retried on another endpoint.
+        Without a status code or an error, e.g. for a cancelled request, the attempt only stops counting as in flight.
+
+        Args:
+            endpoint (Endpoint): The endpoint returned by acquire().
+            status_code (int, optional): The response status code.
+            headers (Mapping, optional): The response headers.
+            latency (float, optional): Seconds until the response headers arrived.
+            error (Exception, optional): The error raised while sending the request.
+
+        Returns:
+            bool: True if the endpoint failed or is rate limited and another one may succeed.
+        """
+        now = time.monotonic()
+        failed = error is not None or (status_code is not None and (status_code >= 500 or status_code in (401, 403)))
+        with self._lock:
+            endpoint.in_flight -= 1
+            if latency is not None:
+                endpoint.latency = latency if endpoint.latency is None else 0.8 * endpoint.latency + 0.2 * latency
+            if status_code == 429:
+                retry_after = parse_reset_duration((headers or {}).get("retry-after")) or 1.0
+                endpoint.blocked_until = max(endpoint.blocked_until, now + retry_after)
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.state == HALF_OPEN or endpoint.consecutive_failures >= self.failure_threshold:
+                    endpoint.state = OPEN
+                    endpoint.opened_at = now
+            elif status_code is not None and status_code != 429:
+                endpoint.consecutive_failures = 0
+                endpoint.state = CLOSED
+            endpoint.probing = False
+        return failed or status_code == 429
+
+    def stats(self):
+        """
+        Returns the load, health and latency of every endpoint, keyed by name.
+        """
+        with self._lock:
+            return {
+                endpoint.name: {
+                    "state": endpoint.state,
+                    "in_flight": endpoint.in_flight,
+                    "sent": endpoint.sent,
+                    "failures": endpoint.failures,
+                    "latency": endpoint.latency,
+                    "weight": endpoint.weight,
+                }
+                for endpoint in self.endpoints
+            }
+
+
+_endpoint_pool = None
+_endpoint_pool_loaded = False
+
+
+def get_endpoint_pool():
+    """
+    Returns the endpoint pool every request goes through, or None to send everything to the configured endpoint.
+    Unless one was set, a pool is built on first use from the comma-separated keys of the OPENAI_API_KEYS
+    environment variable, if present.
+    """
+    global _endpoint_pool, _endpoint_pool_loaded
+    if not _endpoint_pool_loaded:
+        from .client import load_environment
+        load_environment()
+        keys = [key.strip() for key in os.getenv("OPENAI_API_KEYS", "").split(",") if key.strip()]
+        if keys and _endpoint_pool is None:
+            _endpoint_pool = EndpointPool(keys)
+        _endpoint_pool_loaded = True
+    return _endpoint_pool
+
+
+def set_endpoint_pool(endpoint_pool):
+    """
+    Replaces the endpoint pool. Pass None to send every request to the endpoint set with configure_client().
+
+    Args:
+        endpoint_pool (EndpointPool or None): The pool to use.
+    """
+    global _endpoint_pool, _endpoint_pool_loaded
+    _endpoint_pool = endpoint_pool
+    _endpoint_pool_loaded = True
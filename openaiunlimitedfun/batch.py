@@ -0,0 +1,111 @@
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .utils import _single_question, _single_turn_pseudofunction
+
+BatchResult = namedtuple('BatchResult', ['index', 'item', 'result', 'error'])
+BatchResult.__doc__ = """
+The outcome of one batch item. error holds the exception raised after all retries, or None if the item succeeded.
+"""
+
+
+def _run_item(worker, index, item):
+    try:
+        return BatchResult(index, item, worker(item), None)
+    except Exception as e:
+        return BatchResult(index, item, None, e)
+
+
+def _iter_batch(worker, items, concurrency, ordered):
+    """
+    Runs worker over items with at most `concurrency` calls in flight and yields BatchResult objects.
+    When ordered, results are yielded in input order and at most 4 * concurrency results are buffered.
+    """
+    items = iter(items)
+    window = concurrency * 4 if ordered else concurrency
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending = set()
+    buffered = {}
+    next_index = 0
+    next_to_yield = 0
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency and next_index - next_to_yield < window:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(_run_item, worker, next_index, item))
+                next_index += 1
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if ordered:
+                    buffered[result.index] = result
+                else:
+                    next_to_yield += 1
+                    yield result
+            while next_to_yield in buffered:
+                yield buffered.pop(next_to_yield)
+                next_to_yield += 1
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _batch(worker, items, concurrency, stream, ordered):
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    results = _iter_batch(worker, items, concurrency, ordered)
+    return results if stream else list(results)
+
+
+def batch_single_question(prompts, concurrency=8, model="gpt-3.5-turbo-0613", stream=False, ordered=True):
+    """
+    Sends many questions to the GPT model with a bounded number of requests in flight.
+    A prompt failing with a connection error, a 429 or a 5xx response is retried, and reported in its BatchResult
+    without aborting the batch once the retries are exhausted.
+    For best throughput make the HTTP pool at least as large as concurrency, see configure_client(pool_maxsize=...).
+
+    Args:
+        prompts (iterable of str): The questions to send. Can be a generator, it is consumed lazily.
+        concurrency (int, optional): The maximum number of requests in flight. Defaults to 8.
+        model (str, optional): The GPT model to be used. Defaults to "gpt-3.5-turbo-0613".
+        stream (bool, optional): If True, returns a generator that yields results as they become available. Defaults to False.
+        ordered (bool, optional): If True, results follow the input order, otherwise completion order. Defaults to True.
+
+    Returns:
+        list or generator: BatchResult(index, item, result, error) for every prompt, result being the reply content.
+    """
+    # _single_question retries connection errors, 429 and 5xx responses itself
+    worker = lambda prompt: _single_question(prompt, model=model)
+    return _batch(worker, prompts, concurrency, stream, ordered)
+
+
+def batch_single_turn_pseudofunction(prompts, function=None, concurrency=8, model="gpt-4-1106-preview", stream=False, ordered=True):
+    """
+    Runs single_turn_pseudofunction over many prompts with a bounded number of requests in flight.
+    A prompt failing with a connection error, a 429 or a 5xx response is retried, and reported in its BatchResult
+    without aborting the batch once the retries are exhausted.
+
+    Args:
+        prompts (iterable): The prompts to send. If function is None, each item must be a (prompt, function) pair.
+        function (dict, optional): The pseudofunction schema shared by every prompt. Defaults to None.
+        concurrency (int, optional): The maximum number of requests in flight. Defaults to 8.
+        model (str, optional): The model to use. Defaults to "gpt-4-1106-preview".
+        stream (bool, optional): If True, returns a generator that yields results as they become available. Defaults to False.
+        ordered (bool, optional): If True, results follow the input order, otherwise completion order. Defaults to True.
+
+    Returns:
+        list or generator: BatchResult(index, item, result, error) for every prompt, result being the function arguments dict or None.
+    """
+    if function is None:
+        worker = lambda pair: _single_turn_pseudofunction(pair[0], pair[1], model=model)
+    else:
+        worker = lambda prompt: _single_turn_pseudofunction(prompt, function, model=model)
+    return _batch(worker, prompts, concurrency, stream, ordered)
@@ -0,0 +1,354 @@
+
+import os
+import json
+import time
+from collections import namedtuple
+from tenacity import retry, Retrying, stop_after_attempt, wait_random_exponential
+from .client import get_session, get_base_url, get_api_key, get_timeout
+from .utils import _pseudofunction_request, _pseudofunction_arguments
+from .instrumentation import get_instrumentation, record_retry
+
+BatchJobResult = namedtuple('BatchJobResult', ['request_id', 'result', 'error'])
+BatchJobResult.__doc__ = """
+The outcome of one request of a batch job. result holds the parsed function arguments (or None if the model did not
+call the function) and error the reason the request failed, or None if it succeeded.
+"""
+
+STATE_FILE = "job.json"
+FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchJobError(Exception):
+    """
+    A request of a batch job that the Batch API did not answer, or answered with an error.
+    """
+
+
+class BatchJob:
+    """
+    Runs single_turn_pseudofunction requests through the Batch API, for bulk extraction where cost and throughput
+    matter more than latency.
+
+    Everything lives in a job directory: the JSONL request files, written shard by shard while the prompts are read,
+    the downloaded result files, and job.json recording which shard was uploaded, submitted and collected. job.json is
+    replaced atomically after every step, so a job interrupted at any point resumes where it stopped when it is opened
+    again, without uploading or submitting anything twice. Results are read line by line from the downloaded files
+    and never held in memory all at once.
+    """
+
+    def __init__(self, directory, base_url=None, api_key=None):
+        """
+        Args:
+            directory (str): The job directory, created if needed. Opening an existing one resumes its job.
+            base_url (str, optional): The base URL of the Batch API. Defaults to the one set with configure_client().
+            api_key (str, optional): The API key the batches are billed to. Defaults to the one set with configure_client().
+        """
+        self.directory = directory
+        self.base_url = base_url
+        self.api_key = api_key
+        os.makedirs(directory, exist_ok=True)
+        state_path = os.path.join(directory, STATE_FILE)
+        if os.path.exists(state_path):
+            with open(state_path) as file:
+                self.state = json.load(file)
+        else:
+            self.state = {"prepared": False, "shards": []}
+
+    @property
+    def prepared(self):
+        return self.state["prepared"]
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _save(self):
+        temporary_path = self._path(STATE_FILE + ".tmp")
+        with open(temporary_path, 'w') as file:
+            json.dump(self.state, file, indent=1)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self._path(STATE_FILE))
+
+    def prepare(self, prompts, function=None, model="gpt-4-1106-preview", request_ids=None, max_requests_per_file=50000, max_bytes_per_file=100 * 1024 * 1024):
+        """
+        Writes the requests to JSONL files in the Batch API input format, reading the prompts lazily.
+        Does nothing if the job was already prepared, so a script calling prepare() and run() can simply be restarted.
+
+        Args:
+            prompts (iterable): The prompts. If function is None, each item must be a (prompt, function) pair.
+            function (dict, optional): The pseudofunction schema shared by every prompt. Defaults to None.
+            model (str, optional): The model to use. Defaults to "gpt-4-1106-preview".
+            request_ids (iterable of str, optional): The ids the results are keyed by. Defaults to the position of the prompt.
+            max_requests_per_file (int, optional): Requests per uploaded file. Defaults to 50000, the Batch API limit.
+            max_bytes_per_file (int, optional): Bytes per uploaded file. Defaults to 100 MB.
+
+        Returns:
+            int: The number of requests written.
+        """
+        if self.prepared:
+            return sum(shard["count"] for shard in self.state["shards"])
+        request_ids = iter(request_ids) if request_ids is not None else None
+        shards = []
+        file = None
+        total = 0
+        try:
+            for index, item in enumerate(prompts):
+                prompt, item_function = (item, function) if function is not None else item
+                request_id = str(next(request_ids)) if request_ids is not None else str(index)
+                line = json.dumps({
+                    "custom_id": request_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": _pseudofunction_request(prompt, item_function, model),
+                }) + "\n"
+                if file is None or shards[-1]["count"] >= max_requests_per_file or shards[-1]["bytes"] + len(line) > max_bytes_per_file:
+                    if file is not None:
+                        file.close()
+                    shards.append({"input": f"requests-{len(shards):04d}.jsonl", "count": 0, "bytes": 0, "status": None})
+                    file = open(self._path(shards[-1]["input"]), 'w')
+                file.write(line)
+                shards[-1]["count"] += 1
+                shards[-1]["bytes"] += len(line)
+                total += 1
+        finally:
+            if file is not None:
+                file.close()
+        self.state = {"prepared": True, "model": model, "shards": shards}
+        self._save()
+        return total
+
+    def _headers(self):
+        return {"Authorization": "Bearer " + (self.api_key or get_api_key())}
+
+    def _url(self, path):
+        return (self.base_url or get_base_url()).rstrip('/') + path
+
+    def _send(self, method, path, **kwargs):
+        response = get_session().request(method, self._url(path), headers=self._headers(), timeout=get_timeout(), **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    @retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3), before_sleep=record_retry)
+    def _request(self, method, path, **kwargs):
+        return self._send(method, path, **kwargs)
+
+    @retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3), before_sleep=record_retry)
+    def _upload(self, name):
+        with open(self._path(name), 'rb') as file:
+            response = get_session().post(self._url("/files"), headers=self._headers(), timeout=get_timeout(),
+                                          data={"purpose": "batch"}, files={"file": (name, file, "application/jsonl")})
+        response.raise_for_status()
+        return response.json()
+
+    @retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3), before_sleep=record_retry)
+    def _download(self, file_id, name):
+        """
+        Streams a result file to the job directory, so it is never held in memory.
+        """
+        temporary_path = self._path(name + ".tmp")
+        with get_session().get(self._url(f"/files/{file_id}/content"), headers=self._headers(), timeout=get_timeout(), stream=True) as response:
+            response.raise_for_status()
+            with open(temporary_path, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    file.write(chunk)
+        os.replace(temporary_path, self._path(name))
+
+    def _find_batch(self, file_id, file_created_at=None):
+        """
+        Returns the most recent batch created from an uploaded file, or None. The batches are listed newest first,
+        page by page, until it is found or the batches were created before the file.
+        """
+        params = {"limit": 100}
+        while True:
+            page = self._request("GET", "/batches", params=params)
+            batches = page.get("data", [])
+            for batch in batches:
+                if batch.get("input_file_id") == file_id:
+                    return batch
+                if file_created_at is not None and batch.get("created_at", file_created_at) < file_created_at:
+                    return None
+            if not page.get("has_more") or not batches:
+                return None
+            params = {"limit": 100, "after": batches[-1]["id"]}
+
+    def _create_batch(self, file_id, completion_window, file_created_at=None):
+        """
+        Creates the batch of an uploaded file. A failed attempt may still have created the batch, e.g. when the
+        response timed out, so every retry first looks for it instead of billing the file twice.
+        """
+        for attempt in Retrying(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3), before_sleep=record_retry, reraise=True):
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    batch = self._find_batch(file_id, file_created_at)
+                    if batch is not None:
+                        return batch
+                return self._send("POST", "/batches", json={"input_file_id": file_id, "endpoint": "/v1/chat/completions", "completion_window": completion_window})
+
+    def submit(self, completion_window="24h"):
+        """
+        Uploads the request files and creates one batch per file, skipping those already uploaded or submitted.
+
+        Args:
+            completion_window (str, optional): The completion window of the batches. Defaults to "24h".
+        """
+        if not self.prepared:
+            raise ValueError("The job has no requests, call prepare() first")
+        for shard in self.state["shards"]:
+            if shard.get("file_id") is None:
+                with get_instrumentation().span("batch_upload"):
+                    uploaded = self._upload(shard["input"])
+                shard["file_id"] = uploaded["id"]
+                shard["file_created_at"] = uploaded.get("created_at")
+                self._save()
+            if shard.get("batch_id") is None:
+                # A crash between creating the batch and saving its id would otherwise submit the file twice
+                batch = self._find_batch(shard["file_id"], shard.get("file_created_at")) if shard.get("submitting") else None
+                if batch is None:
+                    shard["submitting"] = True
+                    self._save()
+                    batch = self._create_batch(shard["file_id"], completion_window, shard.get("file_created_at"))
+                shard["batch_id"] = batch["id"]
+                _update_shard(shard, batch)
+                self._save()
+
+    def poll(self):
+        """
+        Refreshes the status of every unfinished batch.
+
+        Returns:
+            dict: The number of shards per batch status.
+        """
+        for shard in self.state["shards"]:
+            if shard.get("batch_id") is not None and shard["status"] not in FINISHED_STATUSES:
+                _update_shard(shard, self._request("GET", f"/batches/{shard['batch_id']}"))
+        self._save()
+        return self.status()
+
+    def status(self):
+        """
+        Returns the number of shards per batch status, None counting the shards not submitted yet.
+        """
+        counts = {}
+        for shard in self.state["shards"]:
+            counts[shard["status"]] = counts.get(shard["status"], 0) + 1
+        return counts
+
+    def cancel(self):
+        """
+        Cancels every batch that has not finished. Requests already answered are still returned by run().
+        """
+        for shard in self.state["shards"]:
+            if shard.get("batch_id") is not None and shard["status"] not in FINISHED_STATUSES:
+                _update_shard(shard, self._request("POST", f"/batches/{shard['batch_id']}/cancel"))
+        self._save()
+
+    def _read_results(self, shard):
+        """
+        Yields the result of every request of a finished shard, downloading its result files first.
+        """
+        answered = set()
+        for kind in ("output", "error"):
+            file_id = shard.get(f"{kind}_file_id")
+            if not file_id:
+                continue
+            name = shard["input"].replace("requests-", f"{kind}-")
+            if not os.path.exists(self._path(name)):
+                with get_instrumentation().span("batch_download"):
+                    self._download(file_id, name)
+            with open(self._path(name)) as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    answered.add(record["custom_id"])
+                    yield _parse_record(record)
+        if len(answered) < shard["count"]:
+            # Requests the batch never answered, e.g. when it failed validation
+            error = BatchJobError(f"Batch {shard.get('batch_id')} ended as {shard['status']}: {shard.get('errors') or 'no result'}")
+            with open(self._path(shard["input"])) as file:
+                for line in file:
+                    request_id = json.loads(line)["custom_id"]
+                    if request_id not in answered:
+                        yield BatchJobResult(request_id, None, error)
+
+    def results(self):
+        """
+        Yields the results of every finished shard, including those already collected by run(). Does not poll.
+
+        Yields:
+            BatchJobResult: request_id, result and error of every request.
+        """
+        for shard in self.state["shards"]:
+            if shard["status"] in FINISHED_STATUSES:
+                yield from self._read_results(shard)
+
+    def run(self, poll_interval=60, completion_window="24h"):
+        """
+        Submits the job if needed, then yields the results of each batch as soon as it finishes, until all are collected.
+        A batch counts as collected once all its results were yielded; after a crash the batch being read is yielded
+        again from the start, so consumers should deduplicate by request id.
+
+        Args:
+            poll_interval (float, optional): Seconds between two status checks. Defaults to 60.
+            completion_window (str, optional): The completion window of the batches. Defaults to "24h".
+
+        Yields:
+            BatchJobResult: request_id, result and error of every request.
+        """
+        self.submit(completion_window)
+        while True:
+            self.poll()
+            for shard in self.state["shards"]:
+                if shard["status"] in FINISHED_STATUSES and not shard.get("collected"):
+                    yield from self._read_results(shard)
+                    shard["collected"] = True
+                    self._save()
+            if all(shard.get("collected") for shard in self.state["shards"]):
+                return
+            time.sleep(poll_interval)
+
+
+def _update_shard(shard, batch):
+    """
+    Copies the status and result files of a batch object into the state of its shard.
+    """
+    shard["status"] = batch.get("status")
+    shard["output_file_id"] = batch.get("output_file_id")
+    shard["error_file_id"] = batch.get("error_file_id")
+    shard["errors"] = batch.get("errors")
+
+
+def _parse_record(record):
+    """
+    Turns one line of a Batch API output or error file into a BatchJobResult.
+    """
+    request_id = record["custom_id"]
+    response = record.get("response") or {}
+    if record.get("error") or response.get("status_code") != 200:
+        error = record.get("error") or (response.get("body") or {}).get("error") or f"status {response.get('status_code')}"
+        return BatchJobResult(request_id, None, BatchJobError(error.get("message", error) if isinstance(error, dict) else error))
+    try:
+        return BatchJobResult(request_id, _pseudofunction_arguments(response["body"]), None)
+    except Exception as e:
+        return BatchJobResult(request_id, None, e)
+
+
+def batch_job_pseudofunction(directory, prompts, function=None, model="gpt-4-1106-preview", request_ids=None, poll_interval=60):
+    """
+    Runs single_turn_pseudofunction over many prompts through the Batch API, at its lower price and higher limits.
+    The job is kept in directory: calling this again with the same directory after a crash resumes it.
+
+    Args:
+        directory (str): The job directory.
+        prompts (iterable): The prompts to send. If function is None, each item must be a (prompt, function) pair.
+        function (dict, optional): The pseudofunction schema shared by every prompt. Defaults to None.
+        model (str, optional): The model to use. Defaults to "gpt-4-1106-preview".
+        request_ids (iterable of str, optional): The ids the results are keyed by. Defaults to the position of the prompt.
+        poll_interval (float, optional): Seconds between two status checks. Defaults to 60.
+
+    Returns:
+        generator: BatchJobResult(request_id, result, error) for every prompt, in the order the batches finish.
+    """
+    job = BatchJob(directory)
+    job.prepare(prompts, function, model=model, request_ids=request_ids)
+    return job.run(poll_interval=poll_interval)
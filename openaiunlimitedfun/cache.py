@@ -0,0 +1,174 @@
+
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_KEY_FIELDS = ("model", "messages", "functions", "function_call", "tools", "tool_choice")
+
+
+def make_cache_key(json_data):
+    """
+    Returns a canonical hash of the fields of a chat completion request that determine its response.
+
+    Args:
+        json_data (dict): The request body.
+
+    Returns:
+        str: A sha256 hex digest, identical for requests that only differ in key order or whitespace.
+    """
+    canonical = {field: json_data[field] for field in CACHE_KEY_FIELDS if json_data.get(field) is not None}
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Caches chat completion responses in an in-memory LRU with TTL eviction and an optional SQLite file
+    that several processes can share. Disk hits are promoted into memory.
+    Cached responses are shared between callers and must not be modified.
+    """
+
+    def __init__(self, max_size=1024, ttl=None, path=None):
+        """
+        Args:
+            max_size (int, optional): The maximum number of responses kept in memory. Defaults to 1024.
+            ttl (float, optional): Seconds a response stays valid. Defaults to None, never expiring.
+            path (str, optional): The SQLite file of the disk tier. Defaults to None, memory only.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._local = threading.local()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path is not None:
+            self._connection()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)")
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        """
+        Returns the cached response for a key, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._entries[key]
+        if self.path is not None:
+            row = self._connection().execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and (row[1] is None or row[1] > now):
+                value = json.loads(row[0])
+                with self._lock:
+                    self._store(key, value, row[1])
+                    self.disk_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        """
+        Stores a response in memory and, when enabled, on disk.
+        """
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._store(key, value, expires)
+        if self.path is not None:
+            connection = self._connection()
+            connection.execute("INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)", (key, json.dumps(value), expires))
+            connection.commit()
+
+    def _store(self, key, value, expires):
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def prune(self):
+        """
+        Removes expired responses from memory and from the disk tier.
+        """
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (value, expires) in self._entries.items() if expires is not None and expires <= now]:
+                del self._entries[key]
+        if self.path is not None:
+            connection = self._connection()
+            connection.execute("DELETE FROM responses WHERE expires IS NOT NULL AND expires <= ?", (now,))
+            connection.commit()
+
+    def clear(self):
+        """
+        Removes every cached response and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.disk_hits = self.misses = 0
+        if self.path is not None:
+            connection = self._connection()
+            connection.execute("DELETE FROM responses")
+            connection.commit()
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    def stats(self):
+        """
+        Returns the hit and miss counters.
+
+        Returns:
+            dict: hits, memory_hits, disk_hits, misses, hit_ratio and the number of responses in memory.
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "hits": self.memory_hits + self.disk_hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "size": len(self._entries),
+            }
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """
+    Returns the response cache used by the deterministic request functions, or None if caching is disabled.
+    """
+    return _response_cache
+
+
+def set_response_cache(response_cache):
+    """
+    Enables response caching for single_question, single_turn_pseudofunction and create_json_autoagent.
+    Pass None to disable it again, which is the default.
+
+    Args:
+        response_cache (ResponseCache or None): The cache to use.
+    """
+    global _response_cache
+    _response_cache = response_cache
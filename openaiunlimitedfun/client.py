@@ -0,0 +1,615 @@
+
+import os
+import json
+import time
+import threading
+from .ratelimit import get_rate_limiter
+from .cache import get_response_cache, make_cache_key
+from .instrumentation import get_instrumentation
+from .coalesce import get_request_coalescer, make_request_key
+from .balancer import get_endpoint_pool
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+# Times a rate limited request is sent again to the single configured endpoint, once the rate limiter lets it
+RATE_LIMIT_RESENDS = 2
+
+# Module-level client configuration, change it through configure_client()
+_config = {
+    "base_url": None,
+    "api_key": None,
+    "pool_connections": 10,
+    "pool_maxsize": 20,
+    "connect_timeout": 10,
+    "timeout": 600,
+}
+_lock = threading.Lock()
+_environment_loaded = False
+_session = None
+_openai_client = None
+_endpoint_openai_clients = {}
+_async_session = None
+_async_session_loop = None
+
+
+def configure_client(base_url=None, api_key=None, pool_connections=None, pool_maxsize=None, connect_timeout=None, timeout=None):
+    """
+    Configures the shared HTTP client used by every request function in the package.
+    Any pooled client already created is closed so the next request picks up the new settings.
+
+    Args:
+        base_url (str, optional): The base URL of the API, e.g. "https://api.openai.com/v1". Defaults to OPENAI_BASE_URL or the OpenAI API.
+        api_key (str, optional): The API key to use. Defaults to the OPENAI_API_KEY environment variable.
+        pool_connections (int, optional): The number of host pools to keep alive.
+        pool_maxsize (int, optional): The maximum number of keep-alive connections per host.
+        connect_timeout (float, optional): Seconds to wait for a connection to be established.
+        timeout (float, optional): Seconds to wait for the server to send a response.
+    """
+    updates = {
+        "base_url": base_url,
+        "api_key": api_key,
+        "pool_connections": pool_connections,
+        "pool_maxsize": pool_maxsize,
+        "connect_timeout": connect_timeout,
+        "timeout": timeout,
+    }
+    with _lock:
+        _config.update({key: value for key, value in updates.items() if value is not None})
+    close_client()
+
+
+def load_environment():
+    """
+    Loads the .env file of the current directory (or its parents) into the environment, once.
+    Called the first time the configuration is read, so importing the package never touches the filesystem.
+    """
+    global _environment_loaded
+    if not _environment_loaded:
+        _environment_loaded = True
+        from dotenv import load_dotenv, find_dotenv
+        load_dotenv(find_dotenv(usecwd=True))
+
+
+def get_base_url():
+    """
+    Returns the configured base URL without a trailing slash.
+    """
+    load_environment()
+    base_url = _config["base_url"] or os.getenv("OPENAI_BASE_URL") or DEFAULT_BASE_URL
+    return base_url.rstrip('/')
+
+
+def get_api_key():
+    """
+    Returns the configured API key, falling back to the OPENAI_API_KEY environment variable.
+    """
+    load_environment()
+    return _config["api_key"] or os.getenv("OPENAI_API_KEY")
+
+
+def get_headers(api_key=None):
+    """
+    Returns the headers sent with every chat completion request.
+
+    Args:
+        api_key (str, optional): The API key of the endpoint. Defaults to the configured API key.
+    """
+    return {
+        "Content-Type": "application/json",
+        "Authorization": "Bearer " + (api_key or get_api_key()),
+    }
+
+
+def get_timeout():
+    """
+    Returns the (connect, read) timeout tuple used for requests.
+    """
+    return (_config["connect_timeout"], _config["timeout"])
+
+
+def get_session():
+    """
+    Returns the shared keep-alive requests.Session, creating it on first use.
+
+    Returns:
+        requests.Session: A session whose connection pool is reused across calls.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=_config["pool_connections"], pool_maxsize=_config["pool_maxsize"])
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def post_chat_completion(json_data, stream=False):
+    """
+    Posts a chat completion request through the pooled session. With an endpoint pool, the request goes to the
+    endpoint it picks and is sent again to the next one if that endpoint fails or is rate limited.
+
+    Args:
+        json_data (dict): The request body.
+        stream (bool, optional): If True, the response body is not read up front. Defaults to False.
+
+    Returns:
+        requests.Response: The raw response.
+    """
+    return _send_to_endpoints(lambda base_url, api_key, rate_limiter, endpoint_name=None: _post_chat_completion(json_data, stream, base_url, api_key, rate_limiter, endpoint_name))
+
+
+def _send_to_endpoints(send):
+    """
+    Sends a request with send(base_url, api_key, rate_limiter, endpoint_name) to the configured endpoint,
+    or to the endpoints of the pool until one answers without failing or being rate limited.
+    """
+    attempts = _RequestAttempts()
+    while True:
+        try:
+            response = send(*attempts.next())
+        except BaseException as e:
+            if not attempts.failed(e):
+                raise
+            continue
+        if attempts.answered(response):
+            return response
+        response.close()
+
+
+class _RequestAttempts:
+    """
+    The endpoint bookkeeping of one request, shared by the sync and async clients, which only differ in how they
+    send a request and close a response. Without an endpoint pool, a rate limited request is sent again to the
+    configured endpoint once the rate limiter lets it through; with one, it is sent to the next endpoint.
+    """
+
+    def __init__(self):
+        self.endpoint_pool = get_endpoint_pool()
+        self.rate_limiter = get_rate_limiter()
+        self.endpoint = None
+        self.tried = []
+        self.start = None
+
+    @property
+    def last(self):
+        if self.endpoint_pool is None:
+            return len(self.tried) > RATE_LIMIT_RESENDS
+        return len(self.tried) >= self.endpoint_pool.max_attempts
+
+    def next(self):
+        """
+        Starts the next attempt. Returns the (base_url, api_key, rate_limiter, endpoint_name) to send it with.
+        """
+        self.start = time.perf_counter()
+        if self.endpoint_pool is None:
+            self.tried.append(None)
+            return get_base_url(), get_api_key(), self.rate_limiter, None
+        self.endpoint = self.endpoint_pool.acquire(self.tried)
+        self.tried.append(self.endpoint)
+        rate_limiter = self.endpoint.rate_limiter if self.rate_limiter is not None else None
+        return self.endpoint.base_url or get_base_url(), self.endpoint.api_key, rate_limiter, self.endpoint.name
+
+    def failed(self, error):
+        """
+        Reports the error raised by the attempt. Returns True if the request goes on to the next attempt, False if the error must be raised.
+        """
+        if self.endpoint_pool is None:
+            return False
+        if not isinstance(error, Exception):
+            self.endpoint_pool.release(self.endpoint)
+            return False
+        self.endpoint_pool.release(self.endpoint, error=error)
+        get_instrumentation().record_error("endpoint", error)
+        if self.last:
+            return False
+        get_instrumentation().record_failover(self.endpoint.name)
+        return True
+
+    def answered(self, response):
+        """
+        Reports the response of the attempt. Returns True if it is the answer, False if the caller must close it and the request goes on.
+        """
+        if self.endpoint_pool is None:
+            return response.status_code != 429 or self.rate_limiter is None or self.last
+        if not self.endpoint_pool.release(self.endpoint, response.status_code, response.headers, time.perf_counter() - self.start) or self.last:
+            return True
+        get_instrumentation().record_failover(self.endpoint.name)
+        return False
+
+
+def _post_chat_completion(json_data, stream, base_url, api_key, rate_limiter, endpoint_name=None):
+    instrumentation = get_instrumentation()
+    if rate_limiter is not None:
+        with instrumentation.span("rate_limit_wait"):
+            rate_limiter.acquire(json_data)
+    with instrumentation.span("network", endpoint=endpoint_name or base_url):
+        response = get_session().post(base_url + "/chat/completions", headers=get_headers(api_key), json=json_data, timeout=get_timeout(), stream=stream)
+    if rate_limiter is not None:
+        rate_limiter.update_from_headers(json_data.get("model", ""), response.headers, response.status_code)
+    return response
+
+
+def chat_completion(json_data):
+    """
+    Sends a chat completion request and returns the decoded response, serving it from the response cache when one is enabled.
+    An identical request already in flight is waited on instead of being sent again. Raises on HTTP errors.
+
+    Args:
+        json_data (dict): The request body.
+
+    Returns:
+        dict: The decoded response body.
+    """
+    return _cached_completion(json_data, _request_json)
+
+
+def openai_chat_completion(json_data):
+    """
+    Like chat_completion(), but sends the request with the openai SDK client, through the same response cache,
+    coalescer, rate limiter and endpoint pool. Raises on HTTP errors.
+
+    Args:
+        json_data (dict): The request body.
+
+    Returns:
+        dict: The completion, dumped from the SDK's response model.
+    """
+    return _cached_completion(json_data, _openai_request_json)
+
+
+def _cache_lookup(json_data):
+    """
+    Looks a request up in the response cache. Returns the cache, the request's key and the cached response,
+    None for all three when caching is off.
+    """
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return None, None, None
+    cache_key = make_cache_key(json_data)
+    cached = response_cache.get(cache_key)
+    get_instrumentation().record_cache("response", cached is not None)
+    return response_cache, cache_key, cached
+
+
+def _cached_completion(json_data, request):
+    response_cache, cache_key, cached = _cache_lookup(json_data)
+    if cached is not None:
+        return cached
+    request_coalescer = get_request_coalescer()
+    if request_coalescer is not None:
+        response_json = request_coalescer.call(make_request_key(json_data), lambda: request(json_data))
+    else:
+        response_json = request(json_data)
+    if response_cache is not None:
+        response_cache.set(cache_key, response_json)
+    return response_json
+
+
+def _request_json(json_data):
+    response = post_chat_completion(json_data)
+    response.raise_for_status()
+    return decode_response(response, json_data.get("model", ""))
+
+
+def _openai_request_json(json_data):
+    import httpx
+    response = _send_to_endpoints(lambda base_url, api_key, rate_limiter, endpoint_name=None: _post_openai_chat_completion(json_data, base_url, api_key, rate_limiter, endpoint_name))
+    if isinstance(response, httpx.Response):
+        response.raise_for_status()
+    instrumentation = get_instrumentation()
+    with instrumentation.span("decode"):
+        completion = response.parse().model_dump()
+    if completion.get("usage"):
+        instrumentation.record_usage(completion.get("model", json_data.get("model", "")), completion["usage"])
+    return completion
+
+
+def _post_openai_chat_completion(json_data, base_url, api_key, rate_limiter, endpoint_name=None):
+    """
+    Sends a request with the shared openai client, retargeted at the endpoint. The raw httpx response of an
+    HTTP error is returned rather than raised, so the endpoint pool sees its status code and headers.
+    """
+    import openai
+    instrumentation = get_instrumentation()
+    if rate_limiter is not None:
+        with instrumentation.span("rate_limit_wait"):
+            rate_limiter.acquire(json_data)
+    openai_client = get_openai_client() if endpoint_name is None else _get_endpoint_openai_client(base_url, api_key)
+    with instrumentation.span("network", endpoint=endpoint_name or base_url):
+        try:
+            response = openai_client.chat.completions.with_raw_response.create(**json_data)
+        except openai.APIStatusError as e:
+            response = e.response
+    if rate_limiter is not None:
+        rate_limiter.update_from_headers(json_data.get("model", ""), response.headers, response.status_code)
+    return response
+
+
+def decode_response(response, model):
+    """
+    Decodes a completion response inside a "decode" span and reports its token usage.
+
+    Args:
+        response (requests.Response or httpx.Response): The raw response.
+        model (str): The requested model, used to label the usage.
+
+    Returns:
+        dict: The decoded response body.
+    """
+    instrumentation = get_instrumentation()
+    with instrumentation.span("decode"):
+        response_json = response.json()
+    usage = response_json.get("usage")
+    if usage:
+        instrumentation.record_usage(response_json.get("model", model), usage)
+    return response_json
+
+
+def is_retryable_error(error):
+    """
+    Returns whether a request that raised error may succeed when sent again: connection errors, timeouts,
+    429 and 5xx responses. Other errors, such as 4xx responses or malformed replies, are not retried.
+    """
+    import requests
+    import httpx
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, httpx.TransportError)):
+        return True
+    status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+def _parse_event_line(line):
+    """
+    Decodes one server-sent event line of a streamed completion. Returns None for lines without data and "[DONE]" at the end.
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return data
+    return json.loads(data)
+
+
+def stream_chat_completion(json_data):
+    """
+    Sends a chat completion request with stream enabled and yields the decoded chunks as they arrive.
+    Raises on HTTP errors.
+
+    Args:
+        json_data (dict): The request body.
+
+    Yields:
+        dict: The completion chunks.
+    """
+    response = post_chat_completion(dict(json_data, stream=True), stream=True)
+    with response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            chunk = _parse_event_line(line)
+            if chunk == "[DONE]":
+                break
+            if chunk is not None:
+                if chunk.get("usage"):
+                    get_instrumentation().record_usage(chunk.get("model", json_data.get("model", "")), chunk["usage"])
+                yield chunk
+
+
+def get_async_session():
+    """
+    Returns the shared httpx.AsyncClient for the running event loop, creating it on first use.
+    A new client is created if the previous one belongs to a different event loop, and the previous one is closed.
+
+    Returns:
+        httpx.AsyncClient: A client whose connection pool is reused across calls.
+    """
+    global _async_session, _async_session_loop
+    import asyncio
+    loop = asyncio.get_running_loop()
+    if _async_session is None or _async_session_loop is not loop:
+        import httpx
+        previous_session = previous_loop = None
+        with _lock:
+            if _async_session is None or _async_session_loop is not loop:
+                previous_session, previous_loop = _async_session, _async_session_loop
+                _async_session = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=_config["pool_maxsize"], max_keepalive_connections=_config["pool_maxsize"]),
+                    timeout=httpx.Timeout(_config["timeout"], connect=_config["connect_timeout"]),
+                )
+                _async_session_loop = loop
+        _close_async_session(previous_session, previous_loop)
+    return _async_session
+
+
+def _close_async_session(async_session, loop):
+    """
+    Closes an async client from outside the event loop it belongs to. Its connections can only be closed on that
+    loop, so a client whose loop is already closed is reported with a ResourceWarning.
+    """
+    import asyncio
+    if async_session is None:
+        return
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(async_session.aclose(), loop)
+    elif not loop.is_closed():
+        # An idle loop can run in another thread, even while this thread runs a loop of its own
+        closer = threading.Thread(target=loop.run_until_complete, args=(async_session.aclose(),))
+        closer.start()
+        closer.join()
+    else:
+        import warnings
+        warnings.warn("The pooled httpx.AsyncClient of a finished event loop could not be closed, "
+                      "await aclose_client() before the event loop ends", ResourceWarning, stacklevel=3)
+
+
+async def async_post_chat_completion(json_data, stream=False):
+    """
+    Posts a chat completion request through the pooled async client, failing over like post_chat_completion.
+
+    Args:
+        json_data (dict): The request body.
+        stream (bool, optional): If True, the response body is not read up front and must be closed with aclose(). Defaults to False.
+
+    Returns:
+        httpx.Response: The raw response.
+    """
+    return await _async_send_to_endpoints(lambda base_url, api_key, rate_limiter, endpoint_name=None: _async_post_chat_completion(json_data, stream, base_url, api_key, rate_limiter, endpoint_name))
+
+
+async def _async_send_to_endpoints(send):
+    """
+    Async version of _send_to_endpoints, send returning an awaitable.
+    """
+    attempts = _RequestAttempts()
+    while True:
+        try:
+            response = await send(*attempts.next())
+        except BaseException as e:
+            if not attempts.failed(e):
+                raise
+            continue
+        if attempts.answered(response):
+            return response
+        await response.aclose()
+
+
+async def _async_post_chat_completion(json_data, stream, base_url, api_key, rate_limiter, endpoint_name=None):
+    instrumentation = get_instrumentation()
+    if rate_limiter is not None:
+        with instrumentation.span("rate_limit_wait"):
+            await rate_limiter.async_acquire(json_data)
+    with instrumentation.span("network", endpoint=endpoint_name or base_url):
+        session = get_async_session()
+        request = session.build_request("POST", base_url + "/chat/completions", headers=get_headers(api_key), json=json_data)
+        response = await session.send(request, stream=stream)
+    if rate_limiter is not None:
+        rate_limiter.update_from_headers(json_data.get("model", ""), response.headers, response.status_code)
+    return response
+
+
+async def async_chat_completion(json_data):
+    """
+    Async version of chat_completion.
+    """
+    response_cache, cache_key, cached = _cache_lookup(json_data)
+    if cached is not None:
+        return cached
+    request_coalescer = get_request_coalescer()
+    if request_coalescer is not None:
+        response_json = await request_coalescer.async_call(make_request_key(json_data), lambda: _async_request_json(json_data))
+    else:
+        response_json = await _async_request_json(json_data)
+    if response_cache is not None:
+        response_cache.set(cache_key, response_json)
+    return response_json
+
+
+async def _async_request_json(json_data):
+    response = await async_post_chat_completion(json_data)
+    response.raise_for_status()
+    return decode_response(response, json_data.get("model", ""))
+
+
+async def async_stream_chat_completion(json_data):
+    """
+    Async version of stream_chat_completion.
+    """
+    json_data = dict(json_data, stream=True)
+    response = await async_post_chat_completion(json_data, stream=True)
+    try:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            chunk = _parse_event_line(line)
+            if chunk == "[DONE]":
+                break
+            if chunk is not None:
+                if chunk.get("usage"):
+                    get_instrumentation().record_usage(chunk.get("model", json_data.get("model", "")), chunk["usage"])
+                yield chunk
+    finally:
+        await response.aclose()
+
+
+def get_openai_client():
+    """
+    Returns a shared openai.OpenAI client backed by a pooled httpx client, creating it on first use.
+
+    Returns:
+        openai.OpenAI: The shared client.
+    """
+    global _openai_client
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                import httpx
+                import openai
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=_config["pool_maxsize"], max_keepalive_connections=_config["pool_maxsize"]),
+                    timeout=httpx.Timeout(_config["timeout"], connect=_config["connect_timeout"]),
+                )
+                _openai_client = openai.OpenAI(api_key=get_api_key(), base_url=get_base_url(), http_client=http_client)
+    return _openai_client
+
+
+def _get_endpoint_openai_client(base_url, api_key):
+    """
+    Returns the shared openai client retargeted at an endpoint of the pool, created once per endpoint.
+    The pool retries on the next endpoint, so the SDK must not retry on this one.
+    """
+    key = (base_url, api_key)
+    openai_client = _endpoint_openai_clients.get(key)
+    if openai_client is None:
+        # Shares the connection pool of the shared client
+        openai_client = get_openai_client().with_options(base_url=base_url, api_key=api_key, max_retries=0)
+        with _lock:
+            openai_client = _endpoint_openai_clients.setdefault(key, openai_client)
+    return openai_client
+
+
+def close_client():
+    """
+    Closes the pooled session, OpenAI client and async client. They are recreated lazily on the next request.
+    Prefer aclose_client() inside an event loop, an async client whose loop has ended cannot be closed any more.
+    """
+    _close_sync_clients()
+    _close_async_session(*_detach_async_session())
+
+
+def _close_sync_clients():
+    global _session, _openai_client
+    with _lock:
+        session, openai_client = _session, _openai_client
+        _session = None
+        _openai_client = None
+        _endpoint_openai_clients.clear()
+    if session is not None:
+        session.close()
+    if openai_client is not None:
+        openai_client.close()
+
+
+def _detach_async_session():
+    global _async_session, _async_session_loop
+    with _lock:
+        async_session, loop = _async_session, _async_session_loop
+        _async_session = None
+        _async_session_loop = None
+    return async_session, loop
+
+
+async def aclose_client():
+    """
+    Closes the pooled async client along with the synchronous clients.
+    """
+    import asyncio
+    async_session, loop = _detach_async_session()
+    _close_sync_clients()
+    if loop is asyncio.get_running_loop():
+        await async_session.aclose()
+    else:
+        _close_async_session(async_session, loop)
@@ -0,0 +1,128 @@
+
+import json
+import hashlib
+import threading
+from concurrent.futures import Future
+from .instrumentation import get_instrumentation
+
+
+def make_request_key(json_data):
+    """
+    Returns a canonical hash of a whole chat completion request body, identical for requests that only
+    differ in key order or whitespace. Unlike the response cache key, sampling parameters are included.
+    """
+    payload = json.dumps(json_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RequestCoalescer:
+    """
+    Single-flight layer for chat completion requests. While a request is in flight, identical requests wait for
+    its response instead of being sent again, from threads and coroutines alike. Failures are shared with the
+    waiting callers, who retry on their own.
+    Coalesced responses are shared between callers and must not be modified.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.sent = 0
+        self.saved = 0
+
+    def _join(self, key):
+        """
+        Returns the future of the request in flight for key and whether the caller has to send it.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.saved += 1
+                leader = False
+            else:
+                future = self._in_flight[key] = Future()
+                future.set_running_or_notify_cancel()
+                self.sent += 1
+                leader = True
+        get_instrumentation().record_cache("coalesce", not leader)
+        return future, leader
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def call(self, key, request):
+        """
+        Sends the request unless an identical one is in flight, then returns its result.
+
+        Args:
+            key (str): The request key, see make_request_key().
+            request (callable): Sends the request and returns its result.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = request()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def async_call(self, key, request):
+        """
+        Async version of call(). request is a coroutine function.
+        """
+        import asyncio
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await request()
+        except asyncio.CancelledError:
+            # The waiting callers were not cancelled, only the one sending the request
+            self._finish(key, future, error=RuntimeError("The coalesced request was cancelled"))
+            raise
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def stats(self):
+        """
+        Returns how many requests were sent, how many calls were saved by waiting on one, and how many are in flight.
+        """
+        with self._lock:
+            calls = self.sent + self.saved
+            return {
+                "sent": self.sent,
+                "saved": self.saved,
+                "saved_ratio": self.saved / calls if calls else 0.0,
+                "in_flight": len(self._in_flight),
+            }
+
+
+_request_coalescer = RequestCoalescer()
+
+
+def get_request_coalescer():
+    """
+    Returns the coalescer every chat_completion and async_chat_completion call goes through, or None if disabled.
+    """
+    return _request_coalescer
+
+
+def set_request_coalescer(request_coalescer):
+    """
+    Replaces the coalescer. Pass None to send every request, e.g. to sample several answers to one prompt.
+
+    Args:
+        request_coalescer (RequestCoalescer or None): The coalescer to use.
+    """
+    global _request_coalescer
+    _request_coalescer = request_coalescer
@@ -0,0 +1,244 @@
+
+import inspect
+from .tokens import REPLY_PRIMING, count_message_tokens
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+
+def summarize_messages(messages, previous_summary=None, model="gpt-3.5-turbo-0613"):
+    """
+    Default summarizer of the 'summarize' policy. Asks the model for a short summary of the dropped messages.
+
+    Args:
+        messages (list): The messages being dropped from the prompt.
+        previous_summary (str, optional): The summary of everything dropped before them.
+        model (str, optional): The model used to summarize.
+
+    Returns:
+        str: The new summary.
+    """
+    from .utils import single_question
+    summary = single_question(_summary_question(messages, previous_summary), model=model)
+    return summary if isinstance(summary, str) else (previous_summary or "")
+
+
+async def async_summarize_messages(messages, previous_summary=None, model="gpt-3.5-turbo-0613"):
+    """
+    Async version of summarize_messages, used by Conversation.async_ask.
+    """
+    from .async_utils import async_single_question
+    summary = await async_single_question(_summary_question(messages, previous_summary), model=model)
+    return summary if isinstance(summary, str) else (previous_summary or "")
+
+
+def _summary_question(messages, previous_summary):
+    transcript = "\n".join(f"{message['role']}: {message.get('content')}" for message in messages if message.get('content'))
+    question = "Summarize the following conversation in a few sentences, keeping every fact needed to continue it."
+    if previous_summary:
+        question += f"\n\nWhat happened before it: {previous_summary}"
+    return f"{question}\n\n{transcript}"
+
+
+class Conversation:
+    """
+    A conversation that keeps its prompt under a token budget.
+
+    Token counts are computed once per message with tiktoken and kept next to it, so checking the budget is O(1).
+    When the prompt would exceed max_tokens, the oldest messages after the leading system messages are dropped
+    ('trim' policy) or replaced by a running summary ('summarize' policy). Trimming goes down to
+    target_ratio * max_tokens, so it happens once every few turns instead of on every turn.
+    """
+
+    def __init__(self, model="gpt-3.5-turbo-0613", max_tokens=3000, system_message=None, policy='trim', summarizer=None, target_ratio=0.75, keep_last=2):
+        """
+        Args:
+            model (str, optional): The model used for requests and token counting. Defaults to "gpt-3.5-turbo-0613".
+            max_tokens (int, optional): The token budget of the prompt sent with each request. Defaults to 3000.
+            system_message (str, optional): A system message always kept at the start of the prompt.
+            policy (str, optional): 'trim' to drop old messages or 'summarize' to replace them with a summary. Defaults to 'trim'.
+            summarizer (callable, optional): summarizer(messages, previous_summary) -> str for the 'summarize' policy,
+                or a coroutine function, which only async_ask can use. Defaults to summarize_messages, and to
+                async_summarize_messages in async_ask.
+            target_ratio (float, optional): The fraction of max_tokens to trim down to. Defaults to 0.75.
+            keep_last (int, optional): The number of most recent messages that are never dropped. Defaults to 2.
+        """
+        if policy not in ('trim', 'summarize'):
+            raise ValueError(f"Unknown policy {policy}, use 'trim' or 'summarize'.")
+        self.model = model
+        self.max_tokens = max_tokens
+        self.policy = policy
+        self.summarizer = summarizer
+        self.target_ratio = target_ratio
+        self.keep_last = keep_last
+        self.messages = []
+        self.token_counts = []
+        self.total_tokens = 0
+        self.summary = None
+        self.turns = []
+        if system_message:
+            self.append({"role": "system", "content": system_message})
+
+    def append(self, message):
+        """
+        Adds a message and counts its tokens.
+        """
+        tokens = count_message_tokens(message, self.model)
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        self.total_tokens += tokens
+
+    def extend(self, messages):
+        """
+        Adds several messages.
+        """
+        for message in messages:
+            self.append(message)
+
+    def _first_droppable(self):
+        index = 0
+        while index < len(self.messages) and self.messages[index]['role'] == 'system':
+            index += 1
+        return index
+
+    def fit(self, extra_tokens=0):
+        """
+        Drops or summarizes the oldest messages if the prompt plus extra_tokens exceeds max_tokens.
+
+        Args:
+            extra_tokens (int, optional): Tokens that will be added to the prompt, e.g. the next question and the
+                functions or tools sent with it (see tokens.count_schema_tokens). Defaults to 0.
+
+        Returns:
+            int: The number of messages removed.
+        """
+        if self.policy == 'summarize' and inspect.iscoroutinefunction(self.summarizer):
+            raise TypeError("An async summarizer can only be used with async_ask or async_fit")
+        dropped = self._drop(extra_tokens)
+        if dropped and self.policy == 'summarize':
+            if self.summarizer is None:
+                summary = summarize_messages(dropped, self.summary, model=self.model)
+            else:
+                summary = self.summarizer(dropped, self.summary)
+            self._set_summary(summary)
+        return len(dropped)
+
+    async def async_fit(self, extra_tokens=0):
+        """
+        Async version of fit. The summary is requested without blocking the event loop.
+        """
+        dropped = self._drop(extra_tokens)
+        if dropped and self.policy == 'summarize':
+            if self.summarizer is None:
+                summary = await async_summarize_messages(dropped, self.summary, model=self.model)
+            else:
+                summary = self.summarizer(dropped, self.summary)
+                if inspect.isawaitable(summary):
+                    summary = await summary
+            self._set_summary(summary)
+        return len(dropped)
+
+    def _drop(self, extra_tokens):
+        """
+        Removes the oldest droppable messages needed to fit the budget and returns them.
+        """
+        if self.total_tokens + extra_tokens + REPLY_PRIMING <= self.max_tokens:
+            return []
+        target = self.max_tokens * self.target_ratio - extra_tokens - REPLY_PRIMING
+        start = self._first_droppable()
+        end = start
+        remaining = self.total_tokens
+        last_droppable = len(self.messages) - self.keep_last
+        while end < last_droppable and remaining > target:
+            remaining -= self.token_counts[end]
+            end += 1
+        # Tool results cannot lead the prompt without the call that produced them
+        while end < last_droppable and self.messages[end]['role'] in ('tool', 'function'):
+            remaining -= self.token_counts[end]
+            end += 1
+        # When they reach into the kept messages, the call is kept along with them
+        while start < end < len(self.messages) and self.messages[end]['role'] in ('tool', 'function'):
+            end -= 1
+            remaining += self.token_counts[end]
+        if end == start:
+            return []
+
+        dropped = self.messages[start:end]
+        del self.messages[start:end]
+        del self.token_counts[start:end]
+        self.total_tokens = remaining
+        return dropped
+
+    def _set_summary(self, summary):
+        if self.summary is not None:
+            # The previous summary is the last of the leading system messages
+            index = self._first_droppable() - 1
+            self.total_tokens -= self.token_counts[index]
+            del self.messages[index]
+            del self.token_counts[index]
+        self.summary = summary
+        message = {"role": "system", "content": SUMMARY_PREFIX + summary}
+        tokens = count_message_tokens(message, self.model)
+        index = self._first_droppable()
+        self.messages.insert(index, message)
+        self.token_counts.insert(index, tokens)
+        self.total_tokens += tokens
+
+    def _record_turn(self, question_tokens, prompt_tokens, trimmed, new_messages):
+        # extend() just counted the new messages, the first of them is the question
+        reply_tokens = sum(self.token_counts[len(self.token_counts) - len(new_messages) + 1:])
+        self.turns.append({
+            "question_tokens": question_tokens,
+            "prompt_tokens": prompt_tokens,
+            "reply_tokens": reply_tokens,
+            "total_tokens": self.total_tokens,
+            "trimmed_messages": trimmed,
+        })
+
+    def _question_tokens(self, question):
+        return count_message_tokens({"role": "user", "content": question}, self.model)
+
+    def _prompt_tokens(self, question_tokens, extra_tokens):
+        return self.total_tokens + question_tokens + extra_tokens + REPLY_PRIMING
+
+    def ask(self, question, chat_function=None, extra_tokens=0, **kwargs):
+        """
+        Sends a question with the budgeted context and records the reply.
+
+        Args:
+            question (str): The user's question.
+            chat_function (callable, optional): A function with the chat_context_function_bank signature. Defaults to chat_context_function_bank.
+            extra_tokens (int, optional): Tokens sent with every request on top of the messages, e.g. the function
+                schemas: count_schema_tokens(registry.schemas(), model). Defaults to 0.
+            **kwargs: Passed on to chat_function.
+
+        Returns:
+            str or None: The response from the GPT model, or None in case of an error.
+        """
+        if chat_function is None:
+            from .utils import chat_context_function_bank as chat_function
+        question_tokens = self._question_tokens(question)
+        trimmed = self.fit(question_tokens + extra_tokens)
+        prompt_tokens = self._prompt_tokens(question_tokens, extra_tokens)
+        context = list(self.messages)
+        response, messages = chat_function(question, context, model=self.model, **kwargs)
+        new_messages = messages[len(context):]
+        self.extend(new_messages)
+        self._record_turn(question_tokens, prompt_tokens, trimmed, new_messages)
+        return response
+
+    async def async_ask(self, question, chat_function=None, extra_tokens=0, **kwargs):
+        """
+        Async version of ask. chat_function defaults to async_chat_context_function_bank, and the 'summarize'
+        policy summarizes with async_single_question or an async summarizer.
+        """
+        if chat_function is None:
+            from .async_utils import async_chat_context_function_bank as chat_function
+        question_tokens = self._question_tokens(question)
+        trimmed = await self.async_fit(question_tokens + extra_tokens)
+        prompt_tokens = self._prompt_tokens(question_tokens, extra_tokens)
+        context = list(self.messages)
+        response, messages = await chat_function(question, context, model=self.model, **kwargs)
+        new_messages = messages[len(context):]
+        self.extend(new_messages)
+        self._record_turn(question_tokens, prompt_tokens, trimmed, new_messages)
+        return response
@@ -0,0 +1,127 @@
+
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from .executors import ThreadExecutor, effective_timeout, start_function, execute_function, async_execute_function
+
+_executor = None
+_executor_lock = threading.Lock()
+_executor_workers = 16
+_shared_executor = ThreadExecutor()
+
+
+def get_tool_executor():
+    """
+    Returns the thread pool shared by every parallel tool dispatch, creating it on first use.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_executor_workers, thread_name_prefix="openaiunlimitedfun-tool")
+    return _executor
+
+
+def set_tool_executor_workers(max_workers):
+    """
+    Sets the number of threads of the shared tool pool. The current pool finishes its work and is replaced.
+
+    Args:
+        max_workers (int): The number of tool calls that can run at the same time.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        executor, _executor = _executor, None
+        _executor_workers = max_workers
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+def _tool_message(tool_call, content):
+    return {"role": "tool", "tool_call_id": tool_call['id'], "content": str(content)}
+
+
+def _error_message(tool_call, error):
+    # Some exceptions, e.g. MemoryError from a worker over its memory limit, have no message
+    return _tool_message(tool_call, f"Error: {str(error) or type(error).__name__}")
+
+
+def _prepare_tool_call(tool_call, registry):
+    """
+    Returns the callable and parsed arguments of a tool call, raising if the function is not registered.
+    """
+    function_name = tool_call['function']['name']
+    function_to_call = registry.get_function(function_name)
+    if function_to_call is None:
+        raise ValueError(f"Function {function_name} not defined.")
+    return function_to_call, json.loads(tool_call['function']['arguments'] or '{}')
+
+
+def run_tool_calls(tool_calls, registry, timeout=None):
+    """
+    Runs the tool calls of one assistant message concurrently. Each function runs on the executor assigned to it
+    in the registry, functions without one run on the shared thread pool.
+    A tool that fails or exceeds its timeout returns an error message to the model instead of aborting the turn.
+
+    Args:
+        tool_calls (list): The tool_calls of the assistant message.
+        registry (FunctionRegistry): The registry holding the callables and their executors.
+        timeout (float, optional): Seconds each tool may run, on top of the executors' own timeouts. Defaults to None, no limit.
+
+    Returns:
+        list: One "tool" message per call, in the order of tool_calls.
+    """
+    if len(tool_calls) == 1 and timeout is None:
+        tool_call = tool_calls[0]
+        try:
+            function_args = json.loads(tool_call['function']['arguments'] or '{}')
+            return [_tool_message(tool_call, execute_function(registry, tool_call['function']['name'], function_args))]
+        except Exception as e:
+            return [_error_message(tool_call, e)]
+
+    started = []
+    for tool_call in tool_calls:
+        try:
+            function_name = tool_call['function']['name']
+            function_to_call, function_args = _prepare_tool_call(tool_call, registry)
+            executor = registry.get_executor(function_name) or _shared_executor
+            limit = effective_timeout(executor, timeout)
+            deadline = time.monotonic() + limit if limit is not None else None
+            started.append((executor, start_function(registry, function_name, function_to_call, function_args, executor), deadline, limit))
+        except Exception as e:
+            started.append(e)
+
+    # Every call was submitted at about the same time, so waiting for them in order only costs the slowest one
+    tool_messages = []
+    for tool_call, call in zip(tool_calls, started):
+        if isinstance(call, Exception):
+            tool_messages.append(_error_message(tool_call, call))
+            continue
+        executor, future, deadline, limit = call
+        try:
+            remaining = max(0, deadline - time.monotonic()) if deadline is not None else None
+            tool_messages.append(_tool_message(tool_call, future.result(timeout=remaining)))
+        except TimeoutError:
+            executor.cancel(future)
+            tool_messages.append(_tool_message(tool_call, f"Error: {tool_call['function']['name']} timed out after {limit} seconds"))
+        except Exception as e:
+            tool_messages.append(_error_message(tool_call, e))
+    return tool_messages
+
+
+async def async_run_tool_calls(tool_calls, registry, timeout=None):
+    """
+    Async version of run_tool_calls. Functions without an executor are awaited when they are coroutines
+    and run on the shared thread pool otherwise.
+    """
+    import asyncio
+
+    async def run(tool_call):
+        try:
+            function_args = json.loads(tool_call['function']['arguments'] or '{}')
+            return _tool_message(tool_call, await async_execute_function(registry, tool_call['function']['name'], function_args, timeout))
+        except Exception as e:
+            return _error_message(tool_call, e)
+
+    return list(await asyncio.gather(*[run(tool_call) for tool_call in tool_calls]))
@@ -0,0 +1,393 @@
+
+import time
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+from .schema import coerce_arguments
+from .instrumentation import get_instrumentation, time_function
+
+
+class FunctionExecutor:
+    """
+    Decides where a registered function runs. Assign one per function with FunctionRegistry.register(..., executor=...)
+    or FunctionRegistry.set_executor(); functions without one run inline, or on the shared tool pool when several
+    tool calls run in parallel.
+
+    Attributes:
+        timeout (float or None): Seconds a call may run before an error is returned to the model.
+    """
+
+    timeout = None
+
+    def submit(self, function, function_args):
+        """
+        Starts one call and returns a concurrent.futures.Future for its result.
+        """
+        raise NotImplementedError
+
+    def cancel(self, future):
+        """
+        Called when a call exceeded its timeout. The default only cancels calls that have not started.
+        """
+        future.cancel()
+
+    def shutdown(self, wait=True):
+        """
+        Releases the workers of the executor.
+        """
+
+
+class InlineExecutor(FunctionExecutor):
+    """
+    Runs the function on the calling thread. Timeouts cannot be enforced, the call has finished by the time it returns.
+    """
+
+    def submit(self, function, function_args):
+        future = Future()
+        try:
+            future.set_result(function(**function_args))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class ThreadExecutor(FunctionExecutor):
+    """
+    Runs the function on a thread pool, keeping the request thread free for I/O-bound functions.
+    A timed out call cannot be interrupted and keeps its thread until it returns. An executor with a max_workers or
+    a timeout therefore runs on a pool of its own, so its hung calls cannot take the threads of the shared tool pool.
+    """
+
+    def __init__(self, max_workers=None, timeout=None):
+        """
+        Args:
+            max_workers (int, optional): The size of a dedicated pool. Defaults to None, using the shared tool pool,
+                or a dedicated pool of the same size when a timeout is set.
+            timeout (float, optional): Seconds a call may run. Defaults to None, no limit.
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        from . import dispatch
+        if self.max_workers is None and self.timeout is None:
+            return dispatch.get_tool_executor()
+        if self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers or dispatch._executor_workers, thread_name_prefix="openaiunlimitedfun-function")
+        return self._pool
+
+    def submit(self, function, function_args):
+        return self._get_pool().submit(function, **function_args)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+
+def _limit_memory(memory_limit):
+    """
+    Caps the address space of a worker process.
+    """
+    if not memory_limit:
+        return
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    except (ImportError, ValueError, OSError) as e:
+        print(f"Error setting the memory limit of a function worker, running without it: {e}")
+
+
+def _process_worker(connection, memory_limit):
+    """
+    The loop of a worker process: runs the calls it receives and sends back (True, result) or (False, exception).
+    """
+    _limit_memory(memory_limit)
+    while True:
+        try:
+            call = connection.recv()
+        except EOFError:
+            return
+        except Exception as e:
+            # The function cannot be imported here
+            connection.send((False, e))
+            continue
+        if call is None:
+            return
+        function, function_args = call
+        try:
+            result = (True, function(**function_args))
+        except BaseException as e:
+            result = (False, e)
+        try:
+            connection.send(result)
+        except Exception as e:
+            # The result or the exception cannot be pickled
+            connection.send((False, RuntimeError(f"Error sending the result of {getattr(function, '__name__', function)}: {e}")))
+
+
+class _ProcessWorker:
+    """
+    One worker process of a ProcessExecutor and the thread feeding it calls from the executor's queue.
+    The process is started on the first call and started again after it was stopped.
+    """
+
+    def __init__(self, executor, tasks):
+        self.executor = executor
+        self.tasks = tasks
+        self.process = None
+        self.connection = None
+        self.future = None
+        self.stopped = False
+        self.idle = False
+        self.thread = threading.Thread(target=self._run, name="openaiunlimitedfun-process-worker", daemon=True)
+        self.thread.start()
+
+    def _start_process(self):
+        import multiprocessing
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_process_worker, args=(child_connection, self.executor.memory_limit), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def _close_process(self, stop=True):
+        """
+        Waits for the process to end, asking it to stop first, and returns its exit code.
+        """
+        if self.process is None:
+            return None
+        if stop:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+        self.process.join()
+        exitcode = self.process.exitcode
+        self.connection.close()
+        self.process = None
+        return exitcode
+
+    def stop(self, future):
+        """
+        Terminates the process if it is running the given call. Called with the executor's lock held.
+        """
+        if self.future is future and self.process is not None:
+            self.stopped = True
+            self.process.terminate()
+
+    def _run(self):
+        from concurrent.futures.process import BrokenProcessPool
+        while True:
+            with self.executor._lock:
+                self.idle = True
+            task = self.tasks.get()
+            with self.executor._lock:
+                self.idle = False
+            if task is None:
+                self._close_process()
+                return
+            future, function, function_args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.process is not None and not self.process.is_alive():
+                    # Stopped just as its previous call returned
+                    self._close_process(stop=False)
+                if self.process is None:
+                    self._start_process()
+                with self.executor._lock:
+                    self.future = future
+                    self.stopped = False
+                self.connection.send((function, function_args))
+                succeeded, value = self.connection.recv()
+            except BaseException as e:
+                with self.executor._lock:
+                    self.future = None
+                    stopped = self.stopped
+                if self.process is None or not (stopped or isinstance(e, (EOFError, OSError))):
+                    # The process could not be started or the call could not be sent, e.g. the function cannot be pickled
+                    future.set_exception(e)
+                    continue
+                exitcode = self._close_process(stop=False)
+                if stopped:
+                    future.set_exception(TimeoutError(f"{getattr(function, '__name__', function)} was stopped after its timeout"))
+                else:
+                    future.set_exception(BrokenProcessPool(f"The worker process running {getattr(function, '__name__', function)} exited with code {exitcode}"))
+                continue
+            with self.executor._lock:
+                self.future = None
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+class ProcessExecutor(FunctionExecutor):
+    """
+    Runs the function in worker processes, so CPU-bound functions scale across cores without holding the GIL
+    of the request path. The function and its arguments must be picklable, e.g. defined at module level.
+
+    A call that exceeds its timeout is stopped by terminating the worker process running it; calls running on the
+    other workers are not affected, and a fresh process takes over the next call.
+    """
+
+    def __init__(self, max_workers=None, timeout=None, memory_limit=None):
+        """
+        Args:
+            max_workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+            timeout (float, optional): Seconds a call may run. Defaults to None, no limit.
+            memory_limit (int, optional): The address space limit of each worker in bytes; calls exceeding it fail
+                with MemoryError. Only supported on Unix. Defaults to None, no limit.
+        """
+        import os
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._lock = threading.Lock()
+        self._tasks = queue.Queue()
+        self._workers = []
+
+    def submit(self, function, function_args):
+        future = Future()
+        with self._lock:
+            self._tasks.put((future, function, function_args))
+            # Workers are started as calls arrive, up to max_workers
+            if sum(worker.idle for worker in self._workers) < self._tasks.qsize() and len(self._workers) < self.max_workers:
+                self._workers.append(_ProcessWorker(self, self._tasks))
+        return future
+
+    def cancel(self, future):
+        if future.cancel():
+            return
+        with self._lock:
+            for worker in self._workers:
+                worker.stop(future)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker processes once the calls already submitted are done. Later calls start new ones.
+        """
+        with self._lock:
+            workers, self._workers = self._workers, []
+            tasks, self._tasks = self._tasks, queue.Queue()
+        for _ in workers:
+            tasks.put(None)
+        if wait:
+            for worker in workers:
+                worker.thread.join()
+
+
+_inline_executor = InlineExecutor()
+
+
+def effective_timeout(executor, timeout):
+    """
+    Returns the stricter of the executor's timeout and the per-request timeout.
+    """
+    timeouts = [value for value in (getattr(executor, 'timeout', None), timeout) if value is not None]
+    return min(timeouts) if timeouts else None
+
+
+def submit_function(executor, function_name, function, function_args):
+    """
+    Submits one call of a registered function to an executor and reports its latency when it finishes.
+    """
+    instrumentation = get_instrumentation()
+    start = time.perf_counter()
+    future = executor.submit(function, function_args)
+    future.add_done_callback(lambda done: instrumentation.record_function_latency(function_name, time.perf_counter() - start))
+    return future
+
+
+def start_function(registry, function_name, function_to_call, function_args, executor):
+    """
+    Starts one call of a registered function on an executor, answered from the function's memo when it has one.
+    The memo is keyed by the JSON arguments, the function receives them converted to its parameter types.
+    """
+    call_args = coerce_arguments(function_to_call, function_args)
+    memo = registry.get_memo(function_name)
+    if memo is None:
+        return submit_function(executor, function_name, function_to_call, call_args)
+    return memo.submit(function_args, lambda: submit_function(executor, function_name, function_to_call, call_args), function_name)
+
+
+def execute_function(registry, function_name, function_args, timeout=None):
+    """
+    Runs a registered function with the executor assigned to it, inline when it has none.
+    Memoized functions are answered from memory when they were called with the same arguments before.
+
+    Args:
+        registry (FunctionRegistry): The registry holding the callable and its executor.
+        function_name (str): The name the model called.
+        function_args (dict): The parsed arguments.
+        timeout (float, optional): Seconds the call may run, on top of the executor's own timeout. Defaults to None.
+
+    Returns:
+        The function's return value. Raises ValueError for unknown functions and TimeoutError on timeouts.
+    """
+    function_to_call = registry.get_function(function_name)
+    if function_to_call is None:
+        raise ValueError(f"Function {function_name} not defined.")
+    executor = registry.get_executor(function_name)
+    if executor is None and registry.get_memo(function_name) is None:
+        with time_function(function_name):
+            return function_to_call(**coerce_arguments(function_to_call, function_args))
+    executor = executor or _inline_executor
+    limit = effective_timeout(executor, timeout)
+    future = start_function(registry, function_name, function_to_call, function_args, executor)
+    try:
+        return future.result(timeout=limit)
+    except TimeoutError:
+        executor.cancel(future)
+        raise TimeoutError(f"{function_name} timed out after {limit} seconds")
+
+
+async def async_execute_function(registry, function_name, function_args, timeout=None):
+    """
+    Async version of execute_function. Without an executor, coroutine functions are awaited directly
+    and plain functions run on the shared tool pool, so the event loop is never blocked.
+    """
+    import asyncio
+    import inspect
+    import functools
+    function_to_call = registry.get_function(function_name)
+    if function_to_call is None:
+        raise ValueError(f"Function {function_name} not defined.")
+    executor = registry.get_executor(function_name)
+    memo = registry.get_memo(function_name)
+    limit = effective_timeout(executor, timeout)
+
+    async def run_inline():
+        call_args = coerce_arguments(function_to_call, function_args)
+        with time_function(function_name):
+            if inspect.iscoroutinefunction(function_to_call):
+                function_response = await function_to_call(**call_args)
+            else:
+                from .dispatch import get_tool_executor
+                function_response = await asyncio.get_running_loop().run_in_executor(get_tool_executor(), functools.partial(function_to_call, **call_args))
+            if inspect.isawaitable(function_response):
+                function_response = await function_response
+            return function_response
+
+    if executor is None and memo is None:
+        try:
+            return await asyncio.wait_for(run_inline(), limit)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{function_name} timed out after {limit} seconds")
+    if executor is None:
+        future = memo.submit(function_args, lambda: asyncio.ensure_future(run_inline()), function_name)
+    else:
+        future = start_function(registry, function_name, function_to_call, function_args, executor)
+    try:
+        # Shielded, a memoized call may be shared with other callers that have not timed out
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), limit)
+    except asyncio.TimeoutError:
+        if executor is not None:
+            executor.cancel(future)
+        raise TimeoutError(f"{function_name} timed out after {limit} seconds")
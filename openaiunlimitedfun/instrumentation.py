@@ -0,0 +1,320 @@
+
+import time
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Instrumentation:
+    """
+    The instrumentation interface called on the hot path. This base class does nothing and is the default,
+    so an uninstrumented request only pays for a few empty method calls.
+
+    Phases timed with span(): "registry" (loading and selecting schemas), "rate_limit_wait", "network",
+    "decode", "function" (user function execution) and "follow_up" (the completion after a function call).
+    Network spans carry the name of the endpoint the request went to as their "endpoint" attribute.
+    """
+
+    def span(self, phase, **attributes):
+        """
+        Returns a context manager timing one phase of a request.
+        """
+        return _NOOP_SPAN
+
+    def record_usage(self, model, usage):
+        """
+        Records the usage field of a completion: prompt_tokens, completion_tokens and total_tokens.
+        """
+
+    def record_retry(self, function_name):
+        """
+        Records that a request function is about to be retried.
+        """
+
+    def record_failover(self, endpoint_name):
+        """
+        Records that a request which failed or was rate limited on an endpoint is sent to the next one.
+        """
+
+    def record_cache(self, cache_name, hit):
+        """
+        Records a cache lookup.
+        """
+
+    def record_function_latency(self, function_name, seconds):
+        """
+        Records how long a registered function ran.
+        """
+
+    def record_error(self, phase, error):
+        """
+        Records an error that was caught and handled.
+        """
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _TimedSpan:
+    __slots__ = ('metrics', 'labels', 'start')
+
+    def __init__(self, metrics, labels):
+        self.metrics = metrics
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe("phase_seconds", self.labels, time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.metrics.increment("errors_total", self.labels)
+        return False
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (key + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for key, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsInstrumentation(Instrumentation):
+    """
+    Collects per-phase timings, token usage, retries, failovers, cache hits and function latency histograms
+    in memory and exports them in the Prometheus text format. Network timings and errors are labelled with the endpoint.
+    """
+
+    def __init__(self, namespace="openaiunlimitedfun", buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            namespace (str, optional): The prefix of every metric name. Defaults to "openaiunlimitedfun".
+            buckets (tuple, optional): The upper bounds, in seconds, of the histogram buckets.
+        """
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def increment(self, name, labels, amount=1):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            key = (name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def span(self, phase, **attributes):
+        endpoint = attributes.get("endpoint")
+        return _TimedSpan(self, (("phase", phase), ("endpoint", endpoint)) if endpoint else (("phase", phase),))
+
+    def record_usage(self, model, usage):
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                self.increment("tokens_total", (("model", model), ("kind", kind.split('_')[0])), usage[kind])
+
+    def record_retry(self, function_name):
+        self.increment("retries_total", (("function", function_name),))
+
+    def record_failover(self, endpoint_name):
+        self.increment("failovers_total", (("endpoint", endpoint_name),))
+
+    def record_cache(self, cache_name, hit):
+        self.increment("cache_requests_total", (("cache", cache_name), ("result", "hit" if hit else "miss")))
+
+    def record_function_latency(self, function_name, seconds):
+        self.observe("function_seconds", (("function", function_name),), seconds)
+
+    def record_error(self, phase, error):
+        self.increment("errors_total", (("phase", phase),))
+
+    def snapshot(self):
+        """
+        Returns a copy of every counter and histogram, keyed by (name, labels).
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {"count": histogram.count, "sum": histogram.sum, "buckets": dict(zip(self.buckets + (float('inf'),), histogram.counts))}
+                          for key, histogram in self._histograms.items()}
+        return {"counters": counters, "histograms": histograms}
+
+    def export_prometheus(self):
+        """
+        Returns every metric in the Prometheus text exposition format, ready to be served on a /metrics endpoint.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, labels in self._counters}):
+                lines.append(f"# TYPE {self.namespace}_{name} counter")
+                for (counter_name, labels), value in sorted(self._counters.items()):
+                    if counter_name == name:
+                        lines.append(f"{self.namespace}_{name}{_format_labels(labels)} {value}")
+            for name in sorted({name for name, labels in self._histograms}):
+                lines.append(f"# TYPE {self.namespace}_{name} histogram")
+                for (histogram_name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float('inf') else repr(bound)
+                        lines.append(f"{self.namespace}_{name}_bucket{_format_labels(labels, (('le', le),))} {cumulative}")
+                    lines.append(f"{self.namespace}_{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{self.namespace}_{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """
+    Reports spans and metrics through the OpenTelemetry API. Requires the opentelemetry-api package,
+    which is only imported when this class is instantiated.
+    """
+
+    def __init__(self, tracer=None, meter=None):
+        """
+        Args:
+            tracer (opentelemetry.trace.Tracer, optional): Defaults to the global tracer provider's tracer.
+            meter (opentelemetry.metrics.Meter, optional): Defaults to the global meter provider's meter.
+        """
+        from opentelemetry import trace, metrics
+        self.tracer = tracer or trace.get_tracer("openaiunlimitedfun")
+        self.meter = meter or metrics.get_meter("openaiunlimitedfun")
+        self._phase_seconds = self.meter.create_histogram("openaiunlimitedfun.phase.duration", unit="s")
+        self._function_seconds = self.meter.create_histogram("openaiunlimitedfun.function.duration", unit="s")
+        self._tokens = self.meter.create_counter("openaiunlimitedfun.tokens")
+        self._retries = self.meter.create_counter("openaiunlimitedfun.retries")
+        self._failovers = self.meter.create_counter("openaiunlimitedfun.failovers")
+        self._cache_requests = self.meter.create_counter("openaiunlimitedfun.cache.requests")
+        self._errors = self.meter.create_counter("openaiunlimitedfun.errors")
+
+    def span(self, phase, **attributes):
+        return _OpenTelemetrySpan(self, phase, attributes)
+
+    def record_usage(self, model, usage):
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                self._tokens.add(usage[kind], {"model": model, "kind": kind.split('_')[0]})
+
+    def record_retry(self, function_name):
+        self._retries.add(1, {"function": function_name})
+
+    def record_failover(self, endpoint_name):
+        self._failovers.add(1, {"endpoint": endpoint_name})
+
+    def record_cache(self, cache_name, hit):
+        self._cache_requests.add(1, {"cache": cache_name, "result": "hit" if hit else "miss"})
+
+    def record_function_latency(self, function_name, seconds):
+        self._function_seconds.record(seconds, {"function": function_name})
+
+    def record_error(self, phase, error):
+        self._errors.add(1, {"phase": phase, "error": type(error).__name__})
+
+
+class _OpenTelemetrySpan:
+    def __init__(self, instrumentation, phase, attributes):
+        self.instrumentation = instrumentation
+        self.phase = phase
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.context = self.instrumentation.tracer.start_as_current_span(f"openaiunlimitedfun.{self.phase}", attributes=self.attributes)
+        self.context.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        labels = {"phase": self.phase}
+        if "endpoint" in self.attributes:
+            labels["endpoint"] = self.attributes["endpoint"]
+        self.instrumentation._phase_seconds.record(time.perf_counter() - self.start, labels)
+        return self.context.__exit__(exc_type, exc_value, traceback)
+
+
+_instrumentation = Instrumentation()
+
+
+def get_instrumentation():
+    """
+    Returns the instrumentation every request function reports to. Defaults to the no-op Instrumentation.
+    """
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation):
+    """
+    Replaces the instrumentation. Pass None to go back to the no-op default.
+
+    Args:
+        instrumentation (Instrumentation or None): The instrumentation to use.
+    """
+    global _instrumentation
+    _instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+
+
+class _FunctionTimer:
+    __slots__ = ('instrumentation', 'function_name', 'span', 'start')
+
+    def __init__(self, instrumentation, function_name):
+        self.instrumentation = instrumentation
+        self.function_name = function_name
+        self.span = instrumentation.span("function", function=function_name)
+
+    def __enter__(self):
+        self.span.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.record_function_latency(self.function_name, time.perf_counter() - self.start)
+        return self.span.__exit__(exc_type, exc_value, traceback)
+
+
+def time_function(function_name):
+    """
+    Returns a context manager timing one run of a registered function, in a "function" span and in the
+    per-function latency histogram. Costs nothing when the no-op instrumentation is in use.
+
+    Args:
+        function_name (str): The name the model called the function by.
+    """
+    if type(_instrumentation) is Instrumentation:
+        return _NOOP_SPAN
+    return _FunctionTimer(_instrumentation, function_name)
+
+
+def record_retry(retry_state):
+    """
+    tenacity before_sleep callback that reports every retry of a request function.
+    """
+    _instrumentation.record_retry(getattr(retry_state.fn, '__name__', 'unknown'))
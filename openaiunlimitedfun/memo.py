@@ -0,0 +1,140 @@
+
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from .instrumentation import get_instrumentation
+
+
+def make_arguments_key(function_args):
+    """
+    Returns the canonical JSON of a function's arguments, so argument order and whitespace do not matter.
+    """
+    return json.dumps(function_args, sort_keys=True, separators=(',', ':'), default=str)
+
+
+class FunctionMemo:
+    """
+    Remembers the results of an idempotent registered function, keyed on its canonicalized arguments,
+    with LRU eviction and an optional TTL. Identical calls that arrive while the first one is still running
+    wait for it instead of running again. Failed calls are not remembered.
+
+    Results are shared between callers, so functions should not return objects that callers mutate.
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        """
+        Args:
+            max_size (int, optional): The maximum number of remembered results. Defaults to 1024.
+            ttl (float, optional): Seconds a result stays valid. Defaults to None, until it is evicted.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def submit(self, function_args, start, function_name=None):
+        """
+        Returns a concurrent.futures.Future for the result of a call, from memory when possible.
+
+        Args:
+            function_args (dict): The arguments of the call.
+            start (callable): Starts the call and returns a future, used on a miss.
+            function_name (str, optional): The function name reported to the instrumentation.
+
+        Returns:
+            concurrent.futures.Future: The result of the call.
+        """
+        key = make_arguments_key(function_args)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(entry[1])
+            elif key in self._pending:
+                self.shared += 1
+                future = self._pending[key]
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                future = None
+                shared = self._pending[key] = Future()
+                # A running future cannot be cancelled by one of the callers waiting on it
+                shared.set_running_or_notify_cancel()
+        get_instrumentation().record_cache(f"function:{function_name}", future is not None)
+        if future is not None:
+            return future
+
+        try:
+            call = start()
+        except BaseException as e:
+            call = Future()
+            call.set_exception(e)
+        call.add_done_callback(lambda done: self._finish(key, shared, done))
+        return shared
+
+    def _finish(self, key, shared, call):
+        error = call.exception() if not call.cancelled() else Exception("The function call was cancelled")
+        with self._lock:
+            self._pending.pop(key, None)
+            if error is None:
+                self._entries[key] = (time.monotonic() + self.ttl if self.ttl is not None else None, call.result())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        if error is None:
+            shared.set_result(call.result())
+        else:
+            shared.set_exception(error)
+
+    def clear(self):
+        """
+        Forgets every remembered result and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.shared = 0
+
+    def stats(self):
+        """
+        Returns the hit counters. shared counts calls that waited on an identical running call.
+
+        Returns:
+            dict: hits, shared, misses, hit_ratio and size.
+        """
+        with self._lock:
+            calls = self.hits + self.shared + self.misses
+            return {
+                "hits": self.hits,
+                "shared": self.shared,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.shared) / calls if calls else 0.0,
+                "size": len(self._entries),
+            }
+
+
+def memoize(max_size=1024, ttl=None):
+    """
+    Decorator marking a function as idempotent, so calls the model makes through a FunctionRegistry with the
+    same arguments are answered from memory. The function itself is returned unchanged, direct calls are not memoized.
+
+    Args:
+        max_size (int, optional): The maximum number of remembered results. Defaults to 1024.
+        ttl (float, optional): Seconds a result stays valid. Defaults to None, until it is evicted.
+
+    Returns:
+        callable: The decorator. The FunctionMemo is available as function.__memo__.
+    """
+    def decorator(function):
+        function.__memo__ = FunctionMemo(max_size=max_size, ttl=ttl)
+        return function
+    return decorator
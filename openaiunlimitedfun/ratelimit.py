@@ -0,0 +1,216 @@
+
+import re
+import time
+import threading
+from .tokens import REPLY_PRIMING, count_message_tokens, count_schema_tokens
+
+_duration_pattern = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_duration_units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def estimate_tokens(json_data):
+    """
+    Estimates the tokens a chat completion request counts against the tokens-per-minute limit,
+    i.e. the prompt tokens counted with tiktoken plus max_tokens when it is set.
+
+    Args:
+        json_data (dict): The request body.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    model = json_data.get("model", "")
+    tokens = REPLY_PRIMING
+    for message in json_data.get("messages", []):
+        tokens += count_message_tokens(message, model)
+    for key in ("functions", "tools"):
+        tokens += count_schema_tokens(json_data.get(key), model)
+    return tokens + (json_data.get("max_tokens") or 0)
+
+
+def parse_reset_duration(value):
+    """
+    Parses a rate-limit reset header such as "6m0s", "1s" or "20ms" into seconds.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    matches = _duration_pattern.findall(value)
+    if not matches:
+        return None
+    return sum(float(amount) * _duration_units[unit] for amount, unit in matches)
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously to `capacity` over one minute.
+    reserve() always takes the tokens, letting the level go negative, and returns how long the caller must wait
+    before sending. Callers are therefore served in arrival order without polling.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self):
+        return self.capacity / 60.0
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return -self.level / self.rate if self.level < 0 else 0.0
+
+    def sync(self, limit, remaining, now):
+        """
+        Aligns the bucket with the server's view from the rate-limit response headers. The reset headers are not
+        needed: they tell when the budget is full again, while the bucket refills continuously from the remaining level.
+        """
+        self._refill(now)
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter with a requests-per-minute and a tokens-per-minute budget per model.
+
+    Budgets can be set up front, per model or as defaults, and are learned and corrected from the
+    x-ratelimit-* response headers. While a model has no known budget, requests are not delayed and
+    prompt tokens are not counted. The limiter is safe to share between threads and event loops.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, limits=None):
+        """
+        Args:
+            requests_per_minute (int, optional): The default request budget for every model.
+            tokens_per_minute (int, optional): The default token budget for every model.
+            limits (dict, optional): Per-model budgets, {model: (requests_per_minute, tokens_per_minute)}.
+        """
+        self.default_limits = (requests_per_minute, tokens_per_minute)
+        self.limits = dict(limits or {})
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._blocked_until = {}
+
+    def set_limits(self, model, requests_per_minute=None, tokens_per_minute=None):
+        """
+        Sets the budgets of one model, replacing any learned from the response headers.
+        """
+        with self._lock:
+            self.limits[model] = (requests_per_minute, tokens_per_minute)
+            self._buckets.pop(model, None)
+
+    def _get_buckets(self, model):
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            requests_per_minute, tokens_per_minute = self.limits.get(model, self.default_limits)
+            buckets = [
+                TokenBucket(requests_per_minute) if requests_per_minute else None,
+                TokenBucket(tokens_per_minute) if tokens_per_minute else None,
+            ]
+            self._buckets[model] = buckets
+        return buckets
+
+    def reserve(self, json_data):
+        """
+        Reserves budget for a request and returns the number of seconds to wait before sending it.
+
+        Args:
+            json_data (dict): The request body.
+
+        Returns:
+            float: The delay in seconds, 0 if the request can go out immediately.
+        """
+        model = json_data.get("model", "")
+        with self._lock:
+            request_bucket, token_bucket = self._get_buckets(model)
+        tokens = estimate_tokens(json_data) if token_bucket is not None else 0
+        now = time.monotonic()
+        with self._lock:
+            delay = max(0.0, self._blocked_until.get(model, 0.0) - now)
+            if request_bucket is not None:
+                delay = max(delay, request_bucket.reserve(1, now))
+            if token_bucket is not None:
+                delay = max(delay, token_bucket.reserve(tokens, now))
+        return delay
+
+    def acquire(self, json_data):
+        """
+        Blocks until the request fits in the budget of its model.
+        """
+        delay = self.reserve(json_data)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def async_acquire(self, json_data):
+        """
+        Waits without blocking the event loop until the request fits in the budget of its model.
+        """
+        import asyncio
+        delay = self.reserve(json_data)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def update_from_headers(self, model, headers, status_code=None):
+        """
+        Adjusts the budgets of a model from the x-ratelimit-* headers of a response.
+        A 429 response blocks the model for the time of its retry-after header, one second without one.
+
+        Args:
+            model (str): The model the request was sent to.
+            headers (Mapping): The response headers.
+            status_code (int, optional): The response status code.
+        """
+        now = time.monotonic()
+        with self._lock:
+            buckets = self._get_buckets(model)
+            for position, kind in enumerate(("requests", "tokens")):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if limit is None and remaining is None:
+                    continue
+                if buckets[position] is None:
+                    if not limit:
+                        continue
+                    buckets[position] = TokenBucket(limit)
+                buckets[position].sync(
+                    float(limit) if limit else None,
+                    float(remaining) if remaining is not None else None,
+                    now,
+                )
+            if status_code == 429:
+                # Blocks the model even while its budgets are unknown, so a request sent again waits for the reset
+                retry_after = parse_reset_duration(headers.get("retry-after")) or 1.0
+                self._blocked_until[model] = max(self._blocked_until.get(model, 0.0), now + retry_after)
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter():
+    """
+    Returns the rate limiter shared by every request function, or None if rate limiting is disabled.
+    """
+    return _rate_limiter
+
+
+def set_rate_limiter(rate_limiter):
+    """
+    Replaces the shared rate limiter. Pass None to disable client-side rate limiting.
+
+    Args:
+        rate_limiter (RateLimiter or None): The limiter to use.
+    """
+    global _rate_limiter
+    _rate_limiter = rate_limiter
@@ -0,0 +1,332 @@
+
+import os
+import json
+import threading
+from .store import FunctionStore, FUNCTION_STORE_FILE, function_reference, resolve_reference, _schema_name
+
+# Files written by earlier versions, imported into the store the first time it is opened empty
+FUNCTION_LIST_FILE = "aiFunctionsPicklePkc.pkl"
+AVAILABLE_FUNCTIONS_FILE = "aiFunctionsPickleAvlbFuncs.pkl"
+
+
+class FunctionRegistry:
+    """
+    Holds function schemas and their callables in memory with O(1) lookup by name.
+
+    The registry mirrors a FunctionStore, the SQLite file written by manage_function_list and manage_available_functions.
+    refresh() reloads it only when it was written to since the last load, by this or any other process, and callables
+    are stored as importable references that are imported the first time they are used. persist() writes back only
+    what changed. All methods are safe to call from several threads at the same time.
+
+    Each function can be given a FunctionExecutor deciding where it runs (inline, thread pool or process pool).
+    Idempotent functions can be memoized, so repeated calls with the same arguments are answered from memory.
+    Executors and memos live in memory only and are not written to the store.
+    """
+
+    def __init__(self, store=FUNCTION_STORE_FILE, autoload=True):
+        """
+        Args:
+            store (str or FunctionStore, optional): The store or the path of its SQLite file. None keeps the registry
+                in memory only. Defaults to "aiFunctions.sqlite3" in the working directory.
+            autoload (bool, optional): If True, refresh() keeps the registry in sync with the store. Defaults to True.
+        """
+        self.store = FunctionStore(store) if isinstance(store, str) else store
+        self.autoload = autoload
+        self._lock = threading.RLock()
+        self._schemas = {}
+        self._references = {}
+        self._functions = {}
+        self._executors = {}
+        self._memos = {}
+        self._revision = None
+        self._legacy_files_checked = False
+        self._changed_schemas = set()
+        self._changed_functions = set()
+        self._removed = set()
+
+    def _import_legacy_files(self):
+        directory = os.path.dirname(os.path.abspath(self.store.path))
+        function_list_file = os.path.join(directory, FUNCTION_LIST_FILE)
+        available_functions_file = os.path.join(directory, AVAILABLE_FUNCTIONS_FILE)
+        if not (os.path.exists(function_list_file) or os.path.exists(available_functions_file)):
+            return
+        if self.store.is_empty() and not self.store.pickles_imported():
+            self.store.import_pickles(function_list_file, available_functions_file)
+
+    def refresh(self):
+        """
+        Reloads the schemas and function references from the store if it changed since the last load.
+        Functions registered here and not persisted yet are kept. Does nothing when autoload is disabled.
+        """
+        if not self.autoload or self.store is None:
+            return
+        if not self._legacy_files_checked:
+            # Checked once per registry, whether the import succeeds or not
+            self._legacy_files_checked = True
+            self._import_legacy_files()
+        if self.store.revision() == self._revision:
+            return
+        with self._lock:
+            revision, schemas, references = self.store.load()
+            loaded_schemas = dict(schemas)
+            for name in self._removed:
+                loaded_schemas.pop(name, None)
+                references.pop(name, None)
+            for name in self._changed_schemas:
+                loaded_schemas[name] = self._schemas[name]
+            # Callables already imported stay as long as their reference did not change
+            functions = {name: function for name, function in self._functions.items()
+                         if name in self._changed_functions or (name in references and references[name] == self._references.get(name))}
+            self._schemas = loaded_schemas
+            self._references = references
+            self._functions = functions
+            self._revision = revision
+
+    def persist(self):
+        """
+        Writes the schemas and callables registered or removed since the last persist() to the store, in one transaction.
+        Callables must be defined at module level, they are stored as references to their module.
+        """
+        if self.store is None:
+            return
+        with self._lock:
+            functions = {name: self._functions[name] for name in self._changed_functions}
+            revision = self.store.save([self._schemas[name] for name in self._changed_schemas], functions, self._removed)
+            for name, function in functions.items():
+                self._references[name] = function_reference(function)
+            self._changed_schemas.clear()
+            self._changed_functions.clear()
+            self._removed.clear()
+            self._written(revision)
+
+    def save(self, schemas=(), functions=None, replace_functions=False):
+        """
+        Writes schemas and callables straight to the store and registers them, leaving other changes that were not
+        persisted yet pending. Writing costs the same however many functions are stored: the store is not reloaded
+        afterwards unless another registry or process wrote to it in the meantime.
+
+        Args:
+            schemas (iterable, optional): Function schemas, dicts or JSON strings.
+            functions (dict, optional): Callables keyed by the name the model uses to call them.
+            replace_functions (bool, optional): If True, the stored callables not in `functions` are removed. Defaults to False.
+        """
+        schemas = [json.loads(schema) if isinstance(schema, str) else schema for schema in schemas]
+        functions = dict(functions or {})
+        with self._lock:
+            self.refresh()
+            revision = self.store.save(schemas, functions, replace_functions=replace_functions) if self.store is not None else None
+            for schema in schemas:
+                name = _schema_name(schema)
+                self._schemas[name] = schema
+                self._changed_schemas.discard(name)
+                self._removed.discard(name)
+            if replace_functions:
+                for name in [name for name in self._references if name not in functions and name not in self._changed_functions]:
+                    self._references.pop(name)
+                    self._functions.pop(name, None)
+            for name, function in functions.items():
+                self._functions[name] = function
+                if self.store is not None:
+                    self._references[name] = function_reference(function)
+                self._changed_functions.discard(name)
+                self._removed.discard(name)
+            self._written(revision)
+
+    def _written(self, revision):
+        """
+        Keeps the loaded revision after a write of this registry when no other write happened since the last load,
+        the registry then holds everything the store does. Otherwise the next refresh() reloads the store.
+        """
+        loaded = self._revision is not None and revision is not None and revision == self._revision + 1
+        self._revision = revision if loaded else None
+
+    def register_schema(self, schema):
+        """
+        Adds or replaces a function schema. JSON strings, such as the output of create_json_autoagent, are parsed first.
+
+        Args:
+            schema (dict or str): The function schema.
+        """
+        if isinstance(schema, str):
+            schema = json.loads(schema)
+        name = _schema_name(schema)
+        with self._lock:
+            self._schemas[name] = schema
+            self._changed_schemas.add(name)
+            self._removed.discard(name)
+
+    def register_function(self, function, name=None, executor=None, memoize=None):
+        """
+        Adds or replaces a callable that the model is allowed to call.
+
+        Args:
+            function (callable): The function to register.
+            name (str, optional): The name the model uses to call it. Defaults to function.__name__.
+            executor (FunctionExecutor, optional): Where the function runs. Defaults to None, keeping the current executor.
+            memoize (bool or FunctionMemo, optional): See register(). Defaults to None, keeping the current memo.
+        """
+        name = name or function.__name__
+        with self._lock:
+            self._functions[name] = function
+            self._changed_functions.add(name)
+            self._removed.discard(name)
+            if executor is not None:
+                self._executors[name] = executor
+            if memoize is not None:
+                self.set_memo(name, memoize)
+
+    def register(self, function, schema=None, executor=None, memoize=None):
+        """
+        Registers a callable together with its schema.
+
+        Args:
+            function (callable): The function to register.
+            schema (dict or str, optional): The function schema. Its name is used for the callable when given.
+            executor (FunctionExecutor, optional): Where the function runs, e.g. ProcessExecutor(timeout=30) for
+                CPU-bound functions. Defaults to None, running it inline.
+            memoize (bool or FunctionMemo, optional): True, or a FunctionMemo(max_size, ttl), remembers the results of an
+                idempotent function by arguments. Defaults to None, only functions decorated with @memoize are memoized.
+        """
+        if schema is None:
+            self.register_function(function, executor=executor, memoize=memoize)
+            return
+        if isinstance(schema, str):
+            schema = json.loads(schema)
+        with self._lock:
+            self.register_schema(schema)
+            self.register_function(function, name=schema.get('name'), executor=executor, memoize=memoize)
+
+    def set_executor(self, name, executor):
+        """
+        Assigns the executor a function runs on, for example one loaded from the store. Pass None to run it inline.
+
+        Args:
+            name (str): The name the model uses to call the function.
+            executor (FunctionExecutor or None): The executor.
+        """
+        with self._lock:
+            if executor is None:
+                self._executors.pop(name, None)
+            else:
+                self._executors[name] = executor
+
+    def get_executor(self, name):
+        """
+        Returns the executor assigned to the function registered under the given name, or None.
+        """
+        return self._executors.get(name)
+
+    def set_memo(self, name, memoize):
+        """
+        Turns memoization of a function on or off.
+
+        Args:
+            name (str): The name the model uses to call the function.
+            memoize (bool or FunctionMemo): True for a FunctionMemo with the default size and no TTL, a FunctionMemo
+                to choose them, or False to turn off the memo set here (one from @memoize still applies).
+        """
+        if memoize is True:
+            from .memo import FunctionMemo
+            memoize = FunctionMemo()
+        with self._lock:
+            if memoize:
+                self._memos[name] = memoize
+            else:
+                self._memos.pop(name, None)
+
+    def get_memo(self, name):
+        """
+        Returns the FunctionMemo of the function registered under the given name, set here or with @memoize, or None.
+        """
+        memo = self._memos.get(name)
+        if memo is None:
+            memo = getattr(self._functions.get(name), '__memo__', None)
+        return memo
+
+    def memo_stats(self):
+        """
+        Returns the hit counters of every memoized function, keyed by name.
+        """
+        with self._lock:
+            names = list(self._functions)
+        return {name: memo.stats() for name, memo in ((name, self.get_memo(name)) for name in names) if memo is not None}
+
+    def unregister(self, name):
+        """
+        Removes the schema and callable registered under the given name. persist() removes them from the store.
+        """
+        with self._lock:
+            self._schemas.pop(name, None)
+            self._functions.pop(name, None)
+            self._references.pop(name, None)
+            self._executors.pop(name, None)
+            self._memos.pop(name, None)
+            self._changed_schemas.discard(name)
+            self._changed_functions.discard(name)
+            self._removed.add(name)
+
+    def get_schema(self, name):
+        """
+        Returns the schema registered under the given name, or None.
+        """
+        return self._schemas.get(name)
+
+    def get_function(self, name):
+        """
+        Returns the callable registered under the given name, or None. Stored functions are imported on first use.
+        """
+        function = self._functions.get(name)
+        if function is None:
+            reference = self._references.get(name)
+            if reference is None:
+                return None
+            try:
+                function = resolve_reference(*reference)
+            except Exception as e:
+                print(f"Error importing function {name} from {reference[2] or reference[0]}: {e}")
+                return None
+            with self._lock:
+                if self._references.get(name) == reference:
+                    self._functions.setdefault(name, function)
+        return function
+
+    def schemas(self):
+        """
+        Returns a list of every registered schema, in registration order.
+        """
+        with self._lock:
+            return list(self._schemas.values())
+
+    def functions(self):
+        """
+        Returns a dictionary of every registered callable keyed by name, importing the stored ones.
+        """
+        with self._lock:
+            names = list(dict.fromkeys(list(self._references) + list(self._functions)))
+        functions = {name: self.get_function(name) for name in names}
+        return {name: function for name, function in functions.items() if function is not None}
+
+    def __contains__(self, name):
+        return name in self._functions or name in self._references
+
+    def __len__(self):
+        return len(self._schemas)
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_default_registry():
+    """
+    Returns the process-wide registry backed by the default store, creating it on first use.
+
+    Returns:
+        FunctionRegistry: The shared registry.
+    """
+    global _default_registry
+    if _default_registry is None:
+        with _default_registry_lock:
+            if _default_registry is None:
+                _default_registry = FunctionRegistry()
+    return _default_registry
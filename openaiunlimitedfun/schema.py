@@ -0,0 +1,435 @@
+
+import re
+import copy
+import enum
+import typing
+import inspect
+import datetime
+import threading
+import dataclasses
+from weakref import WeakKeyDictionary
+from .store import load_module_from_path
+
+_schema_cache = WeakKeyDictionary()
+_schema_cache_lock = threading.Lock()
+_coercion_cache = WeakKeyDictionary()
+
+_simple_types = {
+    str: {"type": "string"},
+    int: {"type": "integer"},
+    float: {"type": "number"},
+    bool: {"type": "boolean"},
+    bytes: {"type": "string"},
+    type(None): {"type": "null"},
+    datetime.datetime: {"type": "string", "format": "date-time"},
+    datetime.date: {"type": "string", "format": "date"},
+    datetime.time: {"type": "string", "format": "time"},
+}
+_array_types = (list, tuple, set, frozenset)
+
+_docstring_sections = re.compile(r'^\s*(Args|Arguments|Parameters|Params|Returns|Return|Yields|Raises|Examples?|Notes?)\s*:?\s*$', re.IGNORECASE)
+_docstring_param = re.compile(r'^\s*(?:-\s*)?\**(\w+)\s*(?:\(([^)]*)\))?\s*:\s*(.*)$')
+_sphinx_param = re.compile(r'^\s*:param\s+(?:[^:]*\s)?(\w+)\s*:\s*(.*)$')
+_sphinx_field = re.compile(r'^\s*:\w[^:]*:')
+
+
+def parse_docstring(docstring):
+    """
+    Extracts the description and the parameter descriptions from a docstring.
+    Understands Google style (Args:), the "- name (type): description" style used in this package and Sphinx (:param name:).
+
+    Args:
+        docstring (str): The docstring to parse.
+
+    Returns:
+        tuple: The description (str) and a dictionary of parameter descriptions.
+    """
+    if not docstring:
+        return "", {}
+    lines = inspect.cleandoc(docstring).splitlines()
+    description_lines = []
+    parameters = {}
+    section = None
+    current = None
+    parameter_indent = None
+    for line in lines:
+        sphinx = _sphinx_param.match(line)
+        if sphinx:
+            current = sphinx.group(1)
+            parameters[current] = sphinx.group(2).strip()
+            section = 'params'
+            continue
+        if _sphinx_field.match(line):
+            # Other Sphinx fields (:returns:, :raises ...:) end the description of the last parameter
+            section = 'other'
+            current = None
+            continue
+        header = _docstring_sections.match(line)
+        if header:
+            name = header.group(1).lower()
+            section = 'params' if name in ('args', 'arguments', 'parameters', 'params') else 'other'
+            current = None
+            parameter_indent = None
+            continue
+        if section is None:
+            if not line.strip() and description_lines:
+                section = 'other'
+            elif line.strip():
+                description_lines.append(line.strip())
+        elif section == 'params':
+            indent = len(line) - len(line.lstrip())
+            match = _docstring_param.match(line)
+            # A parameter starts at the indentation of the first one, deeper lines continue its description
+            if match and (parameter_indent is None or indent <= parameter_indent):
+                parameter_indent = indent
+                current = match.group(1)
+                parameters[current] = match.group(3).strip()
+            elif current and line.strip():
+                parameters[current] = (parameters[current] + " " + line.strip()).strip()
+    return " ".join(description_lines), parameters
+
+
+def _origin(annotation):
+    return getattr(annotation, '__origin__', None)
+
+
+def _args(annotation):
+    return getattr(annotation, '__args__', None) or ()
+
+
+def type_to_schema(annotation):
+    """
+    Converts a type annotation into a JSON schema.
+    Supports builtins, typing generics, Optional/Union, Literal, Enums, dataclasses and pydantic models.
+
+    Args:
+        annotation: The type annotation.
+
+    Returns:
+        dict: The JSON schema of the type, empty for Any or unknown types.
+    """
+    if annotation is inspect.Parameter.empty or annotation is typing.Any:
+        return {}
+    if annotation in _simple_types:
+        return dict(_simple_types[annotation])
+
+    origin = _origin(annotation)
+    if origin is typing.Union or type(annotation).__name__ == 'UnionType':
+        options = [option for option in _args(annotation) if option is not type(None)]
+        if len(options) == 1:
+            return type_to_schema(options[0])
+        return {"anyOf": [type_to_schema(option) for option in options]}
+    if str(origin) in ('typing.Literal', 'typing_extensions.Literal'):
+        values = list(_args(annotation))
+        schema = {"enum": values}
+        value_types = {type(value) for value in values}
+        if len(value_types) == 1 and value_types.pop() in _simple_types:
+            schema.update(_simple_types[type(values[0])])
+        return schema
+    if origin in _array_types:
+        schema = {"type": "array"}
+        item_types = [item for item in _args(annotation) if item is not Ellipsis]
+        if len(set(item_types)) == 1:
+            schema["items"] = type_to_schema(item_types[0])
+        return schema
+    if origin is dict:
+        schema = {"type": "object"}
+        arguments = _args(annotation)
+        if len(arguments) == 2 and type_to_schema(arguments[1]):
+            schema["additionalProperties"] = type_to_schema(arguments[1])
+        return schema
+
+    if inspect.isclass(annotation):
+        if issubclass(annotation, enum.Enum):
+            values = [member.value for member in annotation]
+            schema = {"enum": values}
+            value_types = {type(value) for value in values}
+            if len(value_types) == 1 and value_types.pop() in _simple_types:
+                schema.update(_simple_types[type(values[0])])
+            return schema
+        if dataclasses.is_dataclass(annotation):
+            return _dataclass_schema(annotation)
+        if hasattr(annotation, 'model_json_schema'):
+            return _inline_definitions(annotation.model_json_schema())
+        if hasattr(annotation, '__fields__') and hasattr(annotation, 'schema'):
+            return _inline_definitions(annotation.schema())
+        if issubclass(annotation, bool):
+            return {"type": "boolean"}
+        for simple_type in (str, int, float):
+            if issubclass(annotation, simple_type):
+                return dict(_simple_types[simple_type])
+        if issubclass(annotation, _array_types):
+            return {"type": "array"}
+        if issubclass(annotation, dict):
+            return {"type": "object"}
+    return {}
+
+
+def _inline_definitions(schema):
+    """
+    Replaces the $ref of a pydantic schema by the definitions they point to, since the schema is embedded below
+    the root where its $defs would be looked up. Recursive models keep their $ref and their definition stays in
+    $defs, which build_function_schema moves to the root of the parameters.
+    """
+    definitions = dict(schema.pop('definitions', None) or {})
+    definitions.update(schema.pop('$defs', None) or {})
+    recursive = {}
+
+    def resolve(node, stack):
+        if isinstance(node, list):
+            return [resolve(item, stack) for item in node]
+        if not isinstance(node, dict):
+            return node
+        reference = node.get('$ref')
+        if isinstance(reference, str) and reference.startswith(('#/$defs/', '#/definitions/')):
+            definition_name = reference.rsplit('/', 1)[1]
+            if definition_name in definitions:
+                siblings = {key: resolve(value, stack) for key, value in node.items() if key != '$ref'}
+                if definition_name in stack:
+                    if definition_name not in recursive:
+                        recursive[definition_name] = None
+                        recursive[definition_name] = resolve(definitions[definition_name], {definition_name})
+                    return dict(siblings, **{'$ref': '#/$defs/' + definition_name})
+                return dict(resolve(definitions[definition_name], stack | {definition_name}), **siblings)
+        return {key: resolve(value, stack) for key, value in node.items()}
+
+    schema = resolve(schema, frozenset())
+    if recursive:
+        schema['$defs'] = recursive
+    return schema
+
+
+def _hoist_definitions(node, definitions):
+    """
+    Moves every nested $defs to the definitions dictionary, so their #/$defs/ references resolve from the root.
+    """
+    if isinstance(node, dict):
+        definitions.update(node.pop('$defs', None) or {})
+        for value in node.values():
+            _hoist_definitions(value, definitions)
+    elif isinstance(node, list):
+        for item in node:
+            _hoist_definitions(item, definitions)
+
+
+def _type_hints(obj):
+    try:
+        return typing.get_type_hints(obj)
+    except Exception:
+        return getattr(obj, '__annotations__', {})
+
+
+def _dataclass_schema(cls):
+    hints = _type_hints(cls)
+    description, field_descriptions = parse_docstring(cls.__doc__ if cls.__doc__ and not cls.__doc__.startswith(cls.__name__ + '(') else "")
+    properties = {}
+    required = []
+    for field in dataclasses.fields(cls):
+        prop = type_to_schema(hints.get(field.name, field.type))
+        if field.name in field_descriptions:
+            prop["description"] = field_descriptions[field.name]
+        properties[field.name] = prop
+        if field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING:
+            required.append(field.name)
+    schema = {"type": "object", "properties": properties, "required": required}
+    if description:
+        schema["description"] = description
+    return schema
+
+
+def _json_default(value):
+    if isinstance(value, enum.Enum):
+        value = value.value
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)) and all(isinstance(item, (str, int, float, bool)) for item in value):
+        return list(value)
+    return None
+
+
+def build_function_schema(function, name=None, description=None):
+    """
+    Builds the JSON schema of a Python function from its signature, type hints, defaults and docstring,
+    without calling the model. Results are cached per function, every call returns a copy.
+
+    Args:
+        function (callable): The function to describe.
+        name (str, optional): The name the model uses to call it. Defaults to function.__name__.
+        description (str, optional): The function description. Defaults to the first paragraph of the docstring.
+
+    Returns:
+        dict: The function schema, in the format expected by manage_function_list and FunctionRegistry.
+    """
+    cacheable = name is None and description is None
+    if cacheable:
+        try:
+            with _schema_cache_lock:
+                cached = _schema_cache.get(function)
+        except TypeError:
+            cacheable = False  # Some callables, e.g. builtins, cannot be weakly referenced
+        else:
+            if cached is not None:
+                return copy.deepcopy(cached)
+
+    hints = _type_hints(function)
+    docstring_description, parameter_descriptions = parse_docstring(inspect.getdoc(function))
+    properties = {}
+    required = []
+    for parameter in inspect.signature(function).parameters.values():
+        if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD) or parameter.name in ('self', 'cls'):
+            continue
+        annotation = hints.get(parameter.name, parameter.annotation)
+        prop = type_to_schema(annotation)
+        if not prop and parameter.default is not parameter.empty and parameter.default is not None:
+            prop = type_to_schema(type(parameter.default))
+        if parameter.name in parameter_descriptions:
+            prop["description"] = parameter_descriptions[parameter.name]
+        if parameter.default is parameter.empty:
+            required.append(parameter.name)
+        else:
+            default = _json_default(parameter.default)
+            if default is not None:
+                prop["default"] = default
+        properties[parameter.name] = prop
+
+    schema = {
+        "name": name or function.__name__,
+        "description": description if description is not None else docstring_description,
+        "parameters": {
+            "type": "object",
+            "properties": properties,
+            "required": required,
+        },
+    }
+    definitions = {}
+    _hoist_definitions(properties, definitions)
+    if definitions:
+        schema["parameters"]["$defs"] = definitions
+    if cacheable:
+        # Callers get copies, so modifying a returned schema cannot change the cached one
+        with _schema_cache_lock:
+            _schema_cache[function] = copy.deepcopy(schema)
+    return schema
+
+
+def _needs_coercion(annotation):
+    """
+    Returns True when the JSON value of a parameter has to be converted before the function receives it.
+    """
+    if inspect.isclass(annotation) and _origin(annotation) is None:
+        return (issubclass(annotation, enum.Enum) or dataclasses.is_dataclass(annotation)
+                or hasattr(annotation, 'model_validate') or (hasattr(annotation, '__fields__') and hasattr(annotation, 'parse_obj')))
+    return any(_needs_coercion(argument) for argument in _args(annotation) if argument is not Ellipsis)
+
+
+def _coerce_value(annotation, value):
+    if value is None or not _needs_coercion(annotation):
+        return value
+    origin = _origin(annotation)
+    if origin is typing.Union or type(annotation).__name__ == 'UnionType':
+        for option in _args(annotation):
+            if _needs_coercion(option):
+                try:
+                    return _coerce_value(option, value)
+                except (TypeError, ValueError):
+                    continue
+        return value
+    if origin in _array_types and isinstance(value, list):
+        item_types = [item for item in _args(annotation) if item is not Ellipsis]
+        if len(set(item_types)) == 1:
+            items = [_coerce_value(item_types[0], item) for item in value]
+        elif len(item_types) == len(value):
+            items = [_coerce_value(item_type, item) for item_type, item in zip(item_types, value)]
+        else:
+            items = value
+        return items if origin is list else origin(items)
+    if origin is dict and isinstance(value, dict) and len(_args(annotation)) == 2:
+        return {key: _coerce_value(_args(annotation)[1], item) for key, item in value.items()}
+    if not inspect.isclass(annotation) or isinstance(value, annotation):
+        return value
+    if issubclass(annotation, enum.Enum):
+        return annotation(value)
+    if hasattr(annotation, 'model_validate'):
+        return annotation.model_validate(value)
+    if hasattr(annotation, 'parse_obj'):
+        return annotation.parse_obj(value)
+    if isinstance(value, dict):
+        hints = _type_hints(annotation)
+        return annotation(**{key: _coerce_value(hints.get(key), item) for key, item in value.items()})
+    raise TypeError(f"Expected an object for {annotation.__name__}, got {value!r}")
+
+
+def _coerced_parameters(function):
+    """
+    Returns the type hints of the parameters whose values need converting, cached per function.
+    """
+    try:
+        with _schema_cache_lock:
+            cached = _coercion_cache.get(function)
+    except TypeError:
+        cached, cacheable = None, False
+    else:
+        cacheable = True
+    if cached is not None:
+        return cached
+    try:
+        parameters = inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        parameters = {}
+    hints = _type_hints(function)
+    coerced = {name: hints[name] for name in parameters if name in hints and _needs_coercion(hints[name])}
+    if cacheable:
+        with _schema_cache_lock:
+            _coercion_cache[function] = coerced
+    return coerced
+
+
+def coerce_arguments(function, function_args):
+    """
+    Converts the JSON arguments of a model call to the types the function's signature asks for: Enum members,
+    dataclass instances and pydantic models, also inside lists, dicts and Optional. Other values are passed as they are.
+
+    Args:
+        function (callable): The function about to be called.
+        function_args (dict): The parsed arguments.
+
+    Returns:
+        dict: The arguments to call the function with. Raises ValueError or TypeError for values that do not convert.
+    """
+    coerced = _coerced_parameters(function)
+    if not coerced or not isinstance(function_args, dict):
+        return function_args
+    return {name: _coerce_value(coerced[name], value) if name in coerced else value for name, value in function_args.items()}
+
+
+def register_module_functions(module, registry=None, include_private=False, persist=False):
+    """
+    Builds schemas for every function defined in a module and registers them together with the callables,
+    the way manage_available_functions(function_location=...) discovers functions.
+
+    Args:
+        module (module or str): The module, or the path to the module file.
+        registry (FunctionRegistry, optional): The registry to fill. Defaults to the shared registry.
+        include_private (bool, optional): If True, functions starting with an underscore are registered too. Defaults to False.
+        persist (bool, optional): If True, the registry is written to its function store afterwards. Defaults to False.
+
+    Returns:
+        list: The schemas that were registered.
+    """
+    if registry is None:
+        from .registry import get_default_registry
+        registry = get_default_registry()
+    if isinstance(module, str):
+        # Imported once per modification of the file, under a name that lets a ProcessExecutor pickle its functions
+        module = load_module_from_path(module)
+    schemas = []
+    for function_name, function in inspect.getmembers(module, inspect.isfunction):
+        # Only the functions defined in the module, not the ones it imports
+        if function.__module__ != module.__name__ or (function_name.startswith('_') and not include_private):
+            continue
+        schema = build_function_schema(function)
+        registry.register(function, schema)
+        schemas.append(schema)
+    if persist:
+        registry.persist()
+    return schemas
@@ -0,0 +1,239 @@
+
+import re
+import math
+import json
+import hashlib
+import threading
+from collections import Counter
+
+# Acronyms are matched before capitalized words, so HTTPServer splits into HTTP and Server
+_word_pattern = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase words, breaking snake_case and camelCase identifiers apart.
+    """
+    return [word.lower() for word in _word_pattern.findall(text)]
+
+
+def schema_text(schema):
+    """
+    Returns the searchable text of a function schema: its name, description and parameter names and descriptions.
+    """
+    if not isinstance(schema, dict):
+        return str(schema)
+    parts = [schema.get('name', ''), schema.get('description', '')]
+    properties = (schema.get('parameters') or {}).get('properties') or {}
+    for name, parameter in properties.items():
+        parts.append(name)
+        if isinstance(parameter, dict):
+            parts.append(parameter.get('description', ''))
+    return " ".join(part for part in parts if part)
+
+
+def _schema_key(schema):
+    if isinstance(schema, dict) and 'name' in schema:
+        return schema['name']
+    return json.dumps(schema, sort_keys=True)
+
+
+def _text_hash(schema):
+    """
+    Returns a hash of the searchable text of a schema. Unlike the identity of the dict, it survives the registry
+    reloading its schemas from the store, so only schemas whose text changed are indexed or embedded again.
+    """
+    return hashlib.sha1(schema_text(schema).encode('utf-8')).hexdigest()
+
+
+class FunctionSelector:
+    """
+    Base class of the function schema selectors. A selector ranks the registered schemas against a question
+    and returns the top_k most relevant ones, so requests only carry the schemas that matter.
+    Any object with a select(question, schemas, top_k) method can be used as a selector.
+    """
+
+    def select(self, question, schemas, top_k):
+        """
+        Args:
+            question (str): The user's question.
+            schemas (list): Every registered schema.
+            top_k (int): The maximum number of schemas to return.
+
+        Returns:
+            list: The selected schemas, most relevant first.
+        """
+        raise NotImplementedError
+
+
+class BM25Selector(FunctionSelector):
+    """
+    Ranks schemas with BM25 over their names and descriptions.
+
+    The inverted index is updated incrementally: every call to select() indexes the schemas it has not seen yet
+    and drops the ones that are gone, so adding a function costs one document instead of a rebuild.
+    When fewer than top_k schemas share a word with the question, the rest is filled in registration order.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._documents = {}
+        self._lengths = {}
+        self._hashes = {}
+        self._postings = {}
+        self._total_length = 0
+
+    def add(self, schema):
+        """
+        Indexes a schema, replacing the previous version with the same name.
+        """
+        with self._lock:
+            self._add(_schema_key(schema), schema)
+
+    def remove(self, name):
+        """
+        Removes a schema from the index.
+        """
+        with self._lock:
+            self._remove(name)
+
+    def _add(self, key, schema, text_hash=None):
+        if key in self._documents:
+            self._remove(key)
+        term_counts = Counter(tokenize(schema_text(schema)))
+        self._documents[key] = schema
+        self._hashes[key] = text_hash or _text_hash(schema)
+        self._lengths[key] = sum(term_counts.values())
+        self._total_length += self._lengths[key]
+        for term, count in term_counts.items():
+            self._postings.setdefault(term, {})[key] = count
+
+    def _remove(self, key):
+        schema = self._documents.pop(key, None)
+        if schema is None:
+            return
+        self._total_length -= self._lengths.pop(key)
+        self._hashes.pop(key, None)
+        for term in set(tokenize(schema_text(schema))):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+
+    def _sync(self, schemas):
+        keys = set()
+        for schema in schemas:
+            key = _schema_key(schema)
+            keys.add(key)
+            if self._documents.get(key) is schema:
+                continue
+            text_hash = _text_hash(schema)
+            if self._hashes.get(key) == text_hash:
+                # Same text in a new dict, e.g. after the registry reloaded its store
+                self._documents[key] = schema
+            else:
+                self._add(key, schema, text_hash)
+        if len(keys) != len(self._documents):
+            for key in [key for key in self._documents if key not in keys]:
+                self._remove(key)
+
+    def scores(self, question):
+        """
+        Returns the BM25 score of every indexed schema that shares at least one word with the question.
+        """
+        document_count = len(self._documents)
+        if not document_count:
+            return {}
+        average_length = self._total_length / document_count
+        scores = {}
+        for term in set(tokenize(question)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, count in postings.items():
+                normalization = self.k1 * (1 - self.b + self.b * self._lengths[key] / average_length)
+                scores[key] = scores.get(key, 0.0) + idf * count * (self.k1 + 1) / (count + normalization)
+        return scores
+
+    def select(self, question, schemas, top_k):
+        with self._lock:
+            self._sync(schemas)
+            scores = self.scores(question)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        by_key = {_schema_key(schema): schema for schema in schemas}
+        selected = [by_key[key] for key in ranked if key in by_key]
+        if len(selected) < top_k:
+            # A question sharing no word with the bank must not leave the request without functions
+            chosen = set(ranked)
+            selected.extend([schema for key, schema in by_key.items() if key not in chosen][:top_k - len(selected)])
+        return selected
+
+
+class EmbeddingSelector(FunctionSelector):
+    """
+    Ranks schemas by cosine similarity between embeddings of the question and of each schema.
+    Schema embeddings are computed once and cached by name and text, only new or changed schemas are embedded,
+    in the same embed() call as the question. Embeddings of schemas that are gone are dropped.
+    """
+
+    def __init__(self, embed):
+        """
+        Args:
+            embed (callable): embed(texts) -> list of vectors, e.g. a call to an embeddings endpoint.
+        """
+        self.embed = embed
+        self._lock = threading.Lock()
+        self._embeddings = {}
+
+    def _lookup(self, schemas):
+        """
+        Returns the cached vectors of the schemas keyed by name, and the (key, schema, text hash) of the ones to embed.
+        """
+        vectors = {}
+        missing = []
+        for schema in schemas:
+            key = _schema_key(schema)
+            entry = self._embeddings.get(key)
+            if entry is not None and entry[0] is schema:
+                vectors[key] = entry[2]
+                continue
+            text_hash = _text_hash(schema)
+            if entry is not None and entry[1] == text_hash:
+                # Same text in a new dict, e.g. after the registry reloaded its store
+                self._embeddings[key] = (schema, text_hash, entry[2])
+                vectors[key] = entry[2]
+            else:
+                missing.append((key, schema, text_hash))
+        keys = set(vectors).union(key for key, schema, text_hash in missing)
+        if len(self._embeddings) > len(keys):
+            for key in [key for key in self._embeddings if key not in keys]:
+                del self._embeddings[key]
+        return vectors, missing
+
+    def select(self, question, schemas, top_k):
+        import numpy as np
+
+        def normalized(vector):
+            vector = np.asarray(vector, dtype=float)
+            return vector / (np.linalg.norm(vector) or 1.0)
+
+        if not schemas:
+            return []
+        with self._lock:
+            vectors, missing = self._lookup(schemas)
+        # Embedding is a network call, other selections must not wait for it
+        embedded = self.embed([question] + [schema_text(schema) for key, schema, text_hash in missing])
+        query = normalized(embedded[0])
+        if missing:
+            with self._lock:
+                for (key, schema, text_hash), vector in zip(missing, embedded[1:]):
+                    vectors[key] = normalized(vector)
+                    self._embeddings[key] = (schema, text_hash, vectors[key])
+        matrix = np.stack([vectors[_schema_key(schema)] for schema in schemas])
+        similarities = matrix @ query
+        ranked = np.argsort(-similarities)[:top_k]
+        return [schemas[index] for index in ranked]
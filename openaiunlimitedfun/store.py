@@ -0,0 +1,275 @@
+
+import os
+import sys
+import json
+import hashlib
+import inspect
+import threading
+import importlib
+import importlib.util
+
+FUNCTION_STORE_FILE = "aiFunctions.sqlite3"
+_PATH_MODULE_PREFIX = "openaiunlimitedfun_functions_"
+
+_path_modules = {}
+_path_locks = {}
+_path_modules_lock = threading.Lock()
+
+
+def _schema_name(schema):
+    """
+    Returns the name used to index a function schema.
+    """
+    if isinstance(schema, dict) and 'name' in schema:
+        return schema['name']
+    return repr(schema)
+
+
+def function_reference(function):
+    """
+    Returns the importable reference of a function: its module, qualified name and, for modules that cannot be
+    imported by name (scripts, files loaded from a path), the source file.
+
+    Args:
+        function (callable): A function defined at module level.
+
+    Returns:
+        tuple: (module, qualname, path), path being None for importable modules.
+    """
+    module_name = getattr(function, '__module__', None)
+    qualname = getattr(function, '__qualname__', None)
+    if not module_name or not qualname or '<' in qualname:
+        raise ValueError(f"{function!r} cannot be stored by reference, define it at module level")
+    module = sys.modules.get(module_name)
+    if module_name != '__main__' and module is not None and getattr(module, '__spec__', None) is not None and not module_name.startswith(_PATH_MODULE_PREFIX):
+        if _resolve_qualname(module, qualname) is function:
+            return module_name, qualname, None
+    try:
+        path = os.path.abspath(inspect.getsourcefile(function) or inspect.getfile(function))
+    except TypeError:
+        path = None
+    if not path or not os.path.exists(path):
+        raise ValueError(f"{function!r} cannot be stored by reference, its module is not importable and has no source file")
+    return module_name, qualname, path
+
+
+def _resolve_qualname(module, qualname):
+    value = module
+    for part in qualname.split('.'):
+        value = getattr(value, part, None)
+        if value is None:
+            return None
+    return value
+
+
+def _main_module(path):
+    """
+    Returns the running script if it is the file at path, or None.
+    """
+    main = sys.modules.get('__main__')
+    main_file = getattr(main, '__file__', None)
+    if main_file and os.path.abspath(main_file) == path:
+        return main
+    return None
+
+
+def load_module_from_path(path):
+    """
+    Imports a module from a file once per modification of the file. The module is added to sys.modules under a
+    name derived from its path, so its functions can be pickled, e.g. for a ProcessExecutor.
+    The running script is returned as is instead of being executed a second time.
+    """
+    path = os.path.abspath(path)
+    main = _main_module(path)
+    if main is not None:
+        return main
+    mtime = os.stat(path).st_mtime_ns
+    with _path_modules_lock:
+        path_lock = _path_locks.setdefault(path, threading.RLock())
+    # The module code runs under a lock of its own path only; like a regular import, a module loading
+    # itself while it runs gets the partially initialized module
+    with path_lock:
+        cached = _path_modules.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        name = _PATH_MODULE_PREFIX + hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        _path_modules[path] = (mtime, module)
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            sys.modules.pop(name, None)
+            _path_modules.pop(path, None)
+            raise
+        return module
+
+
+def resolve_reference(module_name, qualname, path=None):
+    """
+    Imports the function a reference points to.
+
+    Returns:
+        callable: The function. Raises ImportError or AttributeError when it no longer exists.
+    """
+    module = load_module_from_path(path) if path else importlib.import_module(module_name)
+    function = _resolve_qualname(module, qualname)
+    if function is None:
+        raise AttributeError(f"{module_name} has no function {qualname}")
+    return function
+
+
+class FunctionStore:
+    """
+    Persists function schemas as JSON and callables as importable references in an SQLite file.
+
+    Every write touches only the rows it changes inside one transaction, so registering a function costs the same
+    with ten or ten thousand functions stored, and several processes can write at the same time without losing
+    each other's changes. A revision counter, bumped by every write, lets readers skip reloading when nothing changed.
+    """
+
+    def __init__(self, path=FUNCTION_STORE_FILE):
+        """
+        Args:
+            path (str, optional): The SQLite file. Defaults to "aiFunctions.sqlite3" in the working directory.
+        """
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS schemas (name TEXT PRIMARY KEY, schema TEXT NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS functions (name TEXT PRIMARY KEY, module TEXT NOT NULL, qualname TEXT NOT NULL, path TEXT)")
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0)")
+            self._local.connection = connection
+        return connection
+
+    def _write(self, statements):
+        """
+        Runs (sql, parameters) pairs and bumps the revision in one transaction. Returns the new revision.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, parameters in statements:
+                connection.executemany(sql, parameters)
+            connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+            revision = connection.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return revision
+
+    def revision(self):
+        """
+        Returns a number that changes whenever any process writes to the store.
+        """
+        return self._connection().execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def save(self, schemas=(), functions=None, removed=(), imported_pickles=False, replace_functions=False):
+        """
+        Adds or replaces schemas and functions and removes names, all in one transaction.
+
+        Args:
+            schemas (iterable, optional): Function schemas (dicts).
+            functions (dict, optional): Callables keyed by the name the model uses to call them.
+            removed (iterable, optional): Names whose schema and function are deleted.
+            imported_pickles (bool, optional): Also records that the pickle files were imported. Defaults to False.
+            replace_functions (bool, optional): If True, the stored functions are replaced by `functions` instead of
+                being updated with them; schemas are kept. Defaults to False.
+
+        Returns:
+            int: The revision of the store after the write.
+        """
+        references = [(name,) + function_reference(function) for name, function in (functions or {}).items()]
+        return self._write([
+            ("DELETE FROM functions", [()] if replace_functions else []),
+            ("DELETE FROM schemas WHERE name = ?", [(name,) for name in removed]),
+            ("DELETE FROM functions WHERE name = ?", [(name,) for name in removed]),
+            ("INSERT INTO schemas (name, schema) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET schema = excluded.schema",
+             [(_schema_name(schema), json.dumps(schema)) for schema in schemas]),
+            ("INSERT INTO functions (name, module, qualname, path) VALUES (?, ?, ?, ?) "
+             "ON CONFLICT(name) DO UPDATE SET module = excluded.module, qualname = excluded.qualname, path = excluded.path",
+             references),
+            ("INSERT OR IGNORE INTO meta (key, value) VALUES ('pickles_imported', 1)", [()] if imported_pickles else []),
+        ])
+
+    def load(self):
+        """
+        Reads every schema and function reference without importing anything.
+
+        Returns:
+            tuple: The revision, a list of (name, schema) in insertion order and a dictionary of name: (module, qualname, path).
+        """
+        connection = self._connection()
+        connection.execute("BEGIN")
+        try:
+            revision = connection.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+            schemas = [(name, json.loads(schema)) for name, schema in connection.execute("SELECT name, schema FROM schemas ORDER BY rowid")]
+            references = {name: (module, qualname, path) for name, module, qualname, path in connection.execute("SELECT name, module, qualname, path FROM functions")}
+        finally:
+            connection.execute("COMMIT")
+        return revision, schemas, references
+
+    def is_empty(self):
+        connection = self._connection()
+        return connection.execute("SELECT NOT EXISTS (SELECT 1 FROM schemas) AND NOT EXISTS (SELECT 1 FROM functions)").fetchone()[0] == 1
+
+    def pickles_imported(self):
+        """
+        Returns True once import_pickles() ran on this store, whatever it managed to import.
+        """
+        connection = self._connection()
+        return connection.execute("SELECT 1 FROM meta WHERE key = 'pickles_imported'").fetchone() is not None
+
+    def import_pickles(self, function_list_file, available_functions_file):
+        """
+        Copies the schemas and functions of the pickle files written by earlier versions into the store, once.
+        A file that cannot be unpickled, e.g. functions pickled from another script's __main__, and functions that
+        cannot be stored by reference are skipped with a message; the rest is still imported.
+
+        Returns:
+            int: The number of schemas and functions imported.
+        """
+        import pickle
+        schemas = []
+        functions = {}
+        if os.path.exists(function_list_file):
+            try:
+                with open(function_list_file, 'rb') as file:
+                    schemas = [json.loads(schema) if isinstance(schema, str) else schema for schema in pickle.load(file)]
+            except Exception as e:
+                print(f"Error importing the function list from {function_list_file}: {e}")
+        if os.path.exists(available_functions_file):
+            try:
+                with open(available_functions_file, 'rb') as file:
+                    available_functions = dict(pickle.load(file))
+            except Exception as e:
+                print(f"Error importing the available functions from {available_functions_file}: {e}")
+                available_functions = {}
+            for name, function in available_functions.items():
+                try:
+                    function_reference(function)
+                    functions[name] = function
+                except ValueError as e:
+                    print(f"Error importing {name} from {available_functions_file}: {e}")
+        self.save(schemas, functions, imported_pickles=True)
+        return len(schemas) + len(functions)
+
+    def close(self):
+        """
+        Closes the connection of the calling thread.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
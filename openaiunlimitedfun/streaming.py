@@ -0,0 +1,95 @@
+
+class _JsonCompletionTracker:
+    """
+    Follows the nesting of a JSON document fed in pieces, so a streamed argument string is known to be complete
+    as soon as its closing brace arrives instead of after the whole response.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.complete = False
+
+    def feed(self, text):
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+                self.started = True
+            elif char in '}]':
+                self.depth -= 1
+                if self.started and self.depth == 0:
+                    self.complete = True
+        return self.complete
+
+
+class StreamAccumulator:
+    """
+    Builds up a streamed chat completion chunk by chunk: the content, the function call name and its arguments.
+    """
+
+    def __init__(self):
+        self.content_parts = []
+        self.function_name = None
+        self.argument_parts = []
+        self.finish_reason = None
+        self._arguments_tracker = _JsonCompletionTracker()
+
+    def feed(self, chunk):
+        """
+        Adds a completion chunk.
+
+        Args:
+            chunk (dict): A decoded chunk of a streamed chat completion.
+
+        Returns:
+            str or None: The content delta carried by the chunk, if any.
+        """
+        choices = chunk.get("choices") or []
+        if not choices:
+            return None
+        choice = choices[0]
+        if choice.get("finish_reason"):
+            self.finish_reason = choice["finish_reason"]
+        delta = choice.get("delta") or {}
+        function_call = delta.get("function_call")
+        if function_call:
+            if function_call.get("name"):
+                self.function_name = (self.function_name or "") + function_call["name"]
+            if function_call.get("arguments"):
+                self.argument_parts.append(function_call["arguments"])
+                self._arguments_tracker.feed(function_call["arguments"])
+        content = delta.get("content")
+        if content:
+            self.content_parts.append(content)
+        return content or None
+
+    @property
+    def content(self):
+        return "".join(self.content_parts) or None
+
+    @property
+    def arguments(self):
+        return "".join(self.argument_parts)
+
+    def function_call_ready(self):
+        """
+        Returns True once the function call name and complete arguments have been received.
+        """
+        return self.function_name is not None and (self._arguments_tracker.complete or self.finish_reason is not None)
+
+    def function_call(self):
+        """
+        Returns the function call in the same shape as a non-streamed assistant message.
+        """
+        return {"name": self.function_name, "arguments": self.arguments}
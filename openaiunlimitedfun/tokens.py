@@ -0,0 +1,86 @@
+
+import json
+import threading
+
+# Per-message overhead of the chat format, and the tokens priming every reply (<|start|>assistant<|message|>)
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(model):
+    """
+    Returns the tiktoken encoding for a model, cached per model. Unknown models use cl100k_base.
+    Returns None if tiktoken or its encoding files are unavailable, e.g. when offline.
+    """
+    if model in _encodings:
+        return _encodings[model]
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"Error loading tiktoken encoding for {model}, estimating tokens from length instead: {e}")
+                encoding = None
+            _encodings[model] = encoding
+    return _encodings[model]
+
+
+def count_tokens(text, model=""):
+    """
+    Counts the tokens of a string with tiktoken, or estimates them as one token per 4 characters without it.
+
+    Args:
+        text (str): The text to count.
+        model (str, optional): The model whose encoding is used.
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(message, model=""):
+    """
+    Counts the tokens a single chat message adds to a prompt, including the per-message overhead.
+
+    Args:
+        message (dict): The chat message.
+        model (str, optional): The model whose encoding is used.
+
+    Returns:
+        int: The number of tokens.
+    """
+    tokens = MESSAGE_OVERHEAD
+    for value in message.values():
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        tokens += count_tokens(value, model)
+    return tokens
+
+
+def count_schema_tokens(schemas, model=""):
+    """
+    Counts the tokens the functions or tools payload of a request adds to its prompt.
+
+    Args:
+        schemas (list): The function schemas or tools sent with the request.
+        model (str, optional): The model whose encoding is used.
+
+    Returns:
+        int: The number of tokens, 0 for no schemas.
+    """
+    if not schemas:
+        return 0
+    return count_tokens(json.dumps(schemas), model)
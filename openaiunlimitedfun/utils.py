@@ -1,19 +1,20 @@
 
-import os
 import json
-import requests
-from tenacity import retry, stop_after_attempt, wait_random_exponential
-from dotenv import load_dotenv, find_dotenv
-import pickle
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 import inspect
-import sys
-import importlib.util
-import openai
 from pathlib import Path
-# Load environment variables from .env file
-# env_path = Path('.') / '.env'
-# load_dotenv(dotenv_path=env_path)
-load_dotenv(find_dotenv())
+from .client import post_chat_completion, chat_completion, openai_chat_completion, stream_chat_completion, decode_response, is_retryable_error
+from .registry import get_default_registry
+from .store import function_reference, load_module_from_path
+from .streaming import StreamAccumulator
+from .dispatch import run_tool_calls
+from .instrumentation import get_instrumentation, record_retry
+from .executors import execute_function
+# The .env file is loaded lazily by the client the first time the configuration is read
+
+# Retries one request on connection errors, 429 and 5xx responses, other errors are raised at once. Only requests
+# are retried, never a whole turn, so registered functions are not run twice. Works on coroutine functions too.
+_retrying = retry(retry=retry_if_exception(is_retryable_error), wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3), before_sleep=record_retry, reraise=True)
 
 def set_openai_api_key(api_key, env_file_path=None):
     """
@@ -26,7 +27,8 @@ def set_openai_api_key(api_key, env_file_path=None):
     """
     if env_file_path is None:
         # If no specific path provided, try to find the .env file
-        env_file_path = find_dotenv() if find_dotenv() else '.env'
+        from dotenv import find_dotenv
+        env_file_path = find_dotenv(usecwd=True) or '.env'
     
     env_path = Path(env_file_path)
     api_key_entry = f'OPENAI_API_KEY={api_key}\n'
@@ -57,24 +59,23 @@ def set_openai_api_key(api_key, env_file_path=None):
 
 def manage_available_functions(retrieve=True, function_location=None):
     """
-    Manages the available functions by either retrieving them from a pickle file or saving them to the pickle file.
+    Manages the available functions by either retrieving them from the function store or saving them to it.
+    Functions are stored as references to their module and imported when they are first called.
 
     Args:
-        retrieve (bool, optional): If True, retrieves the available functions from the pickle file. If False, saves the available functions to the pickle file. Defaults to True.
+        retrieve (bool, optional): If True, retrieves the available functions from the function store. If False, saves the available functions to the function store, replacing the ones saved before. Defaults to True.
         function_location (str, optional): The path to the module containing the functions. Only used when retrieve is False. Defaults to None.
 
     Returns:
         dict or None: If retrieve is True, returns a dictionary of available functions. If retrieve is False, returns None.
     """
-    pickle_file = 'aiFunctionsPickleAvlbFuncs.pkl'
+    registry = get_default_registry()
 
     if not retrieve:
         if function_location:
             try:
-                # Dynamically load the module from the given path
-                spec = importlib.util.spec_from_file_location("module.name", function_location)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
+                # Load the module from the given path, functions are stored with a reference to this file
+                module = load_module_from_path(function_location)
             except Exception as e:
                 print(f"Error loading module from path {function_location}: {e}")
                 # Inspect the caller's module in case of error
@@ -83,55 +84,85 @@ def manage_available_functions(retrieve=True, function_location=None):
             # Inspect the caller's module
             module = inspect.getmodule(inspect.currentframe().f_back)
 
-        available_functions = {name: obj for name, obj in inspect.getmembers(module, inspect.isfunction)
-                               if inspect.getmodule(obj) == module}
+        available_functions = {}
+        for name, obj in inspect.getmembers(module, inspect.isfunction):
+            if obj.__module__ != module.__name__:
+                continue
+            try:
+                function_reference(obj)
+                available_functions[name] = obj
+            except ValueError as e:
+                print(f"Error saving function {name}: {e}")
 
-        with open(pickle_file, 'wb') as file:
-            pickle.dump(available_functions, file)
+        # Replaces the stored functions, so the ones removed from the module are no longer available
+        registry.save(functions=available_functions, replace_functions=True)
         return None
 
     else:
-        if os.path.exists(pickle_file):
-            with open(pickle_file, 'rb') as file:
-                available_functions = pickle.load(file)
-            return available_functions
-        else:
-            return {}
+        registry.refresh()
+        return registry.functions()
 
 
 def manage_function_list(function_to_add=None, retrieve=True):
     """
-    Manages a list of functions stored in a pickle file.
+    Manages the list of function schemas stored in the function store.
 
     Args:
-        function_to_add: The function to add to the list (default: None).
+        function_to_add: The function schema to add to the list, a dict or a JSON string (default: None).
         retrieve: A boolean indicating whether to retrieve the list (default: True).
 
     Returns:
         If retrieve is True, returns the list of functions.
         If retrieve is False, returns None.
     """
-    pickle_file = "aiFunctionsPicklePkc.pkl"
-
-    # Check if the pickle file exists and load or initialize the function list
-    if os.path.exists(pickle_file):
-        with open(pickle_file, 'rb') as file:
-            functions_list = pickle.load(file)
-    else:
-        functions_list = []
+    registry = get_default_registry()
 
-    # Add a new function to the list if provided
+    # Add a new function to the store if provided, replacing the schema with the same name
     if function_to_add is not None:
-        functions_list.append(function_to_add)
-        with open(pickle_file, 'wb') as file:
-            pickle.dump(functions_list, file)
+        registry.save([function_to_add])
 
     # Return the list if retrieve is True, otherwise return None
-    return functions_list if retrieve else None
+    if not retrieve:
+        return None
+    registry.refresh()
+    return registry.schemas()
+
+
+def _select_schemas(registry, question, function_selector, top_k):
+    """
+    Returns the registry to use and the function schemas to send with a question.
+    """
+    with get_instrumentation().span("registry"):
+        if registry is None:
+            registry = get_default_registry()
+        registry.refresh()
+        functions = registry.schemas()
+        if function_selector is not None and len(functions) > top_k:
+            functions = function_selector.select(question, functions, top_k)
+    return registry, functions
+
+
+@_retrying
+def _completion_message(json_data):
+    """
+    Sends a chat completion request and returns the assistant message of the reply. Raises on any error.
+    """
+    response = post_chat_completion(json_data)
+    response.raise_for_status()
+    return decode_response(response, json_data.get("model", ""))["choices"][0]["message"]
+
+
+def _function_response_message(function_response):
+    """
+    Returns the hidden user message that hands a function's return value back to the model.
+    """
+    return {
+        "role": "user",
+        "content": f"This is a hidden system message that just shows you what the function returned, answer the previous user message given that this is what it evaluated to, only pay attention to the values not the prompt I am giving you now: {function_response}"
+    }
 
 
-@retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3))
-def chat_context_function_bank(question, context, model="gpt-3.5-turbo-0613", function_call='auto'):
+def chat_context_function_bank(question, context, model="gpt-3.5-turbo-0613", function_call='auto', registry=None, function_selector=None, top_k=10):
     """
     Sends a question to the GPT model and executes a function call based on the response.
     The function call is determined by the model's response or by the most relevant function found in the available functions.
@@ -141,15 +172,13 @@ def chat_context_function_bank(question, context, model="gpt-3.5-turbo-0613", fu
     - context (list, optional): A list of previous messages for context. Defaults to None.
     - model (str, optional): The GPT model to be used. Defaults to "gpt-3.5-turbo-0613".
     - function_call (str, optional): The type of function call to execute. Defaults to 'auto'.
+    - registry (FunctionRegistry, optional): The registry holding the function schemas and callables. Defaults to the shared registry backed by the function store.
+    - function_selector (FunctionSelector, optional): Ranks the registered schemas against the question so only the top_k most relevant are sent. Defaults to None, sending all of them.
+    - top_k (int, optional): The number of schemas the function_selector keeps. Defaults to 10.
 
     Returns:
     - str or None: The response from the GPT model or the output of the executed function, or None in case of an error.
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": "Bearer " + api_key,
-    }
     
     messages = [{"role": "user", "content": question}]
     if context:
@@ -159,16 +188,14 @@ def chat_context_function_bank(question, context, model="gpt-3.5-turbo-0613", fu
 
     json_data = {"model": model, "messages": messages}
     # print(df)
-    functions = manage_function_list(retrieve=True)
-    available_functions = manage_available_functions(retrieve=True)
-    if functions is not None and not []: ##if functions empty this gives error
+    registry, functions = _select_schemas(registry, question, function_selector, top_k)
+    if functions: ##if functions empty this gives error
         json_data.update({"functions": functions})
-    if function_call is not None and functions != []:
+    if function_call is not None and functions:
         json_data.update({"function_call": function_call})
     # print('FUNCTIONS:', functions)
     try:
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=json_data)
-        assistant_message = response.json()["choices"][0]["message"]
+        assistant_message = _completion_message(json_data)
         # print('ASSISTANT', assistant_message['content'])
         if assistant_message['content']:
             # print('not none')
@@ -187,22 +214,17 @@ def chat_context_function_bank(question, context, model="gpt-3.5-turbo-0613", fu
             })
             context = messages
 
-            if function_name in available_functions:
-                function_response = available_functions[function_name](**function_args)
-                function_responses.append({
-                    "role": "user",
-                    "content": f"This is a hidden system message that just shows you what the function returned, answer the previous user message given that this is what it evaluated to, only pay attention to the values not the prompt I am giving you now: {function_response}"
-                })
-                messages.extend(function_responses)
-                context = messages
-            else:
-                raise ValueError(f"Function {function_name} not defined.")
+            # Runs on the executor assigned to the function in the registry, inline by default
+            function_response = execute_function(registry, function_name, function_args)
+            function_responses.append(_function_response_message(function_response))
+            messages.extend(function_responses)
+            context = messages
 
             if function_responses:
                 
                 
-                follow_up_response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json={"model": model, "messages": messages})
-                follow_up_message = follow_up_response.json()["choices"][0]["message"]
+                with get_instrumentation().span("follow_up"):
+                    follow_up_message = _completion_message({"model": model, "messages": messages})
                 messages.append({"role": "assistant", "content": follow_up_message['content']})
                 context = messages
                 return follow_up_message['content'], context
@@ -211,38 +233,182 @@ def chat_context_function_bank(question, context, model="gpt-3.5-turbo-0613", fu
 
     except Exception as e:
         print(f"Error during conversation: {e}")
+        get_instrumentation().record_error("conversation", e)
         return None, messages
 
 
 
-@retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3))
-def single_question(question, model="gpt-3.5-turbo-0613"):
+def _question_messages(question, context):
     """
-    Sends a question to the GPT model
+    Returns the messages of a request: the context followed by the question.
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": "Bearer " + api_key,
-    }
-    
     messages = [{"role": "user", "content": question}]
-    
+    if context:
+        messages = context + messages
+    return messages
+
+
+def _function_bank_request(messages, model, functions, function_call):
+    """
+    Returns the body of a functions API request, leaving functions out when none are registered.
+    """
     json_data = {"model": model, "messages": messages}
-    # print(df)
-   
+    if functions:
+        json_data.update({"functions": functions})
+        if function_call is not None:
+            json_data.update({"function_call": function_call})
+    return json_data
+
+
+def _tool_bank_request(messages, model, tools, tool_choice):
+    """
+    Returns the body of a tools API request, leaving tools out when none are registered.
+    """
+    json_data = {"model": model, "messages": messages}
+    if tools:
+        json_data.update({"tools": tools})
+        if tool_choice is not None:
+            json_data.update({"tool_choice": tool_choice})
+    return json_data
+
+
+def chat_context_tool_bank(question, context, model="gpt-3.5-turbo-1106", tool_choice='auto', registry=None, max_depth=5, tool_timeout=None, function_selector=None, top_k=10):
+    """
+    Sends a question to the GPT model using the tools API. Every tool call of a response runs concurrently,
+    all results go back in one follow-up request, and the loop continues while the model keeps calling tools.
+
+    Parameters:
+    - question (str): The user's question or input to be sent to the GPT model.
+    - context (list, optional): A list of previous messages for context. Defaults to None.
+    - model (str, optional): The GPT model to be used, it must support parallel tool calls. Defaults to "gpt-3.5-turbo-1106".
+    - tool_choice (str or dict, optional): Which tool the model may call. Defaults to 'auto'.
+    - registry (FunctionRegistry, optional): The registry holding the function schemas and callables. Defaults to the shared registry backed by the function store.
+    - function_selector (FunctionSelector, optional): Ranks the registered schemas against the question so only the top_k most relevant are sent. Defaults to None, sending all of them.
+    - top_k (int, optional): The number of schemas the function_selector keeps. Defaults to 10.
+    - max_depth (int, optional): The maximum number of tool rounds before the model must answer. Defaults to 5.
+    - tool_timeout (float, optional): Seconds each tool may run before an error is returned to the model. Defaults to None, no limit.
+
+    Returns:
+    - tuple: The final response from the GPT model (or None in case of an error) and the updated context.
+    """
+    messages = _question_messages(question, context)
+
+    registry, functions = _select_schemas(registry, question, function_selector, top_k)
+    tools = [{"type": "function", "function": schema} for schema in functions]
     try:
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=json_data)
-        assistant_message = response.json()["choices"][0]["message"]
-        # print('ASSISTANT', assistant_message['content'])
-        
-        
+        for depth in range(max_depth + 1):
+            # Once max_depth tool rounds are done the model has to answer with what it has
+            json_data = _tool_bank_request(messages, model, tools, tool_choice if depth < max_depth else 'none')
+            assistant_message = _completion_message(json_data)
+            tool_calls = assistant_message.get('tool_calls')
+            # Some OpenAI-compatible servers ignore tool_choice='none', the calls of the last round are not run
+            if not tool_calls or depth == max_depth:
+                messages.append({"role": "assistant", "content": assistant_message.get('content')})
+                return assistant_message.get('content'), messages
+
+            messages.append({"role": "assistant", "content": assistant_message.get('content'), "tool_calls": tool_calls})
+            messages.extend(run_tool_calls(tool_calls, registry, timeout=tool_timeout))
+
+    except Exception as e:
+        print(f"Error during conversation: {e}")
+        get_instrumentation().record_error("conversation", e)
+        return None, messages
+
+
+def chat_context_function_bank_stream(question, context, model="gpt-3.5-turbo-0613", function_call='auto', registry=None, function_selector=None, top_k=10):
+    """
+    Streaming version of chat_context_function_bank. Yields the reply as it is generated.
+    The function call arguments are assembled incrementally and the registered function runs as soon as they are complete,
+    then the follow-up completion is streamed as well.
+
+    Parameters:
+    - question (str): The user's question or input to be sent to the GPT model.
+    - context (list, optional): A list of previous messages for context. Defaults to None.
+    - model (str, optional): The GPT model to be used. Defaults to "gpt-3.5-turbo-0613".
+    - function_call (str, optional): The type of function call to execute. Defaults to 'auto'.
+    - registry (FunctionRegistry, optional): The registry holding the function schemas and callables. Defaults to the shared registry backed by the function store.
+    - function_selector (FunctionSelector, optional): Ranks the registered schemas against the question so only the top_k most relevant are sent. Defaults to None, sending all of them.
+    - top_k (int, optional): The number of schemas the function_selector keeps. Defaults to 10.
+
+    Yields:
+    - dict: {"type": "content", "delta": str} for every piece of the reply,
+      {"type": "function_call", "name": str, "arguments": dict, "response": object} once a function ran,
+      and finally {"type": "done", "content": str or None, "context": list}, content being None in case of an error.
+    """
+    messages = _question_messages(question, context)
+
+    registry, functions = _select_schemas(registry, question, function_selector, top_k)
+    json_data = _function_bank_request(messages, model, functions, function_call)
+    try:
+        accumulator = StreamAccumulator()
+        dispatched = False
+        for chunk in stream_chat_completion(json_data):
+            delta = accumulator.feed(chunk)
+            if delta:
+                yield {"type": "content", "delta": delta}
+            if not dispatched and accumulator.function_call_ready():
+                dispatched = True
+                function_args = json.loads(accumulator.arguments)
+                function_response = execute_function(registry, accumulator.function_name, function_args)
+
+        if accumulator.content:
+            messages.append({"role": "assistant", "content": accumulator.content})
+        if not dispatched:
+            yield {"type": "done", "content": accumulator.content, "context": messages}
+            return
+
+        messages.append({"role": "assistant", "content": accumulator.content, "function_call": accumulator.function_call()})
+        yield {"type": "function_call", "name": accumulator.function_name, "arguments": function_args, "response": function_response}
+        messages.append(_function_response_message(function_response))
+
+        follow_up = StreamAccumulator()
+        for chunk in stream_chat_completion({"model": model, "messages": messages}):
+            delta = follow_up.feed(chunk)
+            if delta:
+                yield {"type": "content", "delta": delta}
+        messages.append({"role": "assistant", "content": follow_up.content})
+        yield {"type": "done", "content": follow_up.content, "context": messages}
+
+    except Exception as e:
+        print(f"Error during conversation: {e}")
+        get_instrumentation().record_error("conversation", e)
+        yield {"type": "done", "content": None, "context": messages}
+
+
+def _question_request(question, model="gpt-3.5-turbo-0613"):
+    """
+    Returns the request body of a single question.
+    """
+    messages = [{"role": "user", "content": question}]
+    return {"model": model, "messages": messages}
+
 
-        return assistant_message['content']
+def _reply_content(response_json):
+    """
+    Returns the content of the assistant message in a completion response.
+    """
+    return response_json["choices"][0]["message"]['content']
+
+
+@_retrying
+def _single_question(question, model="gpt-3.5-turbo-0613"):
+    """
+    Sends a question to the GPT model and returns the content of the reply. Raises on any error.
+    """
+    return _reply_content(chat_completion(_question_request(question, model)))
+
+
+def single_question(question, model="gpt-3.5-turbo-0613"):
+    """
+    Sends a question to the GPT model
+    """
+    try:
+        return _single_question(question, model=model)
 
     except Exception as e:
         print(f"Error during conversation: {e}")
-        return messages
+        get_instrumentation().record_error("conversation", e)
+        return [{"role": "user", "content": question}]
     
 
 def extract_json_from_string(input_string):
@@ -285,11 +451,9 @@ def create_json_autoagent(message):
     Raises:
         None
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    client = openai.OpenAI(api_key=api_key)
-    completion = client.chat.completions.create(
-        model="gpt-4-1106-preview",
-        messages=[
+    json_data = {
+        "model": "gpt-4-1106-preview",
+        "messages": [
             {"role": "system", "content": """You are an expert at generating JSON schemas for functions. You have a deep understanding of function parameters and their types, and you're skilled in translating these into detailed JSON schemas. Whether given a function definition, like a Python function or a detailed description of its behavior and parameters, you can extract a JSON schema that accurately represents the function.
 
             Your task is to help users create valid JSON schemas that reflect the structure and requirements of the functions they describe. These schemas should detail the function's name, description, and parameters, including parameter types and whether they are required.
@@ -320,8 +484,9 @@ def create_json_autoagent(message):
             Remember to adhere to the JSON schema standards and best practices, ensuring that the schemas are not only valid but also practical and useful for the users' needs."""},
             {"role": "user", "content": message}
         ]
-    )
-    responses = completion.choices[0].message.content
+    }
+    completion = openai_chat_completion(json_data)
+    responses = completion["choices"][0]["message"]["content"]
     cleaned_json = extract_json_from_string(responses)
     # print(cleaned_json)
     return cleaned_json
@@ -374,7 +539,36 @@ def create_function_json_manual():
     print(json.dumps(function, indent=4))
 
 
-@retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3))
+def _pseudofunction_request(testing_prompt, function, model="gpt-4-1106-preview"):
+    """
+    Returns the request body forcing the model to call the given pseudofunction.
+    """
+    messages = [{"role": "user", "content": testing_prompt}]
+    json_data = {"model": model, "messages": messages}
+    json_data.update({"functions": [function]})
+    json_data.update({"function_call": {'name': function['name']}})
+    return json_data
+
+
+def _pseudofunction_arguments(response_json):
+    """
+    Returns the parsed arguments of the pseudofunction call in a completion response, or None if the model did not call it.
+    """
+    assistant_message = response_json["choices"][0]["message"]
+    if 'function_call' in assistant_message:
+        return json.loads(assistant_message['function_call']['arguments'])
+    return None
+
+
+@_retrying
+def _single_turn_pseudofunction(testing_prompt, function, model="gpt-4-1106-preview"):
+    """
+    Forces the model to call the given pseudofunction and returns the parsed arguments, or None if it did not call it.
+    Raises on any error.
+    """
+    return _pseudofunction_arguments(chat_completion(_pseudofunction_request(testing_prompt, function, model)))
+
+
 def single_turn_pseudofunction(testing_prompt:str, function:str, model="gpt-4-1106-preview" ):
     """
     Executes a single turn pseudofunction using the OpenAI Chat API.
@@ -387,41 +581,12 @@ def single_turn_pseudofunction(testing_prompt:str, function:str, model="gpt-4-11
     Returns:
         dict or None: The arguments of the function call if successful {arg: value,...}, None otherwise.
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": "Bearer " + api_key,
-    }
-    
-    function_call = function['name']
-
-    messages = [{"role": "user", "content": testing_prompt}]
-    
-
-    json_data = {"model": model, "messages": messages}
-    # print(df)
-    functions = [function]
-       
-    json_data.update({"functions": functions})
-    json_data.update({"function_call": {'name': function_call}})
-    # print('FUNCTIONS:', functions)
     try:
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=json_data)
-        assistant_message = response.json()["choices"][0]["message"]
-        # print('ASSISTANT', assistant_message['content'])
-      
-        if 'function_call' in assistant_message:
-            tool_call = assistant_message['function_call']
-            function_name = tool_call['name']
-            function_args = json.loads(tool_call['arguments'])
-            
-            # print(function_args)
-            return function_args
-        else:
-            return None
+        return _single_turn_pseudofunction(testing_prompt, function, model=model)
 
     except Exception as e:
         print(f"Error during conversation: {e}")
+        get_instrumentation().record_error("conversation", e)
         return None
     
 #testing func
@@ -451,7 +616,7 @@ def single_turn_pseudofunction(testing_prompt:str, function:str, model="gpt-4-11
 #     }
 # } 
 
-print(create_json_autoagent('create a function that would return the sum of two numbers'))
+# print(create_json_autoagent('create a function that would return the sum of two numbers'))
 
 # print(single_turn_pseudofunction('add two numbers that would sum to 10', func))
 ##testing func end
@@ -46,7 +46,6 @@ setup(
         'Topic :: Software Development :: Libraries',
         'License :: OSI Approved :: MIT License',  # Again, choose the license appropriate for your project
         'Programming Language :: Python :: 3',  # Specify which pyhton versions that you want to support
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3.9',
@@ -54,7 +53,7 @@ setup(
         'Programming Language :: Python :: 3.11',
         'Programming Language :: Python :: 3.12',
     ],
-    python_requires='>=3.6',  # Minimum version requirement of the package
+    python_requires='>=3.7',  # Minimum version requirement of the package
     keywords='openai, api, wrapper, function_calling, vectors, pseudo_func',  # Short description of your package
     # You can also include entry_points to define command-line scripts, etc.
 )
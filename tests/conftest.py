@@ -0,0 +1,107 @@
+import os
+import sys
+import socket
+import contextlib
+
+import pytest
+from tenacity import wait_none
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import openaiunlimitedfun as wrapper
+from openaiunlimitedfun import async_utils, balancer, client, utils
+from mock_server import MockOpenAIServer
+
+
+class FakeClock:
+    """
+    Stands in for the time module of the code under test, its clocks only move when a test advances now.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    """
+    Returns a function replacing the time module of a module by a FakeClock, and returning the clock.
+    """
+    def install(module):
+        clock = FakeClock()
+        monkeypatch.setattr(module, "time", clock)
+        return clock
+    return install
+
+
+@contextlib.contextmanager
+def restored_client():
+    """
+    Restores the shared client configuration, endpoint pool and rate limiter when the block ends.
+    """
+    saved_config = dict(client._config)
+    saved_pool = (balancer._endpoint_pool, balancer._endpoint_pool_loaded)
+    saved_rate_limiter = wrapper.get_rate_limiter()
+    try:
+        yield
+    finally:
+        wrapper.set_rate_limiter(saved_rate_limiter)
+        balancer._endpoint_pool, balancer._endpoint_pool_loaded = saved_pool
+        client._config.update(saved_config)
+        client.close_client()
+
+
+@pytest.fixture
+def start_mock_server():
+    """
+    Returns a function starting a mock OpenAI server with the given options, e.g. requests_per_minute, and pointing
+    the shared client at it with the given API key. The client is restored after the test.
+    """
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(restored_client())
+
+        def start(api_key="sk-mock", **options):
+            server = stack.enter_context(MockOpenAIServer(**options))
+            wrapper.configure_client(base_url=server.base_url, api_key=api_key)
+            return server
+
+        yield start
+
+
+@pytest.fixture
+def mock_server(start_mock_server):
+    """
+    Starts the mock OpenAI server and points the shared client at it for one test.
+    """
+    return start_mock_server()
+
+
+@pytest.fixture
+def no_retry_wait(monkeypatch):
+    """
+    Makes the request helpers retry without waiting.
+    """
+    for function in (utils._completion_message, utils._single_question, utils._single_turn_pseudofunction,
+                     async_utils._async_completion_message, async_utils._async_single_question, async_utils._async_single_turn_pseudofunction):
+        monkeypatch.setattr(function.retry, "wait", wait_none())
+
+
+@pytest.fixture
+def closed_port():
+    """
+    Points the shared client at a local port nothing listens on.
+    """
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+    with restored_client():
+        wrapper.configure_client(base_url=f"http://127.0.0.1:{port}/v1", api_key="sk-closed")
+        yield port
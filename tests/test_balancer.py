@@ -0,0 +1,111 @@
+import pytest
+
+import openaiunlimitedfun as wrapper
+from openaiunlimitedfun import balancer, client
+from openaiunlimitedfun.balancer import CLOSED, HALF_OPEN, OPEN, Endpoint, EndpointPool
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(balancer)
+
+
+@pytest.fixture
+def rate_limited_server(start_mock_server):
+    """
+    Starts a mock server allowing one request per minute and API key, with the shared client pointed at it.
+    """
+    server = start_mock_server(api_key="sk-a", requests_per_minute=1)
+    # Without client-side rate limiting, requests reach the server and the pool sees its 429 responses
+    wrapper.set_rate_limiter(None)
+    return server
+
+
+def fail(pool, endpoint, status_code=500):
+    pool.release(pool.acquire(exclude=[other for other in pool.endpoints if other is not endpoint]), status_code)
+
+
+def test_circuit_opens_after_failure_threshold(clock):
+    pool = EndpointPool(["sk-a", "sk-b"], failure_threshold=3, recovery_time=30)
+    first, second = pool.endpoints
+    for _ in range(2):
+        fail(pool, first)
+    assert first.state == CLOSED
+    fail(pool, first)
+    assert first.state == OPEN
+    assert [pool.acquire() for _ in range(3)] == [second] * 3
+
+
+def test_success_resets_the_failure_count(clock):
+    pool = EndpointPool(["sk-a"], failure_threshold=2)
+    endpoint = pool.endpoints[0]
+    fail(pool, endpoint)
+    pool.release(pool.acquire(), 200)
+    fail(pool, endpoint)
+    assert endpoint.state == CLOSED
+    assert endpoint.consecutive_failures == 1
+
+
+def test_circuit_recovers_after_recovery_time(clock):
+    pool = EndpointPool(["sk-a", "sk-b"], failure_threshold=1, recovery_time=30)
+    first, second = pool.endpoints
+    fail(pool, first)
+    clock.now += 29
+    assert pool.acquire() is second
+    clock.now += 1
+    probe = pool.acquire(exclude=[second])
+    assert probe is first and first.state == HALF_OPEN
+    # Only one probe at a time while half open
+    assert pool.acquire() is second
+    pool.release(probe, 200)
+    assert first.state == CLOSED
+    assert not first.probing
+
+
+def test_failed_probe_opens_the_circuit_again(clock):
+    pool = EndpointPool(["sk-a"], failure_threshold=1, recovery_time=30)
+    endpoint = pool.endpoints[0]
+    fail(pool, endpoint)
+    clock.now += 30
+    assert pool.release(pool.acquire(), error=ConnectionError("refused"))
+    assert endpoint.state == OPEN
+    assert endpoint.opened_at == clock.now
+
+
+def test_rate_limited_endpoint_is_skipped_until_retry_after(clock):
+    pool = EndpointPool(["sk-a", "sk-b"])
+    first, second = pool.endpoints
+    assert pool.acquire() is first
+    assert pool.release(first, 429, {"retry-after": "2.5"})
+    assert first.blocked_until == clock.now + 2.5
+    assert first.state == CLOSED and first.consecutive_failures == 0
+    assert pool.acquire() is second
+    clock.now += 2.5
+    assert pool.acquire() is first
+
+
+def test_every_endpoint_out_of_rotation_picks_the_first_to_recover(clock):
+    pool = EndpointPool([Endpoint(api_key="sk-a"), Endpoint(api_key="sk-b")], failure_threshold=1, recovery_time=30)
+    first, second = pool.endpoints
+    fail(pool, first)
+    clock.now += 10
+    pool.release(pool.acquire(), 429, {"retry-after": "5"})
+    assert pool.acquire() is second
+
+
+def test_post_chat_completion_fails_over_on_429(rate_limited_server):
+    body = {"model": "mock", "messages": [{"role": "user", "content": "Hello"}]}
+    wrapper.set_endpoint_pool(None)
+    assert client.post_chat_completion(body).status_code == 200
+
+    pool = EndpointPool(["sk-a", "sk-b"])
+    wrapper.set_endpoint_pool(pool)
+    response = client.post_chat_completion(body)
+    assert response.status_code == 200
+    assert rate_limited_server.state.requests_per_key == {"Bearer sk-a": 2, "Bearer sk-b": 1}
+    first, second = pool.endpoints
+    assert first.blocked_until > second.blocked_until
+    assert pool.stats()[first.name]["in_flight"] == 0
+
+    # With every key rate limited, the last 429 response is returned
+    assert client.post_chat_completion(body).status_code == 429
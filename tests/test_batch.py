@@ -0,0 +1,33 @@
+import openaiunlimitedfun as wrapper
+
+CITY = {"name": "extract", "parameters": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]}}
+COUNT = {"name": "count", "parameters": {"type": "object", "properties": {"count": {"type": "integer"}}, "required": ["count"]}}
+
+
+def test_batch_results_follow_the_input_order(mock_server):
+    prompts = [f"Question {index}" for index in range(20)]
+    results = wrapper.batch_single_question(prompts, concurrency=4)
+    assert [result.item for result in results] == prompts
+    assert [result.result for result in results] == [f"This is a mock reply to: {prompt}" for prompt in prompts]
+    assert mock_server.state.requests == 20
+
+
+def test_streamed_pseudofunction_batch_yields_every_result(mock_server):
+    pairs = [(f"Text {index}", CITY if index % 2 else COUNT) for index in range(6)]
+    results = wrapper.batch_single_turn_pseudofunction(iter(pairs), concurrency=3, stream=True)
+    assert not isinstance(results, list)
+    assert [(result.index, result.result, result.error) for result in results] == [
+        (index, {"city": "mock"} if index % 2 else {"count": 1}, None) for index in range(6)]
+
+
+def test_failed_prompts_are_reported_without_aborting_the_batch(start_mock_server, no_retry_wait):
+    start_mock_server(requests_per_minute=2)
+    # Without client-side rate limiting the prompts over the server's budget fail with 429 after their retries
+    wrapper.set_rate_limiter(None)
+    results = wrapper.batch_single_question([f"Question {index}" for index in range(4)], concurrency=2)
+    assert [result.index for result in results] == [0, 1, 2, 3]
+    answered = [result for result in results if result.error is None]
+    failed = [result for result in results if result.error is not None]
+    assert [result.result for result in answered] == [f"This is a mock reply to: {result.item}" for result in answered]
+    assert len(failed) == 2
+    assert all(result.result is None and result.error.response.status_code == 429 for result in failed)
@@ -0,0 +1,135 @@
+import json
+import os
+
+import pytest
+
+from openaiunlimitedfun import BatchJob, BatchJobError, batch_job_pseudofunction
+
+EXTRACT_CITY = {
+    "name": "extract_city",
+    "description": "Extracts the city mentioned in the text.",
+    "parameters": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]},
+}
+
+
+def prompts(count):
+    for index in range(count):
+        yield f"Text number {index} mentions a city."
+
+
+def test_prepare_submit_poll_results(mock_server, tmp_path):
+    job = BatchJob(str(tmp_path))
+    assert job.prepare(prompts(5), EXTRACT_CITY, request_ids=[f"doc-{index}" for index in range(5)]) == 5
+    job.submit()
+    assert job.poll() == {"completed": 1}
+    results = {result.request_id: result for result in job.results()}
+    assert sorted(results) == [f"doc-{index}" for index in range(5)]
+    assert all(result.result == {"city": "mock"} and result.error is None for result in results.values())
+    with open(tmp_path / "requests-0000.jsonl") as file:
+        request = json.loads(file.readline())
+    assert request["custom_id"] == "doc-0"
+    assert request["body"]["function_call"] == {"name": "extract_city"}
+
+
+def test_shards_by_max_requests_per_file(mock_server, tmp_path):
+    job = BatchJob(str(tmp_path))
+    job.prepare(prompts(5), EXTRACT_CITY, max_requests_per_file=2)
+    assert [(shard["input"], shard["count"]) for shard in job.state["shards"]] == [
+        ("requests-0000.jsonl", 2), ("requests-0001.jsonl", 2), ("requests-0002.jsonl", 1),
+    ]
+    results = list(job.run(poll_interval=0.01))
+    assert sorted(int(result.request_id) for result in results) == list(range(5))
+    assert len(mock_server.state.batches) == 3
+
+
+def test_prepare_is_skipped_when_resuming(mock_server, tmp_path):
+    BatchJob(str(tmp_path)).prepare(prompts(3), EXTRACT_CITY)
+    assert BatchJob(str(tmp_path)).prepare(prompts(100), EXTRACT_CITY) == 3
+
+
+def test_resume_after_interrupted_submit(mock_server, tmp_path, monkeypatch):
+    job = BatchJob(str(tmp_path))
+    job.prepare(prompts(4), EXTRACT_CITY, max_requests_per_file=2)
+    create_batch = BatchJob._create_batch
+
+    def crash_after_creating(self, file_id, completion_window, file_created_at=None):
+        create_batch(self, file_id, completion_window, file_created_at)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(BatchJob, "_create_batch", crash_after_creating)
+    with pytest.raises(KeyboardInterrupt):
+        job.submit()
+    monkeypatch.undo()
+
+    resumed = BatchJob(str(tmp_path))
+    assert resumed.state["shards"][0].get("batch_id") is None and resumed.state["shards"][0]["submitting"]
+    results = list(resumed.run(poll_interval=0.01))
+    assert sorted(int(result.request_id) for result in results) == [0, 1, 2, 3]
+    assert len(mock_server.state.files) == 2 + 2  # Two request files and two output files, nothing uploaded twice
+    assert len(mock_server.state.batches) == 2
+
+
+def test_create_is_not_retried_blindly(mock_server, tmp_path, monkeypatch):
+    create_batch = mock_server.state.create_batch
+    calls = []
+
+    def lose_first_response(body):
+        batch = create_batch(body)
+        calls.append(batch["id"])
+        if len(calls) == 1:
+            raise ConnectionError("response lost")  # The handler drops the connection
+        return batch
+
+    monkeypatch.setattr(mock_server.state, "create_batch", lose_first_response)
+    job = BatchJob(str(tmp_path))
+    job.prepare(prompts(2), EXTRACT_CITY)
+    job.submit()
+    assert calls == [job.state["shards"][0]["batch_id"]]
+    assert len(mock_server.state.batches) == 1
+
+
+def test_find_batch_pages_until_batches_older_than_the_file(mock_server, tmp_path, monkeypatch):
+    job = BatchJob(str(tmp_path))
+    job.prepare(prompts(2), EXTRACT_CITY)
+    uploaded = job._upload(job.state["shards"][0]["input"])
+    batch = mock_server.state.create_batch({"input_file_id": uploaded["id"]})
+    for _ in range(150):
+        mock_server.state.create_batch({"input_file_id": "file-other"})
+    pages = []
+    request = job._request
+    monkeypatch.setattr(job, "_request", lambda method, path, **kwargs: pages.append(kwargs["params"]) or request(method, path, **kwargs))
+    assert job._find_batch(uploaded["id"], uploaded["created_at"])["id"] == batch["id"]
+    assert len(pages) == 2 and pages[1]["after"]
+    pages.clear()
+    later = job._upload(job.state["shards"][0]["input"])
+    assert job._find_batch(later["id"], later["created_at"]) is None
+    assert len(pages) == 1
+
+
+def test_resume_after_interrupted_results(mock_server, tmp_path):
+    job = BatchJob(str(tmp_path))
+    job.prepare(prompts(4), EXTRACT_CITY, max_requests_per_file=2)
+    results = job.run(poll_interval=0.01)
+    first = [next(results) for _ in range(3)]
+    results.close()
+    assert [shard.get("collected") for shard in job.state["shards"]] == [True, None]
+
+    resumed = list(BatchJob(str(tmp_path)).run(poll_interval=0.01))
+    assert sorted(result.request_id for result in first + resumed) == ["0", "1", "2", "2", "3"]
+
+
+def test_error_file_results(mock_server, tmp_path):
+    results = list(batch_job_pseudofunction(str(tmp_path), prompts(2), EXTRACT_CITY, model="invalid", poll_interval=0.01))
+    assert sorted(result.request_id for result in results) == ["0", "1"]
+    assert all(result.result is None and isinstance(result.error, BatchJobError) for result in results)
+    assert str(results[0].error) == "invalid model"
+    assert os.path.exists(tmp_path / "error-0000.jsonl")
+
+
+def test_failed_batch_results(mock_server, tmp_path):
+    job = BatchJob(str(tmp_path))
+    job.prepare(prompts(2), EXTRACT_CITY)
+    job.state["shards"][0]["file_id"] = "file-missing"
+    results = list(job.run(poll_interval=0.01))
+    assert [result.request_id for result in results] == ["0", "1"]
+    assert all(isinstance(result.error, BatchJobError) and "failed" in str(result.error) for result in results)
@@ -0,0 +1,69 @@
+import pytest
+
+import openaiunlimitedfun as wrapper
+from openaiunlimitedfun import cache
+from openaiunlimitedfun.cache import ResponseCache, make_cache_key
+
+REQUEST = {"model": "mock", "messages": [{"role": "user", "content": "Hello"}], "functions": [{"name": "f", "parameters": {"type": "object", "properties": {}}}]}
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(cache)
+
+
+@pytest.fixture
+def response_cache():
+    saved_cache = wrapper.get_response_cache()
+    response_cache = ResponseCache()
+    wrapper.set_response_cache(response_cache)
+    yield response_cache
+    wrapper.set_response_cache(saved_cache)
+
+
+def test_cache_key_ignores_key_order_and_unrelated_fields():
+    reordered = {"functions": REQUEST["functions"], "messages": [{"content": "Hello", "role": "user"}], "model": "mock"}
+    assert make_cache_key(reordered) == make_cache_key(REQUEST)
+    assert make_cache_key(dict(REQUEST, stream=True, function_call=None)) == make_cache_key(REQUEST)
+    assert make_cache_key(dict(REQUEST, model="other")) != make_cache_key(REQUEST)
+    assert make_cache_key(dict(REQUEST, function_call="auto")) != make_cache_key(REQUEST)
+
+
+def test_least_recently_used_response_is_evicted():
+    response_cache = ResponseCache(max_size=2)
+    response_cache.set("a", 1)
+    response_cache.set("b", 2)
+    assert response_cache.get("a") == 1
+    response_cache.set("c", 3)
+    assert (response_cache.get("a"), response_cache.get("b"), response_cache.get("c")) == (1, None, 3)
+    assert response_cache.stats()["size"] == 2
+
+
+def test_responses_expire_after_the_ttl(clock, tmp_path):
+    response_cache = ResponseCache(ttl=10, path=str(tmp_path / "responses.sqlite3"))
+    response_cache.set("a", 1)
+    clock.now += 9
+    assert response_cache.get("a") == 1
+    clock.now += 1
+    assert response_cache.get("a") is None
+    response_cache.prune()
+    assert ResponseCache(path=response_cache.path).get("a") is None
+
+
+def test_disk_tier_is_shared_and_promoted_into_memory(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    ResponseCache(path=path).set("a", {"answer": 1})
+    other = ResponseCache(path=path)
+    assert other.get("a") == {"answer": 1}
+    assert other.get("a") == {"answer": 1}
+    assert (other.disk_hits, other.memory_hits, other.misses) == (1, 1, 0)
+
+
+def test_repeated_questions_are_answered_from_the_cache(mock_server, response_cache):
+    answers = [wrapper.single_question("Hello") for _ in range(3)]
+    assert answers == ["This is a mock reply to: Hello"] * 3
+    assert mock_server.state.requests == 1
+    assert response_cache.stats()["hits"] == 2
+    # A different model is a different request
+    wrapper.single_question("Hello", model="other")
+    assert mock_server.state.requests == 2
@@ -0,0 +1,126 @@
+import os
+import sys
+import asyncio
+import subprocess
+
+import pytest
+
+import openaiunlimitedfun as wrapper
+from openaiunlimitedfun import client
+from openaiunlimitedfun.balancer import EndpointPool
+from openaiunlimitedfun.cache import ResponseCache
+
+HELLO = {"model": "mock", "messages": [{"role": "user", "content": "Hello"}]}
+
+
+@pytest.fixture
+def endpoint_pool(mock_server):
+    """
+    Spreads the requests to the mock server over two API keys, the mock_server fixture restores the shared pool.
+    """
+    wrapper.set_rate_limiter(None)
+    pool = EndpointPool(["sk-a", "sk-b"])
+    wrapper.set_endpoint_pool(pool)
+    return pool
+
+
+def test_package_import_loads_the_http_clients_on_first_use():
+    statement = ("import sys, openaiunlimitedfun as wrapper; wrapper.single_question; wrapper.configure_client(api_key='sk-mock'); "
+                 "print(sorted(name for name in ('requests', 'openai', 'httpx', 'tiktoken', 'tenacity') if name in sys.modules))")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", statement], cwd=root, capture_output=True, text=True, check=True)
+    # tenacity comes with the request helpers, the HTTP clients only with the first request
+    assert result.stdout.strip() == "['tenacity']"
+
+
+def test_request_functions_share_one_keep_alive_connection(mock_server):
+    assert client._session is None and client._openai_client is None
+    answers = [wrapper.single_question("Hello") for _ in range(3)]
+    session = client.get_session()
+    wrapper.single_turn_pseudofunction("Paris", {"name": "extract", "parameters": {"type": "object", "properties": {}}})
+    assert answers == ["This is a mock reply to: Hello"] * 3
+    assert client.get_session() is session
+    assert mock_server.state.requests == 4
+    assert mock_server.state.connections == 1
+
+
+def test_openai_chat_completion_goes_through_the_endpoint_pool(mock_server, endpoint_pool):
+    completions = [client.openai_chat_completion(HELLO) for _ in range(2)]
+    assert all(completion["choices"][0]["message"]["content"] == "This is a mock reply to: Hello" for completion in completions)
+    assert mock_server.state.requests_per_key == {"Bearer sk-a": 1, "Bearer sk-b": 1}
+    assert [stats["in_flight"] for stats in endpoint_pool.stats().values()] == [0, 0]
+    clients = dict(client._endpoint_openai_clients)
+    assert len(clients) == 2
+    client.openai_chat_completion(HELLO)
+    assert client._endpoint_openai_clients == clients
+
+
+def test_async_requests_go_through_the_endpoint_pool(mock_server, endpoint_pool):
+    async def ask():
+        completions = [await client.async_chat_completion(HELLO) for _ in range(2)]
+        await wrapper.aclose_client()
+        return completions
+
+    assert all(completion["choices"][0]["message"]["content"] == "This is a mock reply to: Hello" for completion in asyncio.run(ask()))
+    assert mock_server.state.requests_per_key == {"Bearer sk-a": 1, "Bearer sk-b": 1}
+    assert [stats["in_flight"] for stats in endpoint_pool.stats().values()] == [0, 0]
+
+
+def test_openai_chat_completion_uses_the_response_cache(mock_server, endpoint_pool):
+    saved_cache = wrapper.get_response_cache()
+    wrapper.set_response_cache(ResponseCache())
+    try:
+        first = client.openai_chat_completion(HELLO)
+        assert client.openai_chat_completion(HELLO) == first
+    finally:
+        wrapper.set_response_cache(saved_cache)
+    assert mock_server.state.requests == 1
+
+
+def test_async_client_of_a_previous_event_loop_is_closed(mock_server):
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(client.async_chat_completion(HELLO))
+        first_session = client._async_session
+        second_session = asyncio.run(client_after_request())
+    finally:
+        loop.close()
+    assert first_session.is_closed
+    assert second_session is not first_session and not second_session.is_closed
+
+
+def test_async_client_of_a_closed_event_loop_is_reported(mock_server):
+    asyncio.run(client.async_chat_completion(HELLO))
+    first_session = client._async_session
+    with pytest.warns(ResourceWarning, match="aclose_client"):
+        asyncio.run(client_after_request())
+    assert client._async_session is not first_session
+
+
+def test_aclose_client_closes_the_async_client(mock_server):
+    async def request_and_close():
+        await client.async_chat_completion(HELLO)
+        session = client._async_session
+        await wrapper.aclose_client()
+        return session
+
+    assert asyncio.run(request_and_close()).is_closed
+    assert client._async_session is None
+
+
+async def client_after_request():
+    await client.async_chat_completion(HELLO)
+    return client._async_session
+
+
+def test_async_helpers_answer_like_the_sync_ones(mock_server):
+    function = {"name": "extract", "parameters": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]}}
+
+    async def ask():
+        answers = (await wrapper.async_single_question("Hello"), await wrapper.async_single_turn_pseudofunction("Paris", function))
+        await wrapper.aclose_client()
+        return answers
+
+    sync_answers = (wrapper.single_question("Hello"), wrapper.single_turn_pseudofunction("Paris", function))
+    assert sync_answers == ("This is a mock reply to: Hello", {"city": "mock"})
+    assert asyncio.run(ask()) == sync_answers
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from openaiunlimitedfun.coalesce import RequestCoalescer, make_request_key
+
+
+def run_followers(coalescer, key, count, request):
+    """
+    Starts count threads calling the coalescer once the leader's request is in flight, and returns their outcomes.
+    """
+    outcomes = []
+
+    def follower():
+        try:
+            outcomes.append(coalescer.call(key, request))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=follower) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while coalescer.stats()["saved"] < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return threads, outcomes
+
+
+def test_request_key_ignores_key_order():
+    assert make_request_key({"model": "m", "temperature": 0}) == make_request_key({"temperature": 0, "model": "m"})
+    assert make_request_key({"model": "m", "temperature": 0}) != make_request_key({"model": "m", "temperature": 1})
+
+
+def test_followers_receive_the_leader_result():
+    coalescer = RequestCoalescer()
+    release = threading.Event()
+    calls = []
+
+    def leader_request():
+        calls.append("leader")
+        release.wait(5)
+        return {"choices": []}
+
+    leader_result = []
+    leader = threading.Thread(target=lambda: leader_result.append(coalescer.call("key", leader_request)))
+    leader.start()
+    while coalescer.stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    threads, outcomes = run_followers(coalescer, "key", 4, lambda: calls.append("follower"))
+    release.set()
+    for thread in threads + [leader]:
+        thread.join(5)
+
+    assert calls == ["leader"]
+    assert outcomes == [{"choices": []}] * 4
+    assert all(outcome is leader_result[0] for outcome in outcomes)
+    assert coalescer.stats() == {"sent": 1, "saved": 4, "saved_ratio": 0.8, "in_flight": 0}
+
+
+def test_followers_receive_the_leader_exception():
+    coalescer = RequestCoalescer()
+    release = threading.Event()
+
+    def leader_request():
+        release.wait(5)
+        raise ConnectionError("endpoint down")
+
+    leader_error = []
+
+    def leader():
+        try:
+            coalescer.call("key", leader_request)
+        except ConnectionError as e:
+            leader_error.append(e)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    while coalescer.stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    threads, outcomes = run_followers(coalescer, "key", 3, lambda: None)
+    release.set()
+    for thread in threads + [leader_thread]:
+        thread.join(5)
+
+    assert len(leader_error) == 1
+    assert outcomes == [leader_error[0]] * 3
+    # Once the failure is shared, the next call sends the request again
+    assert coalescer.call("key", lambda: "retried") == "retried"
+    assert coalescer.stats()["sent"] == 2
+
+
+def test_different_keys_are_not_coalesced():
+    coalescer = RequestCoalescer()
+    assert coalescer.call("a", lambda: 1) == 1
+    assert coalescer.call("a", lambda: 2) == 2
+    assert coalescer.call("b", lambda: 3) == 3
+    assert coalescer.stats()["saved"] == 0
+
+
+def test_async_followers_share_the_result_and_the_exception():
+    coalescer = RequestCoalescer()
+    calls = []
+
+    async def request():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "response"
+
+    async def failing_request():
+        await asyncio.sleep(0.05)
+        raise ValueError("bad response")
+
+    async def main():
+        results = await asyncio.gather(*(coalescer.async_call("ok", request) for _ in range(5)))
+        errors = await asyncio.gather(*(coalescer.async_call("ko", failing_request) for _ in range(3)), return_exceptions=True)
+        return results, errors
+
+    results, errors = asyncio.run(main())
+    assert results == ["response"] * 5
+    assert calls == [1]
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert coalescer.stats()["saved"] == 6
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    coalescer = RequestCoalescer()
+
+    async def request():
+        await asyncio.sleep(5)
+
+    async def main():
+        leader = asyncio.ensure_future(coalescer.async_call("key", request))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(coalescer.async_call("key", request))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        with pytest.raises(RuntimeError):
+            await follower
+
+    asyncio.run(main())
+    assert coalescer.stats()["in_flight"] == 0
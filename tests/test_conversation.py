@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from openaiunlimitedfun import Conversation, tokens
+from openaiunlimitedfun.tokens import count_message_tokens
+
+TOOL_CALL = {"id": "call_1", "type": "function", "function": {"name": "get_weather", "arguments": '{"city": "Paris"}'}}
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    """
+    Counts tokens with the length estimate, so budgets do not depend on the tiktoken encodings being available.
+    """
+    monkeypatch.setattr(tokens, "get_encoding", lambda model: None)
+
+
+def fake_chat(replies):
+    """
+    Returns a chat function answering with the given messages and recording the contexts it was sent.
+    """
+    contexts = []
+
+    def chat(question, context, model=None, **kwargs):
+        contexts.append(context)
+        messages = context + [{"role": "user", "content": question}] + list(replies)
+        return replies[-1]["content"], messages
+    chat.contexts = contexts
+    return chat
+
+
+def roles(messages):
+    return [message["role"] for message in messages]
+
+
+def test_trim_drops_the_oldest_messages_after_the_system_message():
+    conversation = Conversation(max_tokens=120, system_message="You are terse.", keep_last=2)
+    chat = fake_chat([{"role": "assistant", "content": "An answer of a few words."}])
+    for index in range(10):
+        conversation.ask(f"Question number {index} of this long conversation?", chat_function=chat)
+    assert conversation.messages[0] == {"role": "system", "content": "You are terse."}
+    assert conversation.total_tokens == sum(conversation.token_counts)
+    assert all(turn["prompt_tokens"] <= 120 for turn in conversation.turns)
+    assert any(turn["trimmed_messages"] for turn in conversation.turns)
+    assert all(count_message_tokens(message) == tokens for message, tokens in zip(conversation.messages, conversation.token_counts))
+
+
+def test_trimmed_context_never_starts_with_a_tool_result():
+    conversation = Conversation(max_tokens=100, keep_last=2)
+    conversation.extend([
+        {"role": "user", "content": "What is the weather in Paris and in Lyon today?"},
+        {"role": "assistant", "content": None, "tool_calls": [TOOL_CALL]},
+        {"role": "tool", "tool_call_id": "call_1", "content": "Sunny and 21 degrees in Paris, rain expected tomorrow."},
+        {"role": "assistant", "content": "It is sunny and 21 degrees in Paris."},
+    ])
+    chat = fake_chat([{"role": "assistant", "content": "Yes."}])
+    conversation.ask("And is it going to rain there later this week, do you think?", chat_function=chat)
+    sent = chat.contexts[0]
+    assert roles(sent) == ["assistant", "tool", "assistant"]
+    assert sent[0]["tool_calls"] == [TOOL_CALL]
+    assert conversation.total_tokens == sum(conversation.token_counts)
+
+
+def test_tool_results_are_dropped_with_their_call():
+    conversation = Conversation(max_tokens=140, keep_last=2)
+    conversation.extend([
+        {"role": "user", "content": "What is the weather in Paris?"},
+        {"role": "assistant", "content": None, "tool_calls": [TOOL_CALL]},
+        {"role": "tool", "tool_call_id": "call_1", "content": "Sunny and 21 degrees in Paris, rain expected tomorrow."},
+        {"role": "assistant", "content": "It is sunny and 21 degrees in Paris."},
+        {"role": "user", "content": "Thanks."},
+        {"role": "assistant", "content": "You are welcome."},
+    ])
+    assert conversation.fit(extra_tokens=40) == 3
+    assert roles(conversation.messages) == ["assistant", "user", "assistant"]
+
+
+def test_turns_record_the_reply_tokens():
+    conversation = Conversation()
+    reply = {"role": "assistant", "content": "Paris is the capital of France."}
+    conversation.ask("What is the capital of France?", chat_function=fake_chat([reply]))
+    turn = conversation.turns[0]
+    assert turn["reply_tokens"] == count_message_tokens(reply, conversation.model)
+    assert turn["total_tokens"] == conversation.total_tokens == turn["question_tokens"] + turn["reply_tokens"]
+
+
+def test_summarize_replaces_the_dropped_messages_with_a_summary():
+    summaries = []
+
+    def summarizer(messages, previous_summary):
+        summaries.append((roles(messages), previous_summary))
+        return f"summary {len(summaries)}"
+
+    conversation = Conversation(max_tokens=100, policy='summarize', summarizer=summarizer, keep_last=2)
+    chat = fake_chat([{"role": "assistant", "content": "An answer of a few words."}])
+    for index in range(8):
+        conversation.ask(f"Question number {index} of this conversation?", chat_function=chat)
+    assert len(summaries) >= 2
+    assert summaries[1][1] == "summary 1"
+    assert conversation.messages[0] == {"role": "system", "content": f"Summary of the earlier conversation: summary {len(summaries)}"}
+    assert roles(conversation.messages).count("system") == 1
+
+
+def test_async_summarizer_needs_async_ask():
+    async def summarizer(messages, previous_summary):
+        return "async summary"
+
+    conversation = Conversation(max_tokens=60, policy='summarize', summarizer=summarizer, keep_last=0)
+    conversation.extend([{"role": "user", "content": "A long enough message to go over the small budget of this test."}] * 3)
+    with pytest.raises(TypeError):
+        conversation.fit()
+
+    async def chat(question, context, model=None, **kwargs):
+        return "ok", context + [{"role": "user", "content": question}, {"role": "assistant", "content": "ok"}]
+
+    assert asyncio.run(conversation.async_ask("Hi", chat_function=chat)) == "ok"
+    assert conversation.summary == "async summary"
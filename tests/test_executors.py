@@ -0,0 +1,91 @@
+import os
+import time
+import threading
+
+import pytest
+
+from openaiunlimitedfun import FunctionRegistry, ProcessExecutor, ThreadExecutor, dispatch
+from openaiunlimitedfun.executors import execute_function
+
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def allocate(megabytes):
+    return len(bytearray(megabytes * 1024 * 1024))
+
+
+def process_id():
+    return os.getpid()
+
+
+@pytest.fixture
+def process_registry():
+    executor = ProcessExecutor(max_workers=2, timeout=0.5)
+    registry = FunctionRegistry(store=None)
+    for function in (sleep_for, allocate, process_id):
+        registry.register(function, executor=executor)
+    yield registry, executor
+    executor.shutdown()
+
+
+def test_timed_out_call_only_stops_its_own_worker(process_registry):
+    registry, executor = process_registry
+    results = []
+    other = threading.Thread(target=lambda: results.append(execute_function(registry, "sleep_for", {"seconds": 0.3}, timeout=2)))
+    other.start()
+    start = time.monotonic()
+    with pytest.raises(TimeoutError, match="sleep_for timed out after 0.5 seconds"):
+        execute_function(registry, "sleep_for", {"seconds": 10})
+    assert time.monotonic() - start < 3
+    other.join()
+    assert results == [0.3]
+    # A fresh process takes over the next calls
+    assert execute_function(registry, "sleep_for", {"seconds": 0}) == 0
+    assert execute_function(registry, "process_id", {}) != os.getpid()
+
+
+def test_stopped_call_fails_for_every_waiter(process_registry):
+    registry, executor = process_registry
+    future = executor.submit(sleep_for, {"seconds": 10})
+    time.sleep(0.2)
+    executor.cancel(future)
+    with pytest.raises(TimeoutError, match="stopped after its timeout"):
+        future.result(timeout=5)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="needs /proc to size the memory limit")
+def test_call_over_the_memory_limit_fails_with_memory_error():
+    with open("/proc/self/statm") as statm:
+        address_space = int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    executor = ProcessExecutor(max_workers=1, memory_limit=address_space + 512 * 1024 ** 2)
+    registry = FunctionRegistry(store=None)
+    registry.register(allocate, executor=executor)
+    try:
+        with pytest.raises(MemoryError):
+            execute_function(registry, "allocate", {"megabytes": 4096})
+        assert execute_function(registry, "allocate", {"megabytes": 1}) == 1024 * 1024
+    finally:
+        executor.shutdown()
+
+
+def test_unpicklable_function_fails_without_breaking_the_worker(process_registry):
+    registry, executor = process_registry
+    with pytest.raises(Exception):
+        executor.submit(lambda: 1, {}).result(timeout=5)
+    assert execute_function(registry, "sleep_for", {"seconds": 0}) == 0
+
+
+def test_thread_executor_with_a_timeout_keeps_off_the_shared_pool():
+    executor = ThreadExecutor(timeout=0.1)
+    registry = FunctionRegistry(store=None)
+    registry.register(sleep_for, executor=executor)
+    try:
+        with pytest.raises(TimeoutError):
+            execute_function(registry, "sleep_for", {"seconds": 0.5})
+        assert executor._get_pool() is not dispatch.get_tool_executor()
+        assert ThreadExecutor()._get_pool() is dispatch.get_tool_executor()
+    finally:
+        executor.shutdown()
@@ -0,0 +1,33 @@
+import pytest
+
+import openaiunlimitedfun as wrapper
+from openaiunlimitedfun.balancer import Endpoint, EndpointPool
+
+
+@pytest.fixture
+def metrics():
+    metrics = wrapper.MetricsInstrumentation()
+    wrapper.set_instrumentation(metrics)
+    yield metrics
+    wrapper.set_instrumentation(None)
+
+
+def test_retries_are_counted(closed_port, no_retry_wait, metrics):
+    wrapper.single_question("Hello")
+    counters = metrics.snapshot()["counters"]
+    assert counters[("retries_total", (("function", "_single_question"),))] == 2
+    assert 'openaiunlimitedfun_retries_total{function="_single_question"} 2' in metrics.export_prometheus()
+
+
+def test_failovers_and_network_time_are_labelled_by_endpoint(mock_server, closed_port, metrics):
+    down = Endpoint(base_url=f"http://127.0.0.1:{closed_port}/v1", api_key="sk-down", name="down")
+    up = Endpoint(base_url=mock_server.base_url, api_key="sk-up", name="up")
+    wrapper.set_endpoint_pool(EndpointPool([down, up], strategy="weighted"))
+    assert wrapper.single_question("Hello") == "This is a mock reply to: Hello"
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"][("failovers_total", (("endpoint", "down"),))] == 1
+    assert snapshot["counters"][("errors_total", (("phase", "network"), ("endpoint", "down")))] == 1
+    assert snapshot["histograms"][("phase_seconds", (("phase", "network"), ("endpoint", "up")))]["count"] == 1
+    assert snapshot["histograms"][("phase_seconds", (("phase", "decode"),))]["count"] == 1
+    assert 'openaiunlimitedfun_failovers_total{endpoint="down"} 1' in metrics.export_prometheus()
@@ -0,0 +1,109 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from openaiunlimitedfun import FunctionMemo, FunctionRegistry, memo, memoize
+from openaiunlimitedfun.executors import execute_function
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(memo)
+
+
+def finished(result=None, error=None):
+    future = Future()
+    if error is None:
+        future.set_result(result)
+    else:
+        future.set_exception(error)
+    return future
+
+
+def counting_start(calls, result):
+    def start():
+        calls.append(1)
+        return finished(result)
+    return start
+
+
+def test_same_arguments_in_any_order_are_remembered():
+    function_memo = FunctionMemo()
+    calls = []
+    assert function_memo.submit({"city": "Paris", "unit": "C"}, counting_start(calls, 21)).result() == 21
+    assert function_memo.submit({"unit": "C", "city": "Paris"}, counting_start(calls, 0)).result() == 21
+    assert function_memo.submit({"city": "Lyon", "unit": "C"}, counting_start(calls, 18)).result() == 18
+    assert len(calls) == 2
+    assert function_memo.stats() == {"hits": 1, "shared": 0, "misses": 2, "hit_ratio": 1 / 3, "size": 2}
+
+
+def test_results_expire_after_ttl(clock):
+    function_memo = FunctionMemo(ttl=10)
+    calls = []
+    function_memo.submit({"x": 1}, counting_start(calls, "first")).result()
+    clock.now += 9.9
+    assert function_memo.submit({"x": 1}, counting_start(calls, "second")).result() == "first"
+    clock.now += 0.1
+    assert function_memo.submit({"x": 1}, counting_start(calls, "third")).result() == "third"
+    assert len(calls) == 2
+    assert function_memo.stats()["size"] == 1
+
+
+def test_failed_calls_are_not_remembered():
+    function_memo = FunctionMemo()
+    failing = function_memo.submit({"x": 1}, lambda: finished(error=ValueError("boom")))
+    with pytest.raises(ValueError):
+        failing.result()
+
+    def raising_start():
+        raise RuntimeError("could not start")
+
+    with pytest.raises(RuntimeError):
+        function_memo.submit({"x": 1}, raising_start).result()
+    assert function_memo.stats()["size"] == 0
+    assert function_memo.submit({"x": 1}, lambda: finished("ok")).result() == "ok"
+    assert function_memo.stats()["misses"] == 3
+
+
+def test_least_recently_used_result_is_evicted():
+    function_memo = FunctionMemo(max_size=2)
+    calls = []
+    for x in (1, 2, 1, 3):
+        function_memo.submit({"x": x}, counting_start(calls, x)).result()
+    function_memo.submit({"x": 1}, counting_start(calls, 1)).result()
+    function_memo.submit({"x": 2}, counting_start(calls, 2)).result()
+    assert len(calls) == 4
+
+
+def test_identical_running_calls_share_one_result():
+    function_memo = FunctionMemo()
+    running = Future()
+    first = function_memo.submit({"x": 1}, lambda: running)
+    second = function_memo.submit({"x": 1}, lambda: finished("not called"))
+    assert first is second and not first.done()
+    assert not second.cancel()
+    running.set_result("shared")
+    assert second.result() == "shared"
+    assert function_memo.stats()["shared"] == 1
+
+
+def test_registry_calls_of_a_memoized_function_run_once():
+    calls = []
+    lock = threading.Lock()
+
+    @memoize(ttl=60)
+    def get_weather(city):
+        with lock:
+            calls.append(city)
+        return {"city": city, "temperature": 21}
+
+    registry = FunctionRegistry(store=None)
+    registry.register(get_weather, {"name": "get_weather", "parameters": {"type": "object", "properties": {"city": {"type": "string"}}}})
+    for _ in range(3):
+        assert execute_function(registry, "get_weather", {"city": "Paris"}) == {"city": "Paris", "temperature": 21}
+    assert calls == ["Paris"]
+    assert registry.memo_stats()["get_weather"]["hits"] == 2
+    # Direct calls are not memoized
+    get_weather("Paris")
+    assert calls == ["Paris", "Paris"]
@@ -0,0 +1,40 @@
+import time
+import asyncio
+
+import pytest
+from tenacity import stop_after_attempt
+
+import openaiunlimitedfun as wrapper
+from openaiunlimitedfun import RateLimiter, async_utils, utils
+
+
+@pytest.fixture
+def drained_server(start_mock_server, monkeypatch):
+    """
+    Starts a mock server allowing 120 requests per minute whose budget is used up, with the shared client and a
+    fresh rate limiter pointed at it. The request helpers get a single attempt, so only the limiter can send again.
+    """
+    server = start_mock_server(requests_per_minute=120)
+    wrapper.set_rate_limiter(RateLimiter())
+    for function in (utils._single_question, async_utils._async_single_question):
+        monkeypatch.setattr(function.retry, "stop", stop_after_attempt(1))
+    for _ in range(120):
+        server.state.admit("Bearer sk-mock", 0)
+    return server
+
+
+def test_rate_limited_request_waits_and_is_sent_again(drained_server):
+    start = time.monotonic()
+    assert wrapper.single_question("Hello", model="mock") == "This is a mock reply to: Hello"
+    assert drained_server.state.rate_limited == 1
+    assert time.monotonic() - start >= 0.4
+
+
+def test_async_rate_limited_request_waits_and_is_sent_again(drained_server):
+    async def main():
+        answer = await wrapper.async_single_question("Hello", model="mock")
+        await wrapper.aclose_client()
+        return answer
+
+    assert asyncio.run(main()) == "This is a mock reply to: Hello"
+    assert drained_server.state.rate_limited == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+import openaiunlimitedfun as wrapper
+from openaiunlimitedfun import Instrumentation, client
+
+
+class RetryRecorder(Instrumentation):
+    def __init__(self):
+        self.retries = []
+
+    def record_retry(self, function_name):
+        self.retries.append(function_name)
+
+
+@pytest.fixture
+def retries(no_retry_wait):
+    """
+    Records the retries of the request helpers, which retry without waiting.
+    """
+    recorder = RetryRecorder()
+    wrapper.set_instrumentation(recorder)
+    yield recorder.retries
+    wrapper.set_instrumentation(None)
+
+
+def test_connection_errors_are_retried_then_reported(closed_port, retries, capsys):
+    assert wrapper.single_question("Hello") == [{"role": "user", "content": "Hello"}]
+    assert retries == ["_single_question"] * 2
+    assert "Error during conversation" in capsys.readouterr().out
+
+
+def test_conversation_requests_are_retried(closed_port, retries):
+    response, context = wrapper.chat_context_tool_bank("Hello", [], registry=wrapper.FunctionRegistry(store=None))
+    assert response is None and context == [{"role": "user", "content": "Hello"}]
+    assert retries == ["_completion_message"] * 2
+
+
+def test_async_requests_are_retried(closed_port, retries):
+    async def main():
+        answer = await wrapper.async_single_question("Hello")
+        arguments = await wrapper.async_single_turn_pseudofunction("Hello", {"name": "f", "parameters": {"type": "object", "properties": {}}})
+        await wrapper.aclose_client()
+        return answer, arguments
+
+    assert asyncio.run(main()) == ([{"role": "user", "content": "Hello"}], None)
+    assert retries == ["_async_single_question"] * 2 + ["_async_single_turn_pseudofunction"] * 2
+
+
+def test_client_errors_are_not_retried(mock_server, retries):
+    assert wrapper.single_question("Hello", model="invalid") == [{"role": "user", "content": "Hello"}]
+    assert retries == []
+    assert mock_server.state.requests == 1
+
+
+def test_is_retryable_error():
+    import httpx
+    import requests
+    request = httpx.Request("POST", "http://localhost/v1/chat/completions")
+    assert client.is_retryable_error(requests.ConnectionError())
+    assert client.is_retryable_error(httpx.ConnectError("refused"))
+    for status_code, retryable in ((429, True), (500, True), (503, True), (400, False), (404, False)):
+        error = httpx.HTTPStatusError("error", request=request, response=httpx.Response(status_code, request=request))
+        assert client.is_retryable_error(error) is retryable
+    assert not client.is_retryable_error(KeyError("choices"))
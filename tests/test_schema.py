@@ -0,0 +1,164 @@
+import enum
+import asyncio
+import dataclasses
+from typing import List, Literal, Optional
+
+import pydantic
+import pytest
+
+from openaiunlimitedfun import FunctionRegistry, build_function_schema
+from openaiunlimitedfun.executors import ProcessExecutor, async_execute_function, execute_function
+from openaiunlimitedfun.schema import _inline_definitions, parse_docstring, register_module_functions, type_to_schema
+
+
+class Unit(enum.Enum):
+    CELSIUS = "celsius"
+    FAHRENHEIT = "fahrenheit"
+
+
+@dataclasses.dataclass
+class Location:
+    """
+    A place on the map.
+
+    Args:
+        city: The city name.
+    """
+    city: str
+    country: str = "FR"
+
+
+class Point(pydantic.BaseModel):
+    x: int
+    y: int
+
+
+class Path(pydantic.BaseModel):
+    start: Point
+    end: Point
+
+
+class Tree(pydantic.BaseModel):
+    value: int
+    children: List["Tree"] = []
+
+
+def forecast(location: Location, unit: Unit = Unit.CELSIUS, points: Optional[List[Point]] = None, days: int = 1):
+    """
+    Returns the forecast of a location.
+
+    Args:
+        location (Location): Where to forecast.
+        unit (Unit): The temperature unit.
+        points: Map points
+            to highlight.
+        days (int): The number of days.
+    """
+    return location, unit, points, days
+
+TOOLS = '''
+import os
+
+with open(os.path.join(os.path.dirname(__file__), "imports.log"), "a") as log:
+    log.write("imported\\n")
+
+
+def add(a: int, b: int) -> int:
+    """
+    Adds two numbers.
+
+    Args:
+        a (int): The first number.
+        b (int): The second number.
+    """
+    return a + b
+'''
+
+
+def test_functions_loaded_from_a_path_run_in_a_process_and_are_imported_once(tmp_path):
+    path = tmp_path / "tools.py"
+    path.write_text(TOOLS)
+    registry = FunctionRegistry(store=None)
+    schemas = register_module_functions(str(path), registry=registry)
+    assert [schema["name"] for schema in schemas] == ["add"]
+    register_module_functions(str(path), registry=registry)
+    assert (tmp_path / "imports.log").read_text() == "imported\n"
+    executor = ProcessExecutor(max_workers=1)
+    try:
+        registry.set_executor("add", executor)
+        assert execute_function(registry, "add", {"a": 2, "b": 3}) == 5
+    finally:
+        executor.shutdown()
+
+
+def test_parse_docstring_understands_google_dash_and_sphinx_styles():
+    assert parse_docstring(forecast.__doc__) == ("Returns the forecast of a location.", {
+        "location": "Where to forecast.",
+        "unit": "The temperature unit.",
+        "points": "Map points to highlight.",
+        "days": "The number of days.",
+    })
+    dash = """
+    Sends a message.
+
+    Parameters:
+    - recipient (str): Who receives it.
+    - body (str): The text.
+    """
+    assert parse_docstring(dash) == ("Sends a message.", {"recipient": "Who receives it.", "body": "The text."})
+    sphinx = """
+    Sends a message.
+
+    :param str recipient: Who receives it.
+    :param body: The text.
+    :returns: Nothing.
+    """
+    assert parse_docstring(sphinx) == ("Sends a message.", {"recipient": "Who receives it.", "body": "The text."})
+    assert parse_docstring(None) == ("", {})
+
+
+def test_type_to_schema_converts_annotations():
+    assert type_to_schema(Optional[int]) == {"type": "integer"}
+    assert type_to_schema(Literal["a", "b"]) == {"enum": ["a", "b"], "type": "string"}
+    assert type_to_schema(List[str]) == {"type": "array", "items": {"type": "string"}}
+    assert type_to_schema(dict[str, float]) == {"type": "object", "additionalProperties": {"type": "number"}}
+    assert type_to_schema(Unit) == {"enum": ["celsius", "fahrenheit"], "type": "string"}
+    assert type_to_schema(Location) == {
+        "type": "object",
+        "properties": {"city": {"type": "string", "description": "The city name."}, "country": {"type": "string"}},
+        "required": ["city"],
+        "description": "A place on the map.",
+    }
+
+
+def test_inline_definitions_resolves_nested_models_and_keeps_recursive_ones():
+    path = _inline_definitions(Path.model_json_schema())
+    assert "$defs" not in path
+    assert path["properties"]["start"]["properties"]["x"]["type"] == "integer"
+    tree = _inline_definitions(Tree.model_json_schema())
+    assert tree["properties"]["children"]["items"] == {"$ref": "#/$defs/Tree"}
+    assert tree["$defs"]["Tree"]["properties"]["value"]["type"] == "integer"
+
+
+def test_build_function_schema_returns_copies_of_the_cached_schema():
+    schema = build_function_schema(forecast)
+    assert schema["parameters"]["required"] == ["location"]
+    assert schema["parameters"]["properties"]["unit"]["default"] == "celsius"
+    schema["parameters"]["properties"].clear()
+    schema["description"] = "changed"
+    again = build_function_schema(forecast)
+    assert again["description"] == "Returns the forecast of a location."
+    assert set(again["parameters"]["properties"]) == {"location", "unit", "points", "days"}
+    assert build_function_schema(forecast, name="other")["name"] == "other"
+
+
+def test_arguments_are_converted_to_the_advertised_types():
+    registry = FunctionRegistry(store=None)
+    registry.register(forecast, build_function_schema(forecast))
+    arguments = {"location": {"city": "Paris"}, "unit": "fahrenheit", "points": [{"x": 1, "y": 2}], "days": 3}
+    expected = (Location("Paris"), Unit.FAHRENHEIT, [Point(x=1, y=2)], 3)
+    assert execute_function(registry, "forecast", arguments) == expected
+    assert asyncio.run(async_execute_function(registry, "forecast", arguments)) == expected
+    assert execute_function(registry, "forecast", {"location": {"city": "Lyon"}, "points": None}) == (Location("Lyon"), Unit.CELSIUS, None, 1)
+    with pytest.raises(ValueError):
+        execute_function(registry, "forecast", {"location": {"city": "Paris"}, "unit": "kelvin"})
@@ -0,0 +1,83 @@
+from openaiunlimitedfun import BM25Selector, EmbeddingSelector
+from openaiunlimitedfun.selection import tokenize
+
+VOCABULARY = ["weather", "city", "email", "send", "stock", "price", "add", "numbers"]
+
+
+def schema(name, description):
+    return {"name": name, "description": description, "parameters": {"type": "object", "properties": {}}}
+
+
+SCHEMAS = [
+    schema("get_weather", "Returns the weather of a city"),
+    schema("send_email", "Sends an email"),
+    schema("stock_price", "Returns the stock price of a company"),
+    schema("add_numbers", "Adds two numbers"),
+]
+
+
+class FakeEmbeddings:
+    """
+    Embeds texts as word counts over a small vocabulary, recording every call.
+    """
+
+    def __init__(self, selector=None):
+        self.calls = []
+        self.selector = selector
+
+    def __call__(self, texts):
+        if self.selector is not None:
+            assert not self.selector._lock.locked()
+        self.calls.append(list(texts))
+        return [[tokenize(text).count(word) for word in VOCABULARY] for text in texts]
+
+
+def embedding_selector():
+    embed = FakeEmbeddings()
+    selector = EmbeddingSelector(embed)
+    embed.selector = selector
+    return selector, embed
+
+
+def names(schemas):
+    return [entry["name"] for entry in schemas]
+
+
+def test_tokenize_splits_identifiers():
+    assert tokenize("getWeather for send_email HTTPServer 42") == ["get", "weather", "for", "send", "email", "http", "server", "42"]
+
+
+def test_bm25_ranks_matching_schemas_first_and_fills_up_in_order():
+    selector = BM25Selector()
+    assert names(selector.select("Weather in Paris", SCHEMAS, 2)) == ["get_weather", "send_email"]
+    assert names(selector.select("stock price of ACME", SCHEMAS, 1)) == ["stock_price"]
+    assert names(selector.select("Hello", SCHEMAS, 3)) == ["get_weather", "send_email", "stock_price"]
+
+
+def test_bm25_index_follows_added_changed_and_removed_schemas():
+    selector = BM25Selector()
+    selector.select("weather", SCHEMAS, 1)
+    changed = [schema("get_weather", "Returns the forecast"), SCHEMAS[1], schema("city_weather", "Returns the weather of a city")]
+    assert names(selector.select("weather", changed, 1)) == ["city_weather"]
+    assert set(selector._documents) == {"get_weather", "send_email", "city_weather"}
+    assert "stock" not in selector._postings
+
+
+def test_embedding_selector_ranks_by_similarity():
+    selector, embed = embedding_selector()
+    assert names(selector.select("Send an email", SCHEMAS, 1)) == ["send_email"]
+    assert names(selector.select("add numbers", SCHEMAS, 2))[0] == "add_numbers"
+    assert selector.select("anything", [], 3) == []
+
+
+def test_embedding_selector_embeds_each_schema_once_and_drops_removed_ones():
+    selector, embed = embedding_selector()
+    selector.select("weather", SCHEMAS, 2)
+    assert len(embed.calls) == 1 and len(embed.calls[0]) == 5
+    reloaded = [dict(entry) for entry in SCHEMAS]
+    selector.select("weather", reloaded, 2)
+    assert embed.calls[1] == ["weather"]
+    changed = [schema("get_weather", "Returns the weather forecast of a city")] + reloaded[1:3]
+    selector.select("weather", changed, 2)
+    assert embed.calls[2] == ["weather", "get_weather Returns the weather forecast of a city"]
+    assert set(selector._embeddings) == {"get_weather", "send_email", "stock_price"}
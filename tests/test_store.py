@@ -0,0 +1,143 @@
+import os
+import time
+import pickle
+import asyncio
+import threading
+
+import pytest
+
+import openaiunlimitedfun as wrapper
+from openaiunlimitedfun import FunctionRegistry, FunctionStore, async_utils, registry as registry_module
+from openaiunlimitedfun.store import load_module_from_path
+
+TOOLS = '''
+def add(a, b):
+    return a + b
+
+
+def subtract(a, b):
+    return a - b
+'''
+
+
+def schema(name):
+    return {"name": name, "description": f"The {name} function", "parameters": {"type": "object", "properties": {}}}
+
+
+@pytest.fixture
+def default_registry(tmp_path, monkeypatch):
+    """
+    Replaces the shared registry by one backed by a store in a temporary directory.
+    """
+    registry = FunctionRegistry(str(tmp_path / "functions.sqlite3"))
+    monkeypatch.setattr(registry_module, "_default_registry", registry)
+    yield registry
+    registry.store.close()
+
+
+def test_every_write_bumps_the_revision(tmp_path):
+    store = FunctionStore(str(tmp_path / "functions.sqlite3"))
+    assert store.revision() == 0
+    assert store.save([schema("a")]) == 1
+    assert store.save(removed=["a"]) == 2
+    revision, schemas, references = store.load()
+    assert (revision, schemas, references) == (2, [], {})
+    store.close()
+
+
+def test_adding_schemas_does_not_reload_the_store(default_registry, monkeypatch):
+    loads = []
+    load = default_registry.store.load
+    monkeypatch.setattr(default_registry.store, "load", lambda: loads.append(1) or load())
+    for index in range(20):
+        schemas = wrapper.manage_function_list(schema(f"f{index}"))
+    assert [entry["name"] for entry in schemas] == [f"f{index}" for index in range(20)]
+    assert len(loads) == 1
+    # A write from elsewhere is picked up on the next call
+    FunctionStore(default_registry.store.path).save([schema("other")])
+    assert wrapper.manage_function_list()[-1]["name"] == "other"
+    assert len(loads) == 2
+
+
+def test_chat_turns_answer_from_the_registry_in_memory(default_registry, mock_server, monkeypatch):
+    calls = []
+    wrapper.manage_function_list(schema("answer"))
+    default_registry.register_function(lambda: calls.append(1) or 42, name="answer")
+    loads = []
+    load = default_registry.store.load
+    monkeypatch.setattr(default_registry.store, "load", lambda: loads.append(1) or load())
+    for _ in range(3):
+        reply, context = wrapper.chat_context_function_bank("What is the answer?", None)
+        assert context[-2]["content"].endswith(": 42")
+        assert reply.startswith("This is a mock reply to: ")
+    assert len(calls) == 3
+    assert mock_server.state.requests == 6
+    assert loads == []
+
+
+def test_saving_available_functions_replaces_the_stored_ones(default_registry, tmp_path):
+    path = tmp_path / "tools.py"
+    path.write_text(TOOLS)
+    wrapper.manage_function_list(schema("add"))
+    wrapper.manage_available_functions(retrieve=False, function_location=str(path))
+    assert sorted(wrapper.manage_available_functions()) == ["add", "subtract"]
+    path.write_text(TOOLS.split("\n\n\n")[0])
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+    wrapper.manage_available_functions(retrieve=False, function_location=str(path))
+    assert list(wrapper.manage_available_functions()) == ["add"]
+    other = FunctionRegistry(default_registry.store.path)
+    other.refresh()
+    assert list(other.functions()) == ["add"]
+    assert [entry["name"] for entry in wrapper.manage_function_list()] == ["add"]
+
+
+def test_concurrent_writers_keep_each_others_changes(tmp_path):
+    path = str(tmp_path / "functions.sqlite3")
+    registries = [FunctionRegistry(path) for _ in range(4)]
+
+    def write(registry, worker):
+        for index in range(25):
+            registry.save([schema(f"w{worker}_{index}")])
+
+    threads = [threading.Thread(target=write, args=(registry, worker)) for worker, registry in enumerate(registries)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert FunctionStore(path).revision() == 100
+    for registry in registries:
+        registry.refresh()
+        assert len(registry) == 100
+
+
+def test_modules_loaded_from_a_path_are_picklable_and_loaded_once(tmp_path):
+    path = tmp_path / "tools.py"
+    path.write_text(TOOLS)
+    module = load_module_from_path(str(path))
+    assert load_module_from_path(str(path)) is module
+    assert pickle.loads(pickle.dumps(module.add)) is module.add
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+    assert load_module_from_path(str(path)) is not module
+
+
+def test_async_schema_selection_does_not_block_the_event_loop(tmp_path, monkeypatch):
+    registry = FunctionRegistry(str(tmp_path / "functions.sqlite3"))
+    registry.save([schema("add")])
+    revision = registry.store.revision
+    monkeypatch.setattr(registry.store, "revision", lambda: time.sleep(0.2) or revision())
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        ticker = asyncio.ensure_future(tick())
+        selected = await async_utils._async_select_schemas(registry, "Add two numbers", None, 10)
+        ticker.cancel()
+        return selected
+
+    assert asyncio.run(main()) == (registry, [schema("add")])
+    assert len(ticks) > 5
+    registry.store.close()
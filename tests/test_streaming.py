@@ -0,0 +1,60 @@
+import json
+
+import openaiunlimitedfun as wrapper
+from openaiunlimitedfun import FunctionRegistry, client
+from openaiunlimitedfun.streaming import StreamAccumulator
+
+WEATHER = {"name": "weather", "parameters": {"type": "object", "properties": {"city": {"type": "string"}, "days": {"type": "integer"}}, "required": ["city", "days"]}}
+
+
+def argument_chunk(arguments, finish_reason=None):
+    return {"choices": [{"index": 0, "delta": {"function_call": {"arguments": arguments}}, "finish_reason": finish_reason}]}
+
+
+def test_arguments_are_complete_at_their_closing_brace():
+    accumulator = StreamAccumulator()
+    accumulator.feed({"choices": [{"index": 0, "delta": {"role": "assistant", "function_call": {"name": "note", "arguments": ""}}}]})
+    # Braces and escaped quotes inside strings do not end the arguments
+    for piece in ['{"text": "a}', ' \\"b\\" {', '", "n": [1', ', 2]']:
+        accumulator.feed(argument_chunk(piece))
+        assert not accumulator.function_call_ready()
+    accumulator.feed(argument_chunk('}'))
+    assert accumulator.function_call_ready()
+    assert json.loads(accumulator.arguments) == {"text": 'a} "b" {', "n": [1, 2]}
+
+
+def test_streamed_function_call_is_ready_before_the_stream_ends(mock_server):
+    accumulator = StreamAccumulator()
+    chunks = list(client.stream_chat_completion({"model": "mock", "messages": [{"role": "user", "content": "Weather?"}], "functions": [WEATHER]}))
+    ready_at = None
+    for index, chunk in enumerate(chunks):
+        accumulator.feed(chunk)
+        if ready_at is None and accumulator.function_call_ready():
+            ready_at = index
+    # The arguments arrive 8 characters at a time, the last piece is shorter and the finish chunk comes after it
+    assert len(accumulator.arguments) % 8
+    assert chunks[ready_at]["choices"][0]["delta"]["function_call"]["arguments"] == accumulator.arguments[-(len(accumulator.arguments) % 8):]
+    assert ready_at == len(chunks) - 2
+    assert chunks[-1]["choices"][0]["finish_reason"] == "function_call"
+    assert accumulator.function_call() == {"name": "weather", "arguments": '{"city": "mock", "days": 1}'}
+
+
+def test_function_runs_before_the_function_call_stream_ends(mock_server, monkeypatch):
+    received = []
+    stream = client.stream_chat_completion
+
+    def recording_stream(json_data):
+        for chunk in stream(json_data):
+            received.append(chunk)
+            yield chunk
+
+    monkeypatch.setattr(wrapper.utils, "stream_chat_completion", recording_stream)
+    registry = FunctionRegistry(store=None)
+    registry.register(lambda city, days: received[-1]["choices"][0].get("finish_reason"), WEATHER)
+    events = list(wrapper.chat_context_function_bank_stream("Weather in Paris?", None, registry=registry))
+    assert events[0] == {"type": "function_call", "name": "weather", "arguments": {"city": "mock", "days": 1}, "response": None}
+    deltas = [event["delta"] for event in events if event["type"] == "content"]
+    assert "".join(deltas).startswith("This is a mock reply to: ")
+    assert events[-1]["type"] == "done" and events[-1]["content"] == "".join(deltas)
+    assert events[-1]["context"][-1] == {"role": "assistant", "content": events[-1]["content"]}
+    assert mock_server.state.requests == 2
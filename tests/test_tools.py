@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import openaiunlimitedfun as wrapper
+from openaiunlimitedfun import FunctionRegistry
+
+
+def schema(name):
+    return {"name": name, "parameters": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]}}
+
+
+def failing_lookup(city):
+    raise ValueError(f"no data for {city}")
+
+
+def slow_lookup(city):
+    time.sleep(2)
+    return city
+
+
+def tool_messages(context):
+    return [message for message in context if message["role"] == "tool"]
+
+
+def test_failing_and_unknown_tools_answer_with_errors(mock_server):
+    registry = FunctionRegistry(store=None)
+    registry.register(failing_lookup, schema("lookup"))
+    # The model is offered a schema whose callable is not registered
+    registry.register_schema(schema("forecast"))
+    reply, context = wrapper.chat_context_tool_bank("Weather in Paris?", None, registry=registry)
+    assert tool_messages(context) == [
+        {"role": "tool", "tool_call_id": "call_0", "content": "Error: no data for mock"},
+        {"role": "tool", "tool_call_id": "call_1", "content": "Error: Function forecast not defined."},
+    ]
+    # Both results go back in one follow-up request, which is answered
+    assert reply == "This is a mock reply to: Error: Function forecast not defined."
+    assert mock_server.state.requests == 2
+
+
+def test_slow_tool_times_out_while_the_other_answers(mock_server):
+    registry = FunctionRegistry(store=None)
+    registry.register(slow_lookup, schema("slow"))
+    registry.register(lambda city: f"Sunny in {city}", schema("weather"))
+    started = time.monotonic()
+    reply, context = wrapper.chat_context_tool_bank("Weather in Paris?", None, registry=registry, tool_timeout=0.2)
+    assert time.monotonic() - started < 1.5
+    assert [message["content"] for message in tool_messages(context)] == ["Error: slow timed out after 0.2 seconds", "Sunny in mock"]
+    assert reply == "This is a mock reply to: Sunny in mock"
+
+
+def test_async_tools_answer_with_errors(mock_server):
+    registry = FunctionRegistry(store=None)
+    registry.register(failing_lookup, schema("lookup"))
+    registry.register_schema(schema("forecast"))
+
+    async def ask():
+        answer = await wrapper.async_chat_context_tool_bank("Weather in Paris?", None, registry=registry)
+        await wrapper.aclose_client()
+        return answer
+
+    reply, context = asyncio.run(ask())
+    assert [message["content"] for message in tool_messages(context)] == ["Error: no data for mock", "Error: Function forecast not defined."]
+    assert reply == "This is a mock reply to: Error: Function forecast not defined."